@@ -0,0 +1,15 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Micro benchmarks of functions in hot paths of rpmkit.
+
+Run them and save results to compare with ones of other revisions later::
+
+  $ python -m rpmkit.benchmarks.runner -o bench-old.json
+  $ (... change the code ...)
+  $ python -m rpmkit.benchmarks.runner -o bench-new.json -c bench-old.json
+
+see also: :mod:`rpmkit.benchmarks.suite` for benchmarks and
+:mod:`rpmkit.benchmarks.data` for synthetic data used in them.
+"""
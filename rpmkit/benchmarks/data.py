@@ -0,0 +1,149 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Generate synthetic packages and errata for benchmarks.
+
+Data are generated from the seed deterministically, so that results of
+benchmarks of different revisions can be compared. Numbers of packages and
+CVEs of each errata follow a long-tailed distribution like real ones; Most
+errata update a few packages and have a few CVEs but some, e.g. kernel's,
+update dozens of packages and fix dozens of CVEs.
+"""
+import random
+
+
+ARCHES = ("x86_64", "noarch", "i686")
+CORE_NAMES = ("kernel", "glibc", "bash", "openssl", "zlib")
+SEVERITIES = ("Critical", "Important", "Moderate", "Low")
+
+KEYWORDS = ("crash", "panic", "hang", "SEGV", "segmentation fault",
+            "data corruption")
+WORDS = ("fix", "update", "package", "issue", "security", "memory",
+         "handling", "could", "allow", "attacker", "remote", "local",
+         "user", "service", "denial", "flaw", "found", "when", "the", "a")
+
+
+def _fanout(rng, maxn, alpha=1.5):
+    """
+    :return: Random number in [1, maxn] follows the Pareto distribution
+    """
+    return min(int(rng.paretovariate(alpha)), maxn)
+
+
+def package_names(n):
+    """
+    :param n: Number of names
+    :return: A list of package names
+
+    >>> package_names(7)
+    ['kernel', 'glibc', 'bash', 'openssl', 'zlib', 'pkg-00005', 'pkg-00006']
+    """
+    return list(CORE_NAMES[:n]) + ["pkg-%05d" % i for i
+                                   in range(len(CORE_NAMES), n)]
+
+
+def packages(n, seed=0):
+    """
+    Generate installed packages.
+
+    :param n: Number of packages
+    :param seed: Seed of random numbers
+    :return: A list of dicts represent packages
+
+    >>> ps = packages(10)
+    >>> len(ps), sorted(ps[0].keys())[:5]
+    (10, ['arch', 'buildhost', 'epoch', 'name', 'origin'])
+    >>> ps == packages(10)
+    True
+    """
+    rng = random.Random(seed)
+    res = []
+    for name in package_names(n):
+        res.append(dict(name=name, epoch=rng.choice((0, 0, 0, 1)),
+                        version="%d.%d.%d" % (rng.randint(0, 9),
+                                              rng.randint(0, 20),
+                                              rng.randint(0, 99)),
+                        release="%d.el7" % rng.randint(1, 30),
+                        arch=rng.choice(ARCHES),
+                        summary="Summary of " + name,
+                        vendor="Red Hat, Inc.",
+                        buildhost="x86-%03d.build.redhat.com" %
+                                  rng.randint(0, 999),
+                        origin="redhat"))
+    return res
+
+
+def updates(pkgs, ratio=0.3, seed=0):
+    """
+    Generate update packages of some of given packages.
+
+    :param pkgs: A list of installed packages
+    :param ratio: Ratio of packages to have updates
+    :return: A list of dicts represent update packages
+    """
+    rng = random.Random(seed)
+    return [dict(p, release="%d.el7" % (int(p["release"].split('.')[0]) +
+                                        rng.randint(1, 5)))
+            for p in pkgs if rng.random() < ratio]
+
+
+def _text(rng, nwords, keywords=KEYWORDS, kwratio=0.05):
+    return ' '.join(rng.choice(keywords) if rng.random() < kwratio else
+                    rng.choice(WORDS) for _i in range(nwords))
+
+
+def errata(m, pkgs, seed=0, max_packages=50, max_cves=40):
+    """
+    Generate errata update given packages.
+
+    :param m: Number of errata
+    :param pkgs: A list of (update) packages errata update
+    :param seed: Seed of random numbers
+    :param max_packages: Max number of packages of an errata
+    :param max_cves: Max number of CVEs of an errata
+    :return: A list of dicts represent errata
+
+    >>> es = errata(5, packages(10))
+    >>> len(es), es[0]["advisory"][:2]
+    (5, 'RH')
+    >>> es == errata(5, packages(10))
+    True
+    """
+    rng = random.Random(seed)
+    res = []
+    for idx in range(m):
+        echar = rng.choice("SSBBBE")
+        year = rng.randint(2010, 2014)
+        adv = "RH%sA-%d:%04d" % (echar, year, idx % 100000)
+        date = "%d-%02d-%02d" % (year, rng.randint(1, 12), rng.randint(1, 28))
+
+        eps = rng.sample(pkgs, min(_fanout(rng, max_packages), len(pkgs)))
+        eps = [dict((k, p[k]) for k in ("name", "epoch", "version",
+                                        "release", "arch")) for p in eps]
+        if echar == 'S':
+            cves = [dict(id="CVE-%d-%04d" % (year, rng.randint(0, 9999)),
+                         url="https://access.redhat.com/security/cve/",
+                         score="%.1f" % (rng.randint(10, 100) / 10.0),
+                         metrics="AV:N/AC:L/Au:N/C:P/I:P/A:P")
+                    for _i in range(_fanout(rng, max_cves))]
+            for cve in cves:
+                cve["cve"] = cve["id"]
+                cve["url"] += cve["id"]
+        else:
+            cves = []
+
+        res.append(dict(advisory=adv, type=echar,
+                        severity=(rng.choice(SEVERITIES) if echar == 'S'
+                                  else "N/A"),
+                        synopsis="  %s update  " % eps[0]["name"],
+                        description=_text(rng, rng.randint(20, 400)),
+                        issue_date=date, update_date=date,
+                        url="https://rhn.redhat.com/errata/%s.html" %
+                            adv.replace(':', '-'),
+                        packages=eps,
+                        package_names=sorted(set(p["name"] for p in eps)),
+                        bzs=[], cves=cves))
+    return res
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,203 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Run benchmarks and save or compare results in JSON format.
+"""
+from __future__ import print_function
+
+import datetime
+import logging
+import optparse
+import os.path
+import platform
+import subprocess
+import sys
+import timeit
+
+import rpmkit.benchmarks.suite
+import rpmkit.utils as U
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.1
+MIN_TIME = 0.2  # Min time in seconds to measure in each repeat.
+
+
+def _autorange(timer, min_time=MIN_TIME):
+    """
+    :return: Number of loops to take `min_time` seconds at least
+    """
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time or number >= 1 << 20:
+            return number
+        number *= 10
+
+
+def _revision():
+    """
+    :return: Git revision of the source tree or None
+    """
+    topdir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    try:
+        out = subprocess.Popen(["git", "rev-parse", "HEAD"], cwd=topdir,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE).communicate()[0]
+        return out.decode("utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(bench, size=1, repeat=DEFAULT_REPEAT, number=None):
+    """
+    :param bench: Benchmark, see :mod:`rpmkit.benchmarks.suite`
+    :param size: Scale of data
+    :param repeat: Number of repeats
+    :param number: Number of loops in each repeat or None to find it out
+    :return: A dict of results, times are in seconds per loop
+    """
+    with bench(size) as func:
+        timer = timeit.Timer(func)
+        if number is None:
+            number = _autorange(timer)
+
+        times = sorted(t / number for t in timer.repeat(repeat, number))
+
+    return dict(size=size, repeat=repeat, number=number, min=times[0],
+                median=times[len(times) // 2],
+                mean=sum(times) / len(times))
+
+
+def run(names=None, size=1, repeat=DEFAULT_REPEAT, number=None,
+        benchmarks=rpmkit.benchmarks.suite.BENCHMARKS):
+    """
+    Run benchmarks.
+
+    :param names: Names or patterns of benchmarks to run or None (all)
+    :return: A dict of {"meta": meta data, "results": {name: result}}, and
+        result of benchmarks skipped has "skipped" (reason)
+    """
+    if names:
+        names = U.select_from_list(names, list(benchmarks.keys()))
+    else:
+        names = list(benchmarks.keys())
+
+    results = dict()
+    for name in names:
+        try:
+            results[name] = run_benchmark(benchmarks[name], size, repeat,
+                                          number)
+            LOG.info("%s: %.6f sec/loop", name, results[name]["min"])
+        except ImportError as exc:
+            results[name] = dict(skipped=str(exc))
+            LOG.warn("%s: skipped: %s", name, exc)
+
+    meta = dict(revision=_revision(), python=platform.python_version(),
+                platform=platform.platform(), host=platform.node(),
+                date=datetime.datetime.now().strftime("%F %T"))
+
+    return dict(meta=meta, results=results)
+
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare min times of benchmarks in two results.
+
+    :param old, new: Results :function:`run` returns
+    :param threshold: Benchmarks slower than this ratio are regressions
+    :return: A list of (name, old min time, new min time, ratio, True if
+        regression), of benchmarks in both results
+
+    >>> old = dict(results=dict(a=dict(min=1.0), b=dict(min=1.0)))
+    >>> new = dict(results=dict(a=dict(min=1.5), b=dict(min=0.5)))
+    >>> compare(old, new)
+    [('a', 1.0, 1.5, 1.5, True), ('b', 1.0, 0.5, 0.5, False)]
+    """
+    res = []
+    for name in sorted(new["results"]):
+        (ores, nres) = (old["results"].get(name, {}), new["results"][name])
+        if "min" not in ores or "min" not in nres:
+            continue
+
+        ratio = nres["min"] / ores["min"] if ores["min"] else 1.0
+        res.append((name, ores["min"], nres["min"], ratio,
+                    ratio > 1.0 + threshold))
+
+    return res
+
+
+def option_parser():
+    defaults = dict(size=1, repeat=DEFAULT_REPEAT, number=None, output=None,
+                    compare=None, threshold=DEFAULT_THRESHOLD, list=False,
+                    verbose=False)
+    p = optparse.OptionParser("%prog [OPTION ...] [BENCHMARK_PATTERN ...]")
+    p.set_defaults(**defaults)
+
+    p.add_option("-s", "--size", type="int",
+                 help="Scale of data, e.g. 2 means %d packages and %d "
+                      "errata [%%default]" %
+                      (2 * rpmkit.benchmarks.suite.NPACKAGES,
+                       2 * rpmkit.benchmarks.suite.NERRATA))
+    p.add_option("-r", "--repeat", type="int",
+                 help="Number of repeats [%default]")
+    p.add_option("-n", "--number", type="int",
+                 help="Number of loops in each repeat. It's found out "
+                      "automatically if not given")
+    p.add_option("-o", "--output", help="Output file to save results")
+    p.add_option("-c", "--compare",
+                 help="Results file to compare with. Exit with status 1 if "
+                      "any regressions are found")
+    p.add_option("-t", "--threshold", type="float",
+                 help="Benchmarks slower than 1 + this ratio are regarded "
+                      "as regressions [%default]")
+    p.add_option("-l", "--list", action="store_true",
+                 help="List benchmarks and exit")
+    p.add_option("-v", "--verbose", action="store_true", help="Verbose mode")
+    return p
+
+
+def main(argv=None):
+    (options, args) = option_parser().parse_args(argv)
+    logging.basicConfig(level=(logging.INFO if options.verbose else
+                               logging.WARN))
+
+    if options.list:
+        for name in rpmkit.benchmarks.suite.BENCHMARKS:
+            print(name)
+        return 0
+
+    results = run(args, options.size, options.repeat, options.number)
+    if options.output:
+        U.json_dump(results, options.output)
+
+    for name in sorted(results["results"]):
+        res = results["results"][name]
+        if "skipped" in res:
+            print("%-36s skipped: %s" % (name, res["skipped"]))
+        else:
+            print("%-36s %12.6f %12.6f  sec/loop (min, median)" %
+                  (name, res["min"], res["median"]))
+
+    if options.compare:
+        regressions = 0
+        for name, otime, ntime, ratio, regression in \
+                compare(U.json_load(options.compare), results,
+                        options.threshold):
+            print("%-36s %12.6f -> %12.6f  x%.2f%s" %
+                  (name, otime, ntime, ratio,
+                   "  REGRESSION" if regression else ''))
+            regressions += regression
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim:sw=4:ts=4:et:
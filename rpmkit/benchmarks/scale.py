@@ -0,0 +1,593 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""End-to-end scale test harness runs offline on a Linux box.
+
+It generates the followings in the working dir and runs rk-updateinfo for
+them in single host and multihosts modes, and records time and peak RSS of
+each step and timings of phases of the analysis (see
+:mod:`rpmkit.updateinfo.timings`) into scale.json:
+
+  <workdir>/repo/repodata/...     Synthetic yum repo metadata (primary,
+                                  filelists, other and updateinfo)
+  <workdir>/rpms/                 Dummy RPMs of installed packages
+  <workdir>/hosts/<host>/         RPM DB roots of synthetic hosts
+  <workdir>/out/{single,multi}/   Results of rk-updateinfo
+
+Hosts are made from some profiles (sets of installed packages) and some of
+them have extra packages installed, like real fleets. rpm and rpmbuild are
+needed to make RPM DBs of hosts but packages in the repo are not real ones
+as rk-updateinfo does not download them.
+
+  $ python -m rpmkit.benchmarks.scale -w /tmp/scale --hosts 1000 \\
+      --packages 5000 --errata 3000
+"""
+from __future__ import print_function
+
+import datetime
+import distutils.spawn
+import gzip
+import hashlib
+import logging
+import optparse
+import os.path
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from xml.sax.saxutils import escape, quoteattr
+
+import rpmkit.benchmarks.data as D
+import rpmkit.updateinfo.timings as RUT
+import rpmkit.utils as U
+
+
+LOG = logging.getLogger(__name__)
+
+REPO_ID = "rk-scale"
+REPORT_FILE = "scale.json"
+
+_PKG_KEYS = ("name", "epoch", "version", "release", "arch")
+
+_ETYPES = dict(S="security", B="bugfix", E="enhancement")
+
+
+def nevra(pkg):
+    return tuple(pkg[k] for k in _PKG_KEYS)
+
+
+def rpm_filename(pkg):
+    """
+    >>> rpm_filename(dict(name="a", epoch=0, version="1.0", release="1.el7",
+    ...                   arch="noarch"))
+    'a-1.0-1.el7.noarch.rpm'
+    """
+    return "%(name)s-%(version)s-%(release)s.%(arch)s.rpm" % pkg
+
+
+def _pkgid(pkg):
+    return hashlib.sha256(rpm_filename(pkg).encode("utf-8")).hexdigest()
+
+
+def _version_elem(pkg):
+    return '<version epoch="%(epoch)s" ver="%(version)s" ' \
+           'rel="%(release)s"/>' % pkg
+
+
+def primary_xml_g(pkgs):
+    """
+    :param pkgs: A list of dicts represent packages in the repo
+    :return: A generator yields lines of primary.xml
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield '<metadata xmlns="http://linux.duke.edu/metadata/common" ' \
+          'xmlns:rpm="http://linux.duke.edu/metadata/rpm" ' \
+          'packages="%d">' % len(pkgs)
+    for pkg in pkgs:
+        fname = rpm_filename(pkg)
+        yield '<package type="rpm">'
+        yield '  <name>%s</name>' % escape(pkg["name"])
+        yield '  <arch>%s</arch>' % pkg["arch"]
+        yield '  ' + _version_elem(pkg)
+        yield '  <checksum type="sha256" pkgid="YES">%s</checksum>' % \
+            _pkgid(pkg)
+        yield '  <summary>%s</summary>' % escape(pkg["summary"])
+        yield '  <description>%s</description>' % escape(pkg["summary"])
+        yield '  <packager>%s</packager>' % escape(pkg["vendor"])
+        yield '  <url></url>'
+        yield '  <time file="1414566215" build="1414566215"/>'
+        yield '  <size package="1024" installed="0" archive="124"/>'
+        yield '  <location href="Packages/%s"/>' % fname
+        yield '  <format>'
+        yield '    <rpm:license>GPLv3+</rpm:license>'
+        yield '    <rpm:vendor>%s</rpm:vendor>' % escape(pkg["vendor"])
+        yield '    <rpm:group>Unspecified</rpm:group>'
+        yield '    <rpm:buildhost>%s</rpm:buildhost>' % pkg["buildhost"]
+        yield '    <rpm:sourcerpm>%(name)s-%(version)s-%(release)s.src.rpm' \
+              '</rpm:sourcerpm>' % pkg
+        yield '    <rpm:header-range start="0" end="1024"/>'
+        yield '    <rpm:provides>'
+        yield '      <rpm:entry name="%(name)s" flags="EQ" ' \
+              'epoch="%(epoch)s" ver="%(version)s" rel="%(release)s"/>' % pkg
+        yield '    </rpm:provides>'
+        yield '  </format>'
+        yield '</package>'
+    yield '</metadata>'
+
+
+def filelists_xml_g(pkgs, tag="filelists", ns="filelists"):
+    """
+    :param pkgs: A list of dicts represent packages in the repo
+    :return: A generator yields lines of filelists.xml (or other.xml)
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield '<%s xmlns="http://linux.duke.edu/metadata/%s" packages="%d">' % \
+        (tag, ns, len(pkgs))
+    for pkg in pkgs:
+        yield '<package pkgid="%s" name="%s" arch="%s">' % \
+            (_pkgid(pkg), escape(pkg["name"]), pkg["arch"])
+        yield '  ' + _version_elem(pkg)
+        yield '</package>'
+    yield '</%s>' % tag
+
+
+def updateinfo_xml_g(errata):
+    """
+    :param errata: A list of dicts represent errata, see
+        :function:`rpmkit.benchmarks.data.errata`
+    :return: A generator yields lines of updateinfo.xml
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield '<updates>'
+    for ert in errata:
+        yield '<update from="security@redhat.com" status="final" ' \
+              'type="%s" version="1">' % _ETYPES[ert["type"]]
+        yield '  <id>%s</id>' % ert["advisory"]
+        yield '  <title>%s</title>' % escape(ert["synopsis"].strip())
+        yield '  <issued date="%s 00:00:00"/>' % ert["issue_date"]
+        yield '  <updated date="%s 00:00:00"/>' % ert["update_date"]
+        yield '  <rights>Copyright 2014 Red Hat Inc</rights>'
+        yield '  <release>Red Hat Enterprise Linux 7</release>'
+        if ert["type"] == 'S':
+            yield '  <severity>%s</severity>' % ert["severity"]
+        yield '  <summary>%s</summary>' % escape(ert["synopsis"].strip())
+        yield '  <description>%s</description>' % escape(ert["description"])
+        yield '  <references>'
+        yield '    <reference href=%s id=%s type="self" title=%s/>' % \
+            (quoteattr(ert["url"]), quoteattr(ert["advisory"]),
+             quoteattr(ert["advisory"]))
+        for cve in ert["cves"]:
+            yield '    <reference href=%s id=%s type="cve" title=%s/>' % \
+                (quoteattr(cve["url"]), quoteattr(cve["id"]),
+                 quoteattr(cve["id"]))
+        yield '  </references>'
+        yield '  <pkglist>'
+        yield '    <collection short="%s">' % REPO_ID
+        yield '      <name>%s</name>' % REPO_ID
+        for pkg in ert["packages"]:
+            yield '      <package name=%s version="%s" release="%s" ' \
+                  'epoch="%s" arch="%s" src="%s-%s-%s.src.rpm">' % \
+                (quoteattr(pkg["name"]), pkg["version"], pkg["release"],
+                 pkg["epoch"], pkg["arch"], pkg["name"], pkg["version"],
+                 pkg["release"])
+            yield '        <filename>%s</filename>' % rpm_filename(pkg)
+            yield '      </package>'
+        yield '    </collection>'
+        yield '  </pkglist>'
+        yield '</update>'
+    yield '</updates>'
+
+
+def _write_repodata(repodatadir, mdtype, lines):
+    """
+    Write gzip-compressed repo metadata file.
+
+    :return: A line of repomd.xml for the metadata
+    """
+    content = '\n'.join(lines).encode("utf-8")
+    tmp = os.path.join(repodatadir, mdtype + ".xml.gz")
+    gzf = gzip.GzipFile(tmp, "wb", mtime=0)
+    try:
+        gzf.write(content)
+    finally:
+        gzf.close()
+
+    with open(tmp, "rb") as inp:
+        gzcontent = inp.read()
+
+    checksum = hashlib.sha256(gzcontent).hexdigest()
+    fname = "%s-%s.xml.gz" % (checksum, mdtype)
+    os.rename(tmp, os.path.join(repodatadir, fname))
+
+    return '''  <data type="%s">
+    <checksum type="sha256">%s</checksum>
+    <open-checksum type="sha256">%s</open-checksum>
+    <location href="repodata/%s"/>
+    <timestamp>1414566215</timestamp>
+    <size>%d</size>
+    <open-size>%d</open-size>
+  </data>''' % (mdtype, checksum, hashlib.sha256(content).hexdigest(), fname,
+                len(gzcontent), len(content))
+
+
+def make_repo(repodir, pkgs, errata, revision=1414566215):
+    """
+    Make metadata of the synthetic yum repo.
+
+    :param repodir: Repo dir to make repodata/ in
+    :param pkgs: A list of dicts represent packages in the repo
+    :param errata: A list of dicts represent errata
+    """
+    repodatadir = os.path.join(repodir, "repodata")
+    if os.path.exists(repodatadir):
+        shutil.rmtree(repodatadir)
+    os.makedirs(repodatadir)
+
+    datas = [_write_repodata(repodatadir, "primary", primary_xml_g(pkgs)),
+             _write_repodata(repodatadir, "filelists",
+                             filelists_xml_g(pkgs)),
+             _write_repodata(repodatadir, "other",
+                             filelists_xml_g(pkgs, "otherdata", "other")),
+             _write_repodata(repodatadir, "updateinfo",
+                             updateinfo_xml_g(errata))]
+
+    with open(os.path.join(repodatadir, "repomd.xml"), 'w') as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                  '<repomd xmlns="http://linux.duke.edu/metadata/repo" '
+                  'xmlns:rpm="http://linux.duke.edu/metadata/rpm">\n'
+                  '  <revision>%d</revision>\n%s\n</repomd>\n' %
+                  (revision, '\n'.join(datas)))
+
+
+def make_catalog(npackages, nerrata, seed=0):
+    """
+    Make packages and errata of the synthetic yum repo.
+
+    :param npackages: Number of packages (names) in the repo
+    :param nerrata: Number of errata
+    :return: A tuple of (packages installed, all packages in the repo, errata)
+
+    >>> (ips, pkgs, errata) = make_catalog(20, 10)
+    >>> (len(ips), len(pkgs) > len(ips), len(errata))
+    (20, True, 10)
+    """
+    ips = D.packages(npackages, seed)
+    ups = D.updates(ips, 0.5, seed + 1)
+    ups2 = D.updates(ups, 0.3, seed + 2)
+
+    return (ips, ips + ups + ups2, D.errata(nerrata, ups + ups2, seed))
+
+
+def host_plans(nhosts, ips, nprofiles=10, drift=0.2, seed=0):
+    """
+    Make plans of hosts, that is, lists of packages installed in hosts.
+
+    :param nhosts: Number of hosts
+    :param ips: A list of packages may be installed
+    :param nprofiles: Number of profiles, sets of installed packages
+    :param drift: Ratio of hosts have some extra packages
+    :return: A list of (host_id, profile index, [extra package])
+
+    >>> ips = D.packages(30)
+    >>> plans = host_plans(10, ips, 3)
+    >>> [p[1] for p in plans]
+    [0, 1, 2, 0, 1, 2, 0, 1, 2, 0]
+    >>> plans == host_plans(10, ips, 3)
+    True
+    """
+    rng = random.Random(seed)
+    plans = []
+    for idx in range(nhosts):
+        extras = []
+        if rng.random() < drift:
+            extras = rng.sample(ips, min(rng.randint(1, 5), len(ips)))
+
+        plans.append(("host-%06d.example.com" % idx, idx % nprofiles,
+                      extras))
+    return plans
+
+
+def profiles(ips, ninstalled, nprofiles=10, seed=0):
+    """
+    :param ips: A list of packages may be installed
+    :param ninstalled: Number of packages installed in each profile
+    :param nprofiles: Number of profiles
+    :return: A list of lists of installed packages of profiles
+
+    >>> profs = profiles(D.packages(30), 20, 3)
+    >>> [len(p) for p in profs]
+    [20, 20, 20]
+    """
+    rng = random.Random(seed)
+    core = [p for p in ips if p["name"] in D.CORE_NAMES]
+    rest = [p for p in ips if p["name"] not in D.CORE_NAMES]
+    nrest = max(min(ninstalled - len(core), len(rest)), 0)
+
+    return [core + rng.sample(rest, nrest) for _i in range(nprofiles)]
+
+
+def _run(cmd, **kwargs):
+    LOG.debug("Run: %s", ' '.join(cmd))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, **kwargs)
+    out = proc.communicate()[0]
+    if proc.returncode != 0:
+        raise RuntimeError("Failed: %s\n%s" % (' '.join(cmd), out))
+
+    return out
+
+
+_SPEC_TMPL = """Name: %(name)s
+Epoch: %(epoch)s
+Version: %(version)s
+Release: %(release)s
+Summary: %(summary)s
+License: GPLv3+
+Vendor: %(vendor)s
+%(buildarch)s
+
+%%description
+%(summary)s
+
+%%files
+"""
+
+
+def build_rpm(args):
+    """
+    Build the dummy RPM contains no files.
+
+    :param args: A tuple of (package, rpms dir)
+    :return: Path of the RPM built
+    """
+    (pkg, rpmsdir) = args
+    path = os.path.join(rpmsdir, rpm_filename(pkg))
+    if os.path.exists(path):
+        return path
+
+    topdir = os.path.join(rpmsdir, ".build", rpm_filename(pkg))
+    for sdir in ("SPECS", "BUILD", "RPMS", "SRPMS", "BUILDROOT"):
+        if not os.path.exists(os.path.join(topdir, sdir)):
+            os.makedirs(os.path.join(topdir, sdir))
+
+    spec = os.path.join(topdir, "SPECS", pkg["name"] + ".spec")
+    with open(spec, 'w') as out:
+        out.write(_SPEC_TMPL % dict(pkg, buildarch=("BuildArch: noarch" if
+                                                    pkg["arch"] == "noarch"
+                                                    else '')))
+
+    cmd = ["rpmbuild", "-bb", "--quiet", "--define", "_topdir " + topdir,
+           "--define", "debug_package %{nil}", "--define",
+           "_build_id_links none", spec]
+    if pkg["arch"] != "noarch":
+        cmd[1:1] = ["--target", pkg["arch"]]
+    _run(cmd)
+
+    os.rename(os.path.join(topdir, "RPMS", pkg["arch"], rpm_filename(pkg)),
+              path)
+    shutil.rmtree(topdir)
+    return path
+
+
+_RPM_INSTALL_OPTS = ["-i", "--justdb", "--nodeps", "--noscripts",
+                     "--notriggers", "--ignorearch", "--ignoreos",
+                     "--ignoresize", "--nosignature", "--nodigest"]
+
+
+def make_rpmdb(root, rpms):
+    """
+    Make the RPM DB in `root` and register RPMs in it without installing
+    their files.
+
+    :param root: RPM DB root, RPM DB is made in <root>/var/lib/rpm
+    :param rpms: A list of RPM file paths
+    """
+    dbpath = os.path.join(os.path.abspath(root), "var/lib/rpm")
+    if not os.path.exists(dbpath):
+        os.makedirs(dbpath)
+
+    _run(["rpm", "--dbpath", dbpath, "--initdb"])
+    for idx in range(0, len(rpms), 500):  # Avoid too long command lines.
+        _run(["rpm", "--dbpath", dbpath] + _RPM_INSTALL_OPTS +
+             rpms[idx:idx + 500])
+
+
+def _add_repo_file(root, repodir):
+    reposdir = os.path.join(root, "etc/yum.repos.d")
+    if not os.path.exists(reposdir):
+        os.makedirs(reposdir)
+
+    with open(os.path.join(reposdir, REPO_ID + ".repo"), 'w') as out:
+        out.write("[%s]\nname=%s\nbaseurl=file://%s\nenabled=1\n"
+                  "gpgcheck=0\n" % (REPO_ID, REPO_ID,
+                                    os.path.abspath(repodir)))
+
+
+def make_hosts(hostsdir, rpmsdir, repodir, profs, plans, executor=None):
+    """
+    Make RPM DB roots of hosts.
+
+    :param hostsdir: Dir to make RPM DB roots of hosts in
+    :param rpmsdir: Dir to build dummy RPMs in
+    :param repodir: Dir of the synthetic yum repo
+    :param profs: A list of profiles, see :function:`profiles`
+    :param plans: A list of plans of hosts, see :function:`host_plans`
+    :param executor: rpmkit.utils.Executor object to build RPMs
+    """
+    for cmd in ("rpm", "rpmbuild"):
+        if not distutils.spawn.find_executable(cmd):
+            raise RuntimeError("%s is needed to make RPM DBs of hosts" % cmd)
+
+    pkgs = dict()
+    for pkg in [p for prof in profs for p in prof] + \
+            [p for _h, _i, ps in plans for p in ps]:
+        pkgs[nevra(pkg)] = pkg
+
+    if not os.path.exists(rpmsdir):
+        os.makedirs(rpmsdir)
+
+    LOG.info("Building %d dummy RPMs in %s", len(pkgs), rpmsdir)
+    args = [(p, rpmsdir) for p in pkgs.values()]
+    if executor is None:
+        paths = dict(zip(pkgs.keys(), U.pcall(build_rpm, args)))
+    else:
+        paths = dict(zip(pkgs.keys(), executor.map(build_rpm, args)))
+
+    # Make RPM DBs of profiles once and copy them for hosts.
+    profsdir = os.path.join(hostsdir, ".profiles")
+    for idx, prof in enumerate(profs):
+        proot = os.path.join(profsdir, str(idx))
+        if not os.path.exists(proot):
+            make_rpmdb(proot, [paths[nevra(p)] for p in prof])
+
+    LOG.info("Making RPM DBs of %d hosts in %s", len(plans), hostsdir)
+    for hid, pidx, extras in plans:
+        root = os.path.join(hostsdir, hid)
+        if os.path.exists(root):
+            shutil.rmtree(root)
+
+        shutil.copytree(os.path.join(profsdir, str(pidx)), root)
+        _add_repo_file(root, repodir)
+
+        extras = [p for p in extras if p not in profs[pidx]]
+        if extras:
+            _run(["rpm", "--dbpath", os.path.join(os.path.abspath(root),
+                                                  "var/lib/rpm")] +
+                 _RPM_INSTALL_OPTS + [paths[nevra(p)] for p in extras])
+
+
+def run_updateinfo(root, outdir, args=()):
+    """
+    Run rk-updateinfo in a child process.
+
+    :param root: RPM DB root or hosts' dir
+    :param outdir: Working dir to save results
+    :param args: Extra arguments passed to rk-updateinfo
+    :return: A dict of wall time, user and system CPU time in seconds, peak
+        RSS in KB of the process (and its descendants) and the exit status
+    """
+    topdir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([topdir] +
+                                        [p for p in [env.get("PYTHONPATH")]
+                                         if p])
+    cmd = [sys.executable, "-m", "rpmkit.updateinfo.cli", "-w", outdir,
+           "-r", REPO_ID] + list(args) + [root]
+
+    LOG.info("Run: %s", ' '.join(cmd))
+    start = time.time()
+    proc = subprocess.Popen(cmd, env=env)
+    (_pid, status, rusage) = os.wait4(proc.pid, 0)
+    wall = time.time() - start
+
+    return dict(command=cmd, wall=wall, utime=rusage.ru_utime,
+                stime=rusage.ru_stime, maxrss=rusage.ru_maxrss,
+                status=os.WEXITSTATUS(status) if os.WIFEXITED(status) else
+                -os.WTERMSIG(status))
+
+
+def _step(report, name, func, *args):
+    """
+    Run a step of the harness and record its time and peak RSS.
+    """
+    import resource
+
+    LOG.info("Step: %s", name)
+    start = time.time()
+    res = func(*args)
+    report["steps"].append(dict(name=name, wall=time.time() - start,
+                                maxrss=resource.getrusage(
+                                    resource.RUSAGE_SELF).ru_maxrss))
+    return res
+
+
+def main(argv=None):
+    defaults = dict(workdir="/tmp/rk-scale", hosts=100, packages=2000,
+                    installed=800, profiles=10, drift=0.2, errata=3000,
+                    seed=0, args='', nprocs=None, skip_single=False,
+                    verbose=False)
+    p = optparse.OptionParser("%prog [OPTION ...]")
+    p.set_defaults(**defaults)
+    p.add_option("-w", "--workdir", help="Working dir [%default]")
+    p.add_option("", "--hosts", type="int",
+                 help="Number of hosts [%default]")
+    p.add_option("", "--packages", type="int",
+                 help="Number of package names in the repo [%default]")
+    p.add_option("", "--installed", type="int",
+                 help="Number of packages installed in hosts [%default]")
+    p.add_option("", "--profiles", type="int",
+                 help="Number of profiles (sets of installed packages) of "
+                      "hosts [%default]")
+    p.add_option("", "--drift", type="float",
+                 help="Ratio of hosts have extra packages [%default]")
+    p.add_option("", "--errata", type="int",
+                 help="Number of errata in the repo [%default]")
+    p.add_option("", "--seed", type="int", help="Random seed [%default]")
+    p.add_option("", "--nprocs", type="int",
+                 help="Number of processes to build RPMs")
+    p.add_option("", "--args",
+                 help="Extra arguments passed to rk-updateinfo, e.g. "
+                      "'-M --nprocs 8 -B fleet'")
+    p.add_option("", "--skip-single", action="store_true",
+                 help="Do not run rk-updateinfo in single host mode")
+    p.add_option("-v", "--verbose", action="store_true", help="Verbose mode")
+    (options, _args) = p.parse_args(argv)
+
+    logging.basicConfig(level=(logging.INFO if options.verbose else
+                               logging.WARN))
+
+    workdir = os.path.abspath(options.workdir)
+    (repodir, rpmsdir, hostsdir, outdir) = \
+        [os.path.join(workdir, d) for d in ("repo", "rpms", "hosts", "out")]
+
+    report = dict(options=options.__dict__, steps=[], runs=dict(),
+                  date=datetime.datetime.now().strftime("%F %T"))
+
+    (ips, pkgs, errata) = _step(report, "generate data", make_catalog,
+                                options.packages, options.errata,
+                                options.seed)
+    _step(report, "make repo", make_repo, repodir, pkgs, errata)
+
+    profs = profiles(ips, options.installed, options.profiles, options.seed)
+    plans = host_plans(options.hosts, ips, options.profiles, options.drift,
+                       options.seed)
+    with U.Executor(options.nprocs) as executor:
+        _step(report, "make hosts", make_hosts, hostsdir, rpmsdir, repodir,
+              profs, plans, executor)
+
+    args = options.args.split()
+    modes = [("multi", hostsdir)]
+    if not options.skip_single:
+        modes.insert(0, ("single", os.path.join(hostsdir, plans[0][0])))
+
+    for mode, root in modes:
+        mdir = os.path.join(outdir, mode)
+        if os.path.exists(mdir):
+            shutil.rmtree(mdir)
+
+        res = run_updateinfo(root, mdir, args)
+        tpath = os.path.join(mdir, RUT.TIMINGS_FILE)
+        if os.path.exists(tpath):
+            res["timings"] = U.json_load(tpath)
+
+        report["runs"][mode] = res
+        print("%-8s wall=%.2fs user=%.2fs sys=%.2fs maxrss=%dKB status=%d" %
+              (mode, res["wall"], res["utime"], res["stime"], res["maxrss"],
+               res["status"]))
+
+    U.json_dump(report, os.path.join(workdir, REPORT_FILE))
+    print("Report: " + os.path.join(workdir, REPORT_FILE))
+
+    return 0 if all(r["status"] == 0 for r in report["runs"].values()) \
+        else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,148 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Benchmarks of functions in hot paths of rpmkit.
+
+Each benchmark is a context manager takes the scale of data, prepares data
+and yields a callable without arguments to measure, and registered in
+BENCHMARKS by :function:`benchmark`. Modules depend on optional packages,
+e.g. rpm and tablib, are imported in benchmarks so that other benchmarks can
+run without them.
+"""
+import collections
+import contextlib
+import functools
+import os.path
+import shutil
+import tempfile
+
+import rpmkit.benchmarks.data as D
+
+
+BENCHMARKS = collections.OrderedDict()  # {name: benchmark}
+
+NPACKAGES = 1000  # Number of packages of size 1.
+NERRATA = 300  # Number of errata of size 1.
+
+
+def benchmark(name):
+    """
+    Decorator to register a benchmark.
+
+    :param name: Benchmark name, e.g. 'utils.uniq'
+    """
+    def register(func):
+        BENCHMARKS[name] = contextlib.contextmanager(func)
+        return BENCHMARKS[name]
+
+    return register
+
+
+def _errata_and_updates(size, seed=0):
+    ps = D.packages(NPACKAGES * size, seed)
+    us = D.updates(ps, seed=seed)
+    return (D.errata(NERRATA * size, us, seed), us)
+
+
+def _complemented(size, score=0):
+    import rpmkit.updateinfo.main as RUM
+
+    (es, us) = _errata_and_updates(size)
+    return (list(RUM.errata_complement_g(es, us, score)), us)
+
+
+@benchmark("rpmutils.pcmp")
+def bench_rpmutils_pcmp(size):
+    import rpmkit.rpmutils as RR
+
+    ps = D.packages(NPACKAGES * size)
+    pairs = list(zip(ps, D.updates(ps, 1.0)))
+    yield lambda: [RR.pcmp(p, u) for p, u in pairs]
+
+
+@benchmark("rpmutils.find_latests")
+def bench_rpmutils_find_latests(size):
+    import rpmkit.rpmutils as RR
+
+    ps = D.packages(NPACKAGES * size)
+    ps = ps + D.updates(ps, 0.5) + D.updates(ps, 0.3, seed=1)
+    yield lambda: RR.find_latests(ps)
+
+
+@benchmark("utils.uniq")
+def bench_utils_uniq(size):
+    import rpmkit.utils as U
+
+    names = D.package_names(NPACKAGES * size)
+    xs = names + names[::2] + names[::3]
+    yield lambda: U.uniq(xs)
+
+
+@benchmark("utils.flatten")
+def bench_utils_flatten(size):
+    import rpmkit.utils as U
+
+    xss = [[[i, i + 1], [i + 2, [i + 3]]] for i in range(100 * size)]
+    yield lambda: U.flatten(xss)
+
+
+@benchmark("utils.select_from_list")
+def bench_utils_select_from_list(size):
+    import rpmkit.utils as U
+
+    names = D.package_names(NPACKAGES * size * 10)
+    xs = (names[::NPACKAGES // 10] +
+          ["pkg-%03d*" % i for i in range(0, 1000, 10)] +
+          [".*-%d5$" % i for i in range(10)])
+    yield lambda: U.select_from_list(xs, names)
+
+
+@benchmark("updateinfo.errata_complement_g")
+def bench_updateinfo_errata_complement_g(size):
+    import rpmkit.updateinfo.main as RUM
+
+    # Errata are complemented in place but results do not depend on what
+    # were complemented in previous calls, so that they are not copied in
+    # each call not to measure copying mostly.
+    (es, us) = _errata_and_updates(size)
+    yield lambda: list(RUM.errata_complement_g(es, us))
+
+
+@benchmark("updateinfo.analyze_errata")
+def bench_updateinfo_analyze_errata(size):
+    import rpmkit.updateinfo.main as RUM
+
+    (es, us) = _complemented(size, 4.0)
+    yield functools.partial(RUM.analyze_errata, es, us, 4.0,
+                            list(D.KEYWORDS), list(D.CORE_NAMES))
+
+
+@benchmark("updateinfo.compute_delta")
+def bench_updateinfo_compute_delta(size):
+    import rpmkit.updateinfo.main as RUM
+    import rpmkit.utils as U
+
+    (es, us) = _complemented(size)
+    (refes, refus) = _complemented(size // 2 or 1)
+
+    refdir = tempfile.mkdtemp(prefix="rpmkit-bench-")
+    try:
+        U.json_dump(dict(data=refes), os.path.join(refdir, "errata.json"))
+        U.json_dump(dict(data=refus), os.path.join(refdir, "updates.json"))
+        yield functools.partial(RUM.compute_delta, refdir, es, us)
+    finally:
+        shutil.rmtree(refdir)
+
+
+@benchmark("updateinfo.make_dataset")
+def bench_updateinfo_make_dataset(size):
+    import rpmkit.updateinfo.main as RUM
+
+    (es, _us) = _complemented(size)
+    keys = ("advisory", "type", "severity", "synopsis", "description",
+            "issue_date", "update_date", "url", "cves", "bzs",
+            "update_names")
+    yield functools.partial(RUM.make_dataset, es, "Errata Details", keys)
+
+# vim:sw=4:ts=4:et:
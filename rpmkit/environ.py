@@ -19,6 +19,7 @@
 #
 import rpmkit.memoize as M
 
+import fnmatch
 import glob
 import logging
 import os
@@ -26,7 +27,6 @@ import os.path
 import platform
 import re
 import socket
-import subprocess
 
 
 @M.memoize
@@ -64,6 +64,292 @@ def is_git_available():
     return os.system("git --version > /dev/null 2> /dev/null") == 0
 
 
+# Parsed git config files: {path: ((mtime, size), [(key, value)])}
+_GIT_CONFIG_CACHE = dict()
+
+_GIT_ESCAPES = dict(n="\n", t="\t", b="\b")
+_GIT_INCLUDE_DEPTH = 10
+
+
+def _parse_git_config_header(header):
+    """
+    :param header: Section header without brackets
+
+    >>> _parse_git_config_header('Remote "Origin"')
+    'remote.Origin'
+    >>> _parse_git_config_header('Core')
+    'core'
+    >>> _parse_git_config_header('Branch.Master')
+    'branch.master'
+    """
+    match = re.match(r'^\s*([A-Za-z0-9.-]+)\s*(?:"((?:[^"\\]|\\.)*)")?\s*$',
+                     header)
+    if not match:
+        raise ValueError("Invalid section header: [%s]" % header)
+
+    (section, subsection) = match.groups()
+    if subsection is None:
+        return section.lower()
+
+    return section.lower() + '.' + re.sub(r"\\(.)", r"\1", subsection)
+
+
+def _parse_git_config_value(content, pos):
+    """
+    :return: A tuple of (value, position of the next line)
+
+    >>> _parse_git_config_value(' a "b ; c"  # x', 0)
+    ('a b ; c', 15)
+    """
+    (buf, spaces, quoted) = ([], [], False)
+    end = len(content)
+    while pos < end:
+        char = content[pos]
+        pos += 1
+        if char == "\n":
+            break
+        elif char == "\\" and pos < end:
+            nchar = content[pos]
+            pos += 1
+            if nchar == "\n":
+                continue  # Continued to the next line.
+            char = _GIT_ESCAPES.get(nchar, nchar)
+        elif char == '"':
+            quoted = not quoted
+            continue
+        elif char in "#;" and not quoted:
+            pos = content.find("\n", pos)
+            pos = end if pos < 0 else pos + 1
+            break
+        elif char.isspace() and not quoted:
+            if buf:
+                spaces.append(char)
+            continue
+
+        buf.extend(spaces)
+        buf.append(char)
+        spaces = []
+
+    return (''.join(buf), pos)
+
+
+def parse_git_config(content):
+    """
+    Parse the content of git config file.
+
+    :param content: Content of git config file
+    :return: A list of (key, value); section names and keys are lower-cased
+        and value of keys without values is 'true'
+
+    >>> parse_git_config("[User]\\n  Name = John Doe # x\\n[core]\\nbare")
+    [('user.name', 'John Doe'), ('core.bare', 'true')]
+    """
+    res = []
+    section = None
+    (pos, end) = (0, len(content))
+    while pos < end:
+        match = re.compile(r"[ \t\r\n]*").match(content, pos)
+        pos = match.end()
+        if pos >= end:
+            break
+
+        char = content[pos]
+        if char in "#;":
+            pos = content.find("\n", pos)
+            pos = end if pos < 0 else pos + 1
+        elif char == '[':
+            close = content.find(']', pos)
+            if close < 0:
+                raise ValueError("Invalid section header at %d" % pos)
+            section = _parse_git_config_header(content[pos + 1:close])
+            pos = close + 1
+        else:
+            match = re.compile(r"([A-Za-z][A-Za-z0-9-]*)[ \t]*(=?)"
+                               ).match(content, pos)
+            if not match or section is None:
+                raise ValueError("Invalid line at %d" % pos)
+
+            key = section + '.' + match.group(1).lower()
+            pos = match.end()
+            if match.group(2):
+                (value, pos) = _parse_git_config_value(content, pos)
+            else:
+                value = "true"
+                (_rest, pos) = _parse_git_config_value(content, pos)
+            res.append((key, value))
+
+    return res
+
+
+def _load_git_config_file(path):
+    """
+    Parse the git config file and memoize the result until it's changed.
+
+    :return: A list of (key, value) or [] if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return []
+
+    sig = (stat.st_mtime, stat.st_size)
+    cached = _GIT_CONFIG_CACHE.get(path)
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+
+    try:
+        entries = parse_git_config(open(path).read())
+    except (IOError, ValueError) as exc:
+        logging.warn("Could not load the git config: %s: %s", path, exc)
+        entries = []
+
+    _GIT_CONFIG_CACHE[path] = (sig, entries)
+    return entries
+
+
+def _include_path(path, basedir):
+    path = os.path.expanduser(path)
+    return path if os.path.isabs(path) else os.path.join(basedir, path)
+
+
+def _match_gitdir(pattern, gitdir, basedir, icase=False):
+    """
+    :param pattern: Pattern of includeIf "gitdir:<pattern>"
+
+    >>> _match_gitdir("/a/", "/a/b/.git", "/")
+    True
+    >>> _match_gitdir("b/", "/a/b/.git", "/")
+    True
+    >>> _match_gitdir("./c/", "/a/b/.git", "/a")
+    False
+    """
+    if gitdir is None:
+        return False
+
+    if pattern.startswith("./"):
+        pattern = os.path.join(basedir, pattern[2:])
+    elif pattern.startswith("~/"):
+        pattern = os.path.expanduser(pattern)
+    elif not os.path.isabs(pattern):
+        pattern = "**/" + pattern
+
+    if pattern.endswith('/'):
+        pattern += "**"
+
+    if icase:
+        (pattern, gitdir) = (pattern.lower(), gitdir.lower())
+
+    return fnmatch.fnmatchcase(gitdir, pattern)
+
+
+def load_git_config(path, gitdir=None, depth=0):
+    """
+    Load the git config file with following include and includeIf (gitdir)
+    directives.
+
+    :param path: Path of git config file
+    :param gitdir: Path of .git dir of the repo to evaluate includeIf
+    :return: A list of (key, value)
+    """
+    res = []
+    basedir = os.path.dirname(path)
+    for key, value in _load_git_config_file(path):
+        res.append((key, value))
+        if depth >= _GIT_INCLUDE_DEPTH:
+            continue
+
+        if key == "include.path":
+            res.extend(load_git_config(_include_path(value, basedir), gitdir,
+                                       depth + 1))
+        elif key.startswith("includeif.") and key.endswith(".path"):
+            cond = key[len("includeif."):-len(".path")]
+            for prefix, icase in (("gitdir:", False), ("gitdir/i:", True)):
+                if cond.startswith(prefix) and \
+                        _match_gitdir(cond[len(prefix):], gitdir, basedir,
+                                      icase):
+                    res.extend(load_git_config(_include_path(value, basedir),
+                                               gitdir, depth + 1))
+    return res
+
+
+def find_gitdir(curdir=None):
+    """
+    :param curdir: Dir to find .git dir from or None (the current dir)
+    :return: Path of .git dir of the repo `curdir` is in, or None
+    """
+    if os.environ.get("GIT_DIR"):
+        return os.path.abspath(os.environ["GIT_DIR"])
+
+    curdir = os.path.abspath(curdir or os.curdir)
+    while True:
+        dotgit = os.path.join(curdir, ".git")
+        if os.path.isdir(dotgit):
+            return dotgit
+
+        if os.path.isfile(dotgit):  # Worktrees and submodules.
+            match = re.match(r"^gitdir:\s*(.+?)\s*$", open(dotgit).read())
+            if match:
+                return os.path.normpath(os.path.join(curdir,
+                                                     match.groups()[0]))
+
+        parent = os.path.dirname(curdir)
+        if parent == curdir:
+            return None
+        curdir = parent
+
+
+def git_config_files(gitdir=None):
+    """
+    :param gitdir: Path of .git dir of the repo or None
+    :return: A list of paths of system, XDG, global and repo git config files
+        in this order; latter ones take precedence
+    """
+    env = os.environ
+    res = []
+    if not env.get("GIT_CONFIG_NOSYSTEM"):
+        res.append(env.get("GIT_CONFIG_SYSTEM", "/etc/gitconfig"))
+
+    if env.get("GIT_CONFIG_GLOBAL"):
+        res.append(env["GIT_CONFIG_GLOBAL"])
+    else:
+        xdgdir = env.get("XDG_CONFIG_HOME") or \
+            os.path.expanduser("~/.config")
+        res.append(os.path.join(xdgdir, "git", "config"))
+        res.append(os.path.expanduser("~/.gitconfig"))
+
+    if gitdir is not None:
+        commondir = os.path.join(gitdir, "commondir")  # Worktrees.
+        if os.path.isfile(commondir):
+            gitdir = os.path.normpath(os.path.join(gitdir, open(commondir)
+                                                   .read().strip()))
+        res.append(os.path.join(gitdir, "config"))
+
+    return res
+
+
+def git_config_get(key, curdir=None):
+    """
+    Get the value of git config like 'git config --get <key>' without
+    running git.
+
+    :param key: Key, e.g. "user.email"
+    :param curdir: Dir to find the repo from or None (the current dir)
+    :return: Value or None if not found
+    """
+    (section, _dot, name) = key.rpartition('.')
+    (section, _dot, subsection) = section.partition('.')
+    key = '.'.join(s for s in (section.lower(), subsection, name.lower()) if s)
+
+    gitdir = find_gitdir(curdir)
+    value = None
+    for path in git_config_files(gitdir):
+        for ckey, cvalue in load_git_config(path, gitdir):
+            if ckey == key:
+                value = cvalue
+
+    return value
+
+
 @M.memoize
 def hostname():
     return socket.gethostname() or os.uname()[1]
@@ -79,34 +365,22 @@ def get_username():
         return "root"  # It looks failed in docker env.
 
 
-@M.memoize
 def get_email():
-    if is_git_available():
-        try:
-            email = subprocess.check_output(
-                "git config --get user.email 2>/dev/null", shell=True
-            )
-            return email.rstrip()
-        except Exception as exc:
-            logging.warn("get_email: " + str(exc))
-            pass
+    """Get email address of the user from git config files.
+    """
+    email = git_config_get("user.email")
+    if email:
+        return email
 
     return get_username() + "@%(server)s"
 
 
-@M.memoize
 def get_fullname():
-    """Get full name of the user.
-    """
-    if is_git_available():
-        try:
-            fullname = subprocess.check_output(
-                "git config --get user.name 2>/dev/null", shell=True
-            )
-            return fullname.rstrip()
-        except Exception as exc:
-            logging.warn("get_fullname: " + str(exc))
-            pass
+    """Get full name of the user from git config files.
+    """
+    fullname = git_config_get("user.name")
+    if fullname:
+        return fullname
 
     return os.environ.get("FULLNAME", get_username())
 
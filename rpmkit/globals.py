@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import rpmkit.memoize
+
 import gettext
 import logging
 import os.path
@@ -53,9 +55,18 @@ def getLogger(name=PACKAGE, format=LOGGING_FORMAT,
 LOGGER = getLogger()
 
 
-_ = gettext.translation(domain=PACKAGE,
-                        localedir=os.path.join(os.path.dirname(__file__),
-                                               "locale"),
-                        fallback=True).ugettext
+@rpmkit.memoize.memoize
+def _translation():
+    localedir = os.path.join(os.path.dirname(__file__), "locale")
+    return gettext.translation(domain=PACKAGE, localedir=localedir,
+                               fallback=True)
+
+
+def _(msgid):
+    """
+    Translate the message. Catalogs are loaded when it's called first instead
+    of on import.
+    """
+    return _translation().ugettext(msgid)
 
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,291 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""JSON codec to load and dump JSON files fast and compressed.
+
+- The fastest JSON encoder/decoder available is used: orjson, ujson,
+  simplejson and then the standard json module.
+- JSON files are compressed and decompressed transparently by their
+  extensions, .gz, .xz and .zst, and uncompressed JSON files are also
+  loaded as before. Compression is done by python modules if available or
+  by commands, xz and zstd, in the PATH.
+"""
+from __future__ import absolute_import
+
+import gzip
+import io
+import logging
+import os.path
+import os
+import subprocess
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+LOG = logging.getLogger(__name__)
+
+COMPRESSIONS = (".gz", ".xz", ".zst")
+
+
+def _to_bytes(content):
+    return content if isinstance(content, bytes) else content.encode("utf-8")
+
+
+def _load_codec():
+    """
+    :return: A tuple of (name, loads, dumps) of the fastest JSON codec
+        available. loads accepts bytes and dumps returns bytes.
+    """
+    try:
+        import orjson
+        return ("orjson", orjson.loads, orjson.dumps)
+    except ImportError:
+        pass
+
+    try:
+        import ujson
+        return ("ujson", ujson.loads,
+                lambda data: _to_bytes(ujson.dumps(data)))
+    except ImportError:
+        pass
+
+    return (json.__name__,
+            lambda content: json.loads(content.decode("utf-8")),
+            lambda data: _to_bytes(json.dumps(data)))
+
+
+(CODEC, _loads, _dumps) = _load_codec()
+
+
+def loads(content):
+    """
+    :param content: JSON string (bytes or str)
+    :return: Data loaded
+
+    >>> loads(b'{"a": [1, "b"]}') == {"a": [1, "b"]}
+    True
+    """
+    return _loads(_to_bytes(content))
+
+
+def dumps(data):
+    """
+    :param data: Data to dump
+    :return: JSON string in bytes
+
+    >>> loads(dumps({"a": [1, "b"]})) == {"a": [1, "b"]}
+    True
+    """
+    try:
+        return _dumps(data)
+    except (TypeError, OverflowError):
+        # Some fast codecs do not support some data, e.g. non-str keys and
+        # big integers, which the standard one does.
+        return _to_bytes(json.dumps(data))
+
+
+def _run(cmd, content):
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    (out, _err) = proc.communicate(content)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, ' '.join(cmd))
+
+    return out
+
+
+def _gz_compress(content):
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb") as gzf:
+        gzf.write(content)
+
+    return out.getvalue()
+
+
+def _gz_decompress(content):
+    with gzip.GzipFile(fileobj=io.BytesIO(content)) as gzf:
+        return gzf.read()
+
+
+def _xz_compress(content):
+    if lzma is None:
+        return _run(["xz", "-c"], content)
+
+    return lzma.compress(content)
+
+
+def _xz_decompress(content):
+    if lzma is None:
+        return _run(["xz", "-dc"], content)
+
+    return lzma.decompress(content)
+
+
+def _zst_compress(content):
+    if zstandard is None:
+        return _run(["zstd", "-q", "-c"], content)
+
+    return zstandard.ZstdCompressor().compress(content)
+
+
+def _zst_decompress(content):
+    if zstandard is None:
+        return _run(["zstd", "-q", "-dc"], content)
+
+    # Frames written in streaming mode do not have the content size.
+    return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+
+
+_COMPRESSORS = {".gz": (_gz_compress, _gz_decompress),
+                ".xz": (_xz_compress, _xz_decompress),
+                ".zst": (_zst_compress, _zst_decompress)}
+
+
+def compression(path):
+    """
+    :param path: File path
+    :return: Compression of the file by its extension, one of COMPRESSIONS,
+        or None if it's not compressed
+
+    >>> compression("/tmp/w/errata.json.xz")
+    '.xz'
+    >>> compression("/tmp/w/errata.json")
+    """
+    for ext in COMPRESSIONS:
+        if path.endswith(ext):
+            return ext
+
+    return None
+
+
+def normalize_compression(comp):
+    """
+    :param comp: Compression, e.g. 'xz' or '.xz', or None
+    :return: Compression, one of COMPRESSIONS, or None
+
+    >>> normalize_compression("gz")
+    '.gz'
+    >>> normalize_compression(".zst")
+    '.zst'
+    >>> normalize_compression("")
+    """
+    if not comp:
+        return None
+
+    if not comp.startswith('.'):
+        comp = '.' + comp
+
+    if comp not in COMPRESSIONS:
+        raise ValueError("Unknown compression: " + comp)
+
+    return comp
+
+
+# Default compression used to dump JSON files if compression is requested,
+# one of COMPRESSIONS or None (not compressed).
+DEFAULT_COMPRESSION = \
+    normalize_compression(os.environ.get("RPMKIT_JSON_COMPRESSION"))
+
+
+def set_default_compression(comp):
+    """
+    :param comp: Compression, e.g. 'xz' or '.xz', or None
+    """
+    global DEFAULT_COMPRESSION
+    DEFAULT_COMPRESSION = normalize_compression(comp)
+
+
+def _base_path(path):
+    comp = compression(path)
+    return path[:-len(comp)] if comp else path
+
+
+def find_file(path):
+    """
+    :param path: Path of the JSON file, e.g. /tmp/w/errata.json
+    :return: Path of the file or its compressed one found, or None
+
+    >>> find_file("/not/exist/errata.json")
+    """
+    base = _base_path(path)
+    for candidate in [path, base] + [base + ext for ext in COMPRESSIONS]:
+        if os.path.exists(candidate):
+            return candidate
+
+    return None
+
+
+def load(path):
+    """
+    Load data from the JSON file may be compressed.
+
+    :param path: Path of the JSON file. Compressed one, e.g. <path>.xz, will
+        be loaded if the path does not exist but it does.
+    :return: Data loaded
+    """
+    path = find_file(path) or path
+    with open(path, "rb") as inp:
+        content = inp.read()
+
+    comp = compression(path)
+    if comp:
+        content = _COMPRESSORS[comp][1](content)
+
+    return loads(content)
+
+
+def dump(data, path, comp=None):
+    """
+    Dump data into the JSON file may be compressed.
+
+    Other files of the same JSON file but compressed in other ways or not
+    compressed, e.g. <path>.gz, are removed not to be loaded instead.
+
+    :param data: Data to dump
+    :param path: Output path. It will be compressed if its extension is one
+        of COMPRESSIONS.
+    :param comp: Compression, e.g. 'xz', appended to the extension of the
+        path, or True to use DEFAULT_COMPRESSION
+    :return: Path of the file dumped
+    """
+    if comp is True:
+        comp = DEFAULT_COMPRESSION
+
+    comp = normalize_compression(comp)
+    if comp and compression(path) is None:
+        path += comp
+
+    content = dumps(data)
+    comp = compression(path)
+    if comp:
+        content = _COMPRESSORS[comp][0](content)
+
+    with open(path, "wb") as out:
+        out.write(content)
+
+    base = _base_path(path)
+    for other in [base] + [base + ext for ext in COMPRESSIONS]:
+        if other != path and os.path.exists(other):
+            LOG.debug("Remove the old JSON file: %s", other)
+            os.remove(other)
+
+    return path
+
+# vim:sw=4:ts=4:et:
@@ -21,7 +21,6 @@
 
 import optparse
 import os
-import rpm
 import sys
 import textwrap
 
@@ -44,6 +43,8 @@ def rpmheader(rpmfile):
 
     @see http://docs.fedoraproject.org/drafts/rpm-guide-en/ch16s04.html
     """
+    import rpm  # Imported lazily as it takes long time.
+
     ts = rpm.TransactionSet()
     ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
     fd = os.open(rpmfile, os.O_RDONLY)
@@ -54,6 +55,8 @@ def rpmheader(rpmfile):
 
 
 def rpmtags():
+    import rpm
+
     return [tag.replace('RPMTAG_', '').lower() for tag in dir(rpm)
             if tag.startswith('RPMTAG_')]
 
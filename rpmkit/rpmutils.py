@@ -24,7 +24,8 @@ import logging
 import operator
 import os
 import re
-import rpm
+
+rpm = RU.lazy_import("rpm")
 
 
 RPM_BASIC_KEYS = ("name", "version", "release", "epoch", "arch")
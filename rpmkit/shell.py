@@ -18,18 +18,22 @@
 import rpmkit.environ as E
 import rpmkit.utils as U
 
+import collections
+import errno
 import logging
 import multiprocessing
 import os
 import os.path
+import select
+import signal
 import subprocess
 import sys
-import threading
 import time
 
 
 MIN_TIMEOUT = 5  # [sec]
 MAX_TIMEOUT = 60 * 5  # 300 [sec] = 5 [min]
+KILL_TIMEOUT = 1  # [sec] to wait for the process terminated before killing
 
 
 def _debug_mode():
@@ -55,39 +59,200 @@ def _is_valid_timeout(timeout):
         return isinstance(timeout, int) and timeout >= 0
 
 
-def _cleanup_process(pid):
+def _retry_on_eintr(func, *args):
+    while True:
+        try:
+            return func(*args)
+        except (OSError, IOError, select.error) as exc:
+            if exc.args[0] != errno.EINTR:
+                raise
+
+
+def _returncode(status):
     """
-    Cleanups to avoid creating zonbie.
+    :param status: Exit status :function:`os.wait4` returns
+    :return: Return code like subprocess.Popen.returncode
+
+    >>> _returncode(0), _returncode(256), _returncode(signal.SIGTERM)
+    (0, 1, -15)
     """
-    try:
-        (_pid, _rc) = os.waitpid(pid, os.WNOHANG)
-    except OSError:
-        pass
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
 
 
-def _terminate(proc, wait=1):
+def _wait(pid, deadline=None):
     """
-    Force terminating the given proc :: subprocess.Popen
+    Wait for the process finished until the deadline without extra threads.
 
-    :return:  status code of proc
+    :param pid: Process ID
+    :param deadline: Time in seconds since the epoch or None (wait forever)
+    :return: A tuple of (status, rusage) or None if the process is still
+        running at the deadline
     """
-    U.typecheck(proc, subprocess.Popen)
+    if deadline is None:
+        return _retry_on_eintr(os.wait4, pid, 0)[1:]
 
-    rc = proc.poll()
-    if rc is not None:  # It's finished already.
-        return rc
+    delay = 0.0005
+    while True:
+        (wpid, status, rusage) = _retry_on_eintr(os.wait4, pid, os.WNOHANG)
+        if wpid:
+            return (status, rusage)
 
-    proc.terminate()
-    time.sleep(wait)
+        remains = deadline - time.time()
+        if remains <= 0:
+            return None
 
-    rc = proc.poll()
-    if rc is not None:
-        return rc
+        time.sleep(min(delay, remains))
+        delay = min(delay * 2, 0.05)
 
-    proc.kill()
-    _cleanup_process(proc.pid)
 
-    return -1
+def _read_outputs(pipes, deadline=None):
+    """
+    Read outputs from pipes until these are closed or the deadline.
+
+    :param pipes: A list of file objects of pipes
+    :param deadline: Time in seconds since the epoch or None (no time limit)
+    :return: A tuple of (a list of outputs of pipes, True if timed out)
+    """
+    outs = dict((p.fileno(), []) for p in pipes)
+    fds = list(outs.keys())
+    while fds:
+        wait = None
+        if deadline is not None:
+            wait = deadline - time.time()
+            if wait <= 0:
+                break
+
+        (rfds, _w, _x) = _retry_on_eintr(select.select, fds, [], [], wait)
+        for fd in rfds:
+            data = _retry_on_eintr(os.read, fd, 65536)
+            if data:
+                outs[fd].append(data)
+            else:
+                fds.remove(fd)
+
+    return ([b''.join(outs[p.fileno()]) for p in pipes], bool(fds))
+
+
+def _kill(pid):
+    """
+    Terminate the process and kill it if it's still running after
+    KILL_TIMEOUT seconds.
+
+    :return: A tuple of (status, rusage) of the process
+    """
+    for sig, timeout in ((signal.SIGTERM, KILL_TIMEOUT), (signal.SIGKILL,
+                                                          None)):
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            pass  # It's finished already.
+
+        res = _wait(pid, None if timeout is None else time.time() + timeout)
+        if res is not None:
+            return res
+
+
+def _spawn(cmd, workdir, stdout, stderr, env=None):
+    """
+    :return: subprocess.Popen object runs the command
+    """
+    with open(os.devnull, "r") as stdin:
+        return subprocess.Popen(cmd, shell=True, cwd=workdir, env=env,
+                                stdin=stdin, stdout=stdout, stderr=stderr,
+                                close_fds=True)
+
+
+class Result(object):
+    """
+    Result of the command :function:`execute` ran.
+    """
+
+    def __init__(self, cmd, rc, stdout=None, stderr=None, duration=0.0,
+                 rusage=None, timedout=False):
+        """
+        :param cmd: Command string
+        :param rc: Return code, negative if it's terminated by a signal
+        :param stdout, stderr: Outputs captured or None if not captured
+        :param duration: Wall clock time in seconds
+        :param rusage: Resource usage of the process :function:`os.wait4`
+            returns
+        :param timedout: True if it's terminated as timed out
+        """
+        self.cmd = cmd
+        self.rc = rc
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.timedout = timedout
+
+        self.utime = rusage.ru_utime if rusage else 0.0
+        self.stime = rusage.ru_stime if rusage else 0.0
+        self.maxrss = rusage.ru_maxrss if rusage else 0  # [KB]
+
+    def ok(self):
+        return self.rc == 0
+
+    def __str__(self):
+        return "rc=%d, duration=%.3fs, cpu=%.3fs, maxrss=%dKB%s: %s" % \
+            (self.rc, self.duration, self.utime + self.stime, self.maxrss,
+             " (timed out)" if self.timedout else '', self.cmd)
+
+
+def execute(cmd, workdir=os.curdir, timeout=None, capture=True, env=None):
+    """
+    Run the command directly in a child process and wait for it finished.
+    Timeout is handled in this process without extra processes or threads.
+
+    :param cmd: Command string run by the shell
+    :param workdir: Working directory in which command runs
+    :param timeout: Time out in seconds or None
+    :param capture: Capture outputs if True or stream them to stdout (only in
+        debug mode) and stderr
+    :param env: A dict of environment variables or None (inherit)
+    :return: Result object
+
+    >>> res = execute("echo OK; echo NG >&2")
+    >>> (res.rc, res.stdout, res.stderr, res.timedout)
+    (0, 'OK\\n', 'NG\\n', False)
+    >>> res = execute("sleep 10", timeout=0.1)
+    >>> (res.rc, res.timedout, res.duration < 5)
+    (-15, True, True)
+    """
+    assert _is_valid_timeout(timeout) or isinstance(timeout, float), \
+        "Invalid timeout: " + str(timeout)
+
+    if capture:
+        (stdout, stderr) = (subprocess.PIPE, subprocess.PIPE)
+    else:
+        (stdout, stderr) = (None if _debug_mode() else open(os.devnull, "w"),
+                            None)
+
+    deadline = None if timeout is None else time.time() + timeout
+    start = time.time()
+    proc = _spawn(cmd, workdir, stdout, stderr, env)
+    if not capture and stdout is not None:
+        stdout.close()
+
+    (outs, timedout) = ((None, None), False)
+    if capture:
+        (outs, timedout) = _read_outputs([proc.stdout, proc.stderr],
+                                         deadline)
+        proc.stdout.close()
+        proc.stderr.close()
+
+    res = None if timedout else _wait(proc.pid, deadline)
+    if res is None:
+        logging.warn("Timed out and terminate: %s", cmd)
+        (res, timedout) = (_kill(proc.pid), True)
+
+    (status, rusage) = res
+    proc.returncode = _returncode(status)  # It's reaped already.
+
+    return Result(cmd, proc.returncode, outs[0], outs[1], time.time() - start,
+                  rusage, timedout)
 
 
 def init(loglevel=logging.INFO):
@@ -109,21 +274,27 @@ class TaskError(Exception):
 class Task(object):
 
     def __init__(self, cmd, user=None, host="localhost", workdir=os.curdir,
-                 timeout=MAX_TIMEOUT):
+                 timeout=MAX_TIMEOUT, transport=None):
         """
         :param cmd: Command string
         :param user: User to run command
         :param host: Host to run command
         :param workdir: Working directory in which command runs
         :param timeout: Time out in seconds
+        :param transport: rpmkit.transport.Transport object to run command on
+            the host, or None to run it in the local host or via ssh
         """
         assert _is_valid_timeout(timeout), "Invalid timeout: " + str(timeout)
 
         self.user = E.get_username() if user is None else user
         self.host = host
         self.timeout = timeout
+        (self.rcmd, self.rworkdir) = (cmd, workdir)  # Run on the host.
 
-        if U.is_local(host):
+        if transport is not None:
+            cmd = transport.command(cmd, self.user, host, workdir)
+            workdir = os.curdir
+        elif U.is_local(host):
             if "~" in workdir:
                 workdir = os.path.expanduser(workdir)
         else:
@@ -137,6 +308,8 @@ class Task(object):
         self.cmd_str = "%s [%s]" % (cmd, workdir)
         self.proc = None
         self.returncode = None
+        self.result = None
+        self.logfile = None
 
     def __str__(self):
         return self.cmd_str
@@ -153,20 +326,10 @@ def do_task(task, stop_on_error=True, exitp=False):
     :param task: Task object
     :param stop_on_error: Stop task when any error occurs if True
     """
-    stdin = open(os.devnull, "r")
-    stdout = sys.stdout if _debug_mode() else open(os.devnull, "w")
-
     try:
         logging.info("Run: " + str(task))
-        task.proc = subprocess.Popen(
-            task.cmd,
-            bufsize=4096,
-            shell=True,
-            cwd=task.workdir,
-            stdin=stdin,
-            stdout=stdout,
-            stderr=sys.stderr,
-        )
+        task.result = execute(task.cmd, task.workdir, task.timeout,
+                              capture=False)
     except Exception as e:
         if stop_on_error:
             raise
@@ -174,14 +337,7 @@ def do_task(task, stop_on_error=True, exitp=False):
         logging.warn(str(e))
         return -1
 
-    if task.timeout is not None:
-        timer = threading.Timer(task.timeout, _terminate, [task.proc])
-        timer.start()
-
-    task.returncode = task.proc.wait()  # may block forever.
-
-    if task.timeout is not None:
-        timer.cancel()
+    task.returncode = task.result.rc
 
     sys.stdout.flush()
     sys.stderr.flush()
@@ -198,50 +354,416 @@ def do_task(task, stop_on_error=True, exitp=False):
 def run(cmd, user=None, host="localhost", workdir=os.curdir, timeout=None,
         stop_on_error=False):
     """
+    Run the command directly in a child process, see :function:`execute`.
+
     :param stop_on_error: Do not catch exceptions of errors if true
+    :return: Return code of the command
     """
-    task = Task(cmd, user, host, workdir, timeout)
-    proc = multiprocessing.Process(target=do_task,
-                                   args=(task, stop_on_error, True))
+    return do_task(Task(cmd, user, host, workdir, timeout), stop_on_error)
 
-    try:
-        proc.start()
 
-        if timeout is None:
-            proc.join()
+class _Job(object):
+    """
+    Task running in :class:`_Pool`.
+    """
+
+    def __init__(self, key, task, logdir=None):
+        self.key = key
+        self.task = task
+        self.start = time.time()
+        self.deadline = None
+        if task.timeout is not None:
+            self.deadline = self.start + task.timeout
+        self.kill_at = None  # Time to send SIGKILL after SIGTERM.
+        self.timedout = False
+
+        if logdir is None:
+            out = None if _debug_mode() else open(os.devnull, "w")
         else:
-            proc.join(timeout)
+            logfile = os.path.join(logdir, "%s.log" % key)
+            out = open(logfile, "w")
+            task.logfile = logfile
+
+        try:
+            logging.info("Run: " + str(task))
+            task.proc = _spawn(task.cmd, task.workdir, out,
+                               None if logdir is None else subprocess.STDOUT)
+        finally:
+            if out is not None:
+                out.close()
+
+    def poll(self, now):
+        """
+        Check if the task finished and terminate it if it's timed out.
 
-    # TODO:
-    # except KeyboardInterrupt:
-    #   do_somthing ...
-    finally:
-        if proc.is_alive():
-            proc.terminate()
-            proc.join()
+        :return: True if it's finished
+        """
+        (pid, status, rusage) = _retry_on_eintr(os.wait4, self.task.proc.pid,
+                                                os.WNOHANG)
+        if pid:
+            self.finish(status, rusage)
+            return True
+
+        if self.kill_at is not None and now >= self.kill_at:
+            self.kill_at = None
+            self.signal(signal.SIGKILL)
+
+        elif self.deadline is not None and now >= self.deadline:
+            logging.warn("Timed out and terminate: %s", self.task)
+            (self.deadline, self.kill_at) = (None, now + KILL_TIMEOUT)
+            self.timedout = True
+            self.signal(signal.SIGTERM)
+
+        return False
+
+    def signal(self, sig):
+        try:
+            os.kill(self.task.proc.pid, sig)
+        except OSError:
+            pass  # It's finished already.
+
+    def finish(self, status, rusage):
+        task = self.task
+        task.returncode = task.proc.returncode = _returncode(status)
+        task.result = Result(task.cmd, task.returncode,
+                             duration=time.time() - self.start,
+                             rusage=rusage, timedout=self.timedout)
+        task.proc = None  # It's reaped already and not needed any more.
+
+
+def _failed(task, exc):
+    logging.warn("Could not run: %s: %s", task, exc)
+    task.returncode = -1
+    task.result = Result(task.cmd, -1)
+    return task
+
+
+class _Pool(object):
+    """
+    Tasks running in child processes watched in this process without extra
+    processes or threads.
+    """
+
+    def __init__(self, maxjobs=None, logdir=None):
+        """
+        :param maxjobs: Max number of tasks run at once or None (number of
+            CPUs)
+        :param logdir: Dir to save outputs of tasks as <logdir>/<key>.log or
+            None
+        """
+        if maxjobs is None:
+            maxjobs = multiprocessing.cpu_count()
+
+        if logdir is not None and not os.path.exists(logdir):
+            os.makedirs(logdir)
+
+        self.maxjobs = maxjobs
+        self.logdir = logdir
+        self.running = []
+        self._delay = 0.0005
+
+    def full(self):
+        return len(self.running) >= self.maxjobs
 
-            _cleanup_process(proc.pid)
+    def start(self, key, task):
+        """
+        Start the task. IOError or OSError will be raised if failed.
+        """
+        self.running.append(_Job(key, task, self.logdir))
 
-    rc = proc.exitcode
-    if rc != 0 and stop_on_error:
-        raise TaskError(rc)
+    def wait(self):
+        """
+        Wait for a while for some tasks finished if not any.
 
-    return rc
+        :return: A list of (key, task) finished
+        """
+        now = time.time()
+        done = [j for j in self.running if j.poll(now)]
+        for job in done:
+            self.running.remove(job)
 
+        if done:
+            self._delay = 0.0005
+        elif self.running:
+            time.sleep(self._delay)
+            self._delay = min(self._delay * 2, 0.05)
 
-def prun(tasks):
+        return [(j.key, j.task) for j in done]
+
+    def kill(self):
+        """
+        Kill tasks still running.
+        """
+        for job in self.running:
+            job.signal(signal.SIGKILL)
+            job.finish(*_wait(job.task.proc.pid))
+        self.running = []
+
+
+def prun_g(tasks, maxjobs=None, logdir=None, ordered=False):
     """
+    Run tasks in parallel in child processes directly and yield these
+    finished. Processes are watched in this process without extra processes
+    or threads, and outputs of each task are saved to <logdir>/<index>.log
+    if `logdir` is given.
+
     :param tasks: Task objects
+    :param maxjobs: Max number of tasks run at once or None (number of CPUs)
+    :param logdir: Dir to save outputs of tasks or None
+    :param ordered: Yield tasks in the same order as `tasks` if True or in
+        the order these are finished
+    :return: A generator yields Task objects finished, see Task.result
+
+    >>> tasks = [Task("sleep 0.%d" % i, timeout=5) for i in (3, 1)]
+    >>> [t.cmd for t in prun_g(tasks, 2)]
+    ['sleep 0.1', 'sleep 0.3']
+    >>> [t.cmd for t in prun_g(tasks, 2, ordered=True)]
+    ['sleep 0.3', 'sleep 0.1']
     """
-    def pool_initializer():
-        logging.info("Starting: " + multiprocessing.current_process().name)
+    pool = _Pool(maxjobs, logdir)
+    pending = list(enumerate(tasks))[::-1]  # Pop from the tail.
+    done = dict()  # {idx: task} not yielded yet if ordered.
+    nexti = 0
+    try:
+        while pending or pool.running:
+            while pending and not pool.full():
+                (idx, task) = pending.pop()
+                try:
+                    pool.start(idx, task)
+                except (OSError, IOError) as exc:
+                    done[idx] = _failed(task, exc)
+
+            done.update(pool.wait())
+
+            if ordered:
+                while nexti in done:
+                    yield done.pop(nexti)
+                    nexti += 1
+            else:
+                for idx in sorted(done):
+                    yield done.pop(idx)
+    finally:
+        pool.kill()  # Stopped before all tasks finished.
 
-    pool = multiprocessing.Pool(initializer=pool_initializer)
-    results = pool.map(do_task, tasks)
-    pool.close()
-    pool.join()
 
-    return results
+def prun(tasks, maxjobs=None, logdir=None, stop_on_error=True):
+    """
+    :param tasks: Task objects
+    :param maxjobs: Max number of tasks run at once or None (number of CPUs)
+    :param logdir: Dir to save outputs of tasks or None
+    :param stop_on_error: Raise TaskError after all tasks finished if any of
+        them failed, like :function:`do_task`, if True
+    :return: A list of return codes of tasks in the same order as `tasks`
+    """
+    rcs = [task.rc() for task in prun_g(tasks, maxjobs, logdir, True)]
+    if stop_on_error:
+        for rc in rcs:
+            if rc != 0:
+                raise TaskError(rc)
+
+    return rcs
+
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"  # Outputs are up to date.
+CANCELED = "canceled"  # Some of dependencies failed.
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def is_up_to_date(inputs, outputs):
+    """
+    :param inputs: A list of paths of input files
+    :param outputs: A list of paths of output files
+    :return: True if all outputs exist and newer than all inputs exist
+
+    >>> is_up_to_date([], [])
+    False
+    >>> is_up_to_date([], ["/not/exist"])
+    False
+    >>> is_up_to_date(["/not/exist"], [__file__])
+    True
+    """
+    omtimes = [_mtime(o) for o in outputs]
+    if not omtimes or None in omtimes:
+        return False
+
+    imtimes = [m for m in (_mtime(i) for i in inputs) if m is not None]
+    return not imtimes or max(imtimes) <= min(omtimes)
+
+
+class _Node(object):
+
+    def __init__(self, name, task, deps=(), inputs=(), outputs=()):
+        self.name = name
+        self.task = task
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.state = None
+
+
+class Graph(object):
+    """
+    DAG of tasks with dependencies. Tasks are run in parallel as soon as
+    tasks they depend on are done, and skipped if their outputs are up to
+    date. Tasks depend on failed ones are canceled.
+
+    >>> g = Graph()
+    >>> g.add("a", Task("true"))
+    >>> g.add("b", Task("false"), deps=["a"])
+    >>> g.add("c", Task("true"), deps=["b"])
+    >>> g.add("d", Task("true"), deps=["a"])
+    >>> sorted(g.run(2).items())
+    [('a', 'done'), ('b', 'failed'), ('c', 'canceled'), ('d', 'done')]
+    """
+
+    def __init__(self):
+        self.nodes = collections.OrderedDict()  # {name: _Node}
+
+    def add(self, name, task, deps=(), inputs=(), outputs=()):
+        """
+        :param name: Task name, must be unique in the graph
+        :param task: Task object
+        :param deps: Names of tasks this task depends on
+        :param inputs: Paths of input files of this task
+        :param outputs: Paths of output files of this task. The task is
+            skipped if all of them exist and newer than inputs.
+        """
+        if name in self.nodes:
+            raise ValueError("Task already exists: " + name)
+
+        self.nodes[name] = _Node(name, task, deps, inputs, outputs)
+
+    def toposort(self):
+        """
+        :return: A list of names of tasks sorted topologically
+        :throw: ValueError if there are unknown dependencies or cycles
+
+        >>> g = Graph()
+        >>> g.add("a", Task("true"), deps=["b"])
+        >>> g.add("b", Task("true"))
+        >>> g.toposort()
+        ['b', 'a']
+        >>> g.add("c", Task("true"), deps=["c"])
+        >>> g.toposort()
+        Traceback (most recent call last):
+        ValueError: Cycle(s) found in tasks: c
+        """
+        nrefs = dict()
+        rdeps = dict((n, []) for n in self.nodes)
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError("Unknown dependency of %s: %s" %
+                                     (node.name, dep))
+                rdeps[dep].append(node.name)
+            nrefs[node.name] = len(set(node.deps))
+
+        res = []
+        ready = [n for n in self.nodes if not nrefs[n]]
+        while ready:
+            name = ready.pop(0)
+            res.append(name)
+            for rdep in U.uniq(rdeps[name]):
+                nrefs[rdep] -= 1
+                if not nrefs[rdep]:
+                    ready.append(rdep)
+
+        if len(res) < len(self.nodes):
+            raise ValueError("Cycle(s) found in tasks: " +
+                             ", ".join(n for n in self.nodes if nrefs[n]))
+        return res
+
+    def run_g(self, maxjobs=None, logdir=None, stop_on_error=False):
+        """
+        Run tasks and yield nodes of tasks finished, skipped or canceled.
+
+        :param maxjobs: Max number of tasks run at once or None (number of
+            CPUs)
+        :param logdir: Dir to save outputs of tasks as <logdir>/<name>.log
+            or None
+        :param stop_on_error: Cancel all tasks not started yet if any tasks
+            failed
+        :return: A generator yields (name, state, task)
+        """
+        self.toposort()
+
+        rdeps = dict((n, []) for n in self.nodes)
+        waiting = dict()  # {name: set(names of dependencies not done)}
+        for node in self.nodes.values():
+            node.state = None
+            waiting[node.name] = set(node.deps)
+            for dep in waiting[node.name]:
+                rdeps[dep].append(node.name)
+
+        ready = collections.deque(n for n in self.nodes if not waiting[n])
+        pool = _Pool(maxjobs, logdir)
+        (done, failed) = ([], [])
+
+        def finish(name, state):
+            self.nodes[name].state = state
+            done.append(name)
+            if state == FAILED:
+                failed.append(name)
+            if state in (DONE, SKIPPED):
+                for rdep in rdeps[name]:
+                    waiting[rdep].discard(name)
+                    if not waiting[rdep]:
+                        ready.append(rdep)
+            else:
+                for rdep in rdeps[name]:
+                    if self.nodes[rdep].state is None:
+                        finish(rdep, CANCELED)
+
+        try:
+            while ready or pool.running:
+                if stop_on_error and failed:
+                    while ready:
+                        finish(ready.popleft(), CANCELED)
+
+                while ready and not pool.full():
+                    node = self.nodes[ready.popleft()]
+                    if node.state is not None:
+                        continue
+
+                    if is_up_to_date(node.inputs, node.outputs):
+                        logging.info("Skip as up to date: %s", node.name)
+                        finish(node.name, SKIPPED)
+                        continue
+
+                    try:
+                        pool.start(node.name, node.task)
+                    except (OSError, IOError) as exc:
+                        _failed(node.task, exc)
+                        finish(node.name, FAILED)
+
+                for name, task in pool.wait():
+                    finish(name, DONE if task.rc() == 0 else FAILED)
+
+                for name in done:
+                    yield (name, self.nodes[name].state,
+                           self.nodes[name].task)
+                done[:] = []
+        finally:
+            pool.kill()  # Stopped before all tasks finished.
+
+    def run(self, maxjobs=None, logdir=None, stop_on_error=False):
+        """
+        Run tasks, see :meth:`run_g`.
+
+        :return: A dict of {name: state}
+        """
+        for _res in self.run_g(maxjobs, logdir, stop_on_error):
+            pass
+
+        return dict((n, node.state) for n, node in self.nodes.items())
 
 
 if __name__ == '__main__':
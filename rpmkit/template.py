@@ -1,25 +1,41 @@
 """
 Subset of jinja2_cli.render from https://github.com/ssato/python-jinja2-cli
+
+Jinja2 environments are shared per template search paths and compiled
+templates are cached on disk (see :function:`tmpl_env`). Templates shipped
+can be precompiled at install time:
+
+  $ python -m rpmkit.template -C /var/cache/rpmkit/templates \\
+      /usr/share/rpmkit/templates
+
+NOTE: Importing this module no longer calls sys.setdefaultencoding() nor
+wraps sys.stdout and sys.stderr with writers in the locale's encoding, so
+callers printing rendered (unicode) text must encode it by themselves, e.g.
+with :function:`render_to` or codecs.getwriter(ENCODING)(sys.stdout).
 """
+from __future__ import print_function
 from jinja2.exceptions import TemplateNotFound
+from rpmkit.globals import RPMKIT_TEMPLATE_PATH
 
 import codecs
+import io
 import jinja2
 import locale
+import logging
+import optparse
 import os.path
 import os
 import sys
+import tempfile
 
 
 ENCODING = locale.getdefaultlocale()[1] or "UTF-8"
 
-# pylint: disable=no-member
-reload(sys)
-sys.setdefaultencoding(ENCODING.lower())
-# pylint: enable=no-member
+SYSTEM_CACHEDIR = "/var/cache/rpmkit/templates"
+
+STREAM_BUFSIZE = 64  # Number of template items rendered at once.
+IO_BUFSIZE = 1 << 16
 
-sys.stdout = codecs.getwriter(ENCODING)(sys.stdout)
-sys.stderr = codecs.getwriter(ENCODING)(sys.stderr)
 open = codecs.open
 
 
@@ -51,11 +67,91 @@ def chaincalls(callables, x):
     return x
 
 
-def tmpl_env(paths):
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Bytecode cache ignores errors to save compiled templates, e.g. the cache
+    dir is shared and not writable.
+    """
+
+    def dump_bytecode(self, bucket):
+        try:
+            super(BytecodeCache, self).dump_bytecode(bucket)
+        except (IOError, OSError):
+            pass
+
+
+def default_cachedir():
+    """
+    :return: Dir to cache compiled templates in. It's given by the env var
+        RPMKIT_TEMPLATE_CACHEDIR, or the system cache dir templates shipped
+        are precompiled in if it's available, or the user's cache dir
     """
+    cachedir = os.environ.get("RPMKIT_TEMPLATE_CACHEDIR")
+    if cachedir:
+        return cachedir
+
+    if os.access(SYSTEM_CACHEDIR, os.R_OK | os.X_OK):
+        return SYSTEM_CACHEDIR
+
+    xdgdir = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.expanduser("~/.cache")
+    return os.path.join(xdgdir, "rpmkit", "templates")
+
+
+def _bytecode_cache(cachedir):
+    if not os.path.exists(cachedir):
+        try:
+            os.makedirs(cachedir)
+        except OSError:
+            return None  # Templates are not cached on disk.
+
+    return BytecodeCache(cachedir)
+
+
+# Environments shared: {(search paths, cachedir): jinja2.Environment}
+_ENVS = dict()
+
+_MAX_STRING_TEMPLATES = 400  # Same as the default size of Environment.cache
+
+
+def tmpl_env(paths, cachedir=None):
+    """
+    Get the environment shared among renderings with the same template
+    search paths, so that templates are compiled once in a process and
+    their bytecodes are cached on disk across processes.
+
     :param paths: Template search paths
+    :param cachedir: Dir to cache compiled templates or None (default)
+
+    >>> tmpl_env(["/tmp"]) is tmpl_env(("/tmp", ))
+    True
     """
-    return jinja2.Environment(loader=jinja2.FileSystemLoader(paths))
+    if cachedir is None:
+        cachedir = default_cachedir()
+
+    key = (tuple(os.path.abspath(p) for p in paths), cachedir)
+    env = _ENVS.get(key)
+    if env is None:
+        env = jinja2.Environment(loader=jinja2.FileSystemLoader(key[0]),
+                                 bytecode_cache=_bytecode_cache(cachedir))
+        env.string_templates = dict()
+        _ENVS[key] = env
+
+    return env
+
+
+def _from_string(env, tmpl_s):
+    """
+    Compile the template string once and memoize it in the environment.
+    """
+    tmpl = env.string_templates.get(tmpl_s)
+    if tmpl is None:
+        if len(env.string_templates) >= _MAX_STRING_TEMPLATES:
+            env.string_templates.clear()
+
+        tmpl = env.string_templates[tmpl_s] = env.from_string(tmpl_s)
+
+    return tmpl
 
 
 def render_s(tmpl_s, ctx, paths=[os.curdir]):
@@ -69,7 +165,7 @@ def render_s(tmpl_s, ctx, paths=[os.curdir]):
     >>> s = render_s('a = {{ a }}, b = "{{ b }}"', {'a': 1, 'b': 'bbb'})
     >>> assert s == 'a = 1, b = "bbb"'
     """
-    return tmpl_env(paths).from_string(tmpl_s).render(**ctx)
+    return _from_string(tmpl_env(paths), tmpl_s).render(**ctx)
 
 
 def render_impl(filepath, ctx, paths):
@@ -78,8 +174,35 @@ def render_impl(filepath, ctx, paths):
     :param ctx: Context dict needed to instantiate templates
     :param paths: Template search paths
     """
-    env = tmpl_env(paths)
-    return env.get_template(os.path.basename(filepath)).render(**ctx)
+    return get_template(filepath, paths).render(**ctx)
+
+
+def get_template(filepath, paths, ask=False):
+    """
+    :param filepath: (Base) filepath of template file or '-' (stdin)
+    :param paths: Template search paths
+    :param ask: Ask user for missing template location if True
+    :return: jinja2.Template object
+    """
+    if filepath == '-':
+        return _from_string(tmpl_env(paths), sys.stdin.read())
+
+    try:
+        return tmpl_env(paths).get_template(os.path.basename(filepath))
+    except TemplateNotFound as mtmpl:
+        if not ask:
+            raise RuntimeError("Template Not found: " + str(mtmpl))
+
+        usr_tmpl = raw_input(
+            "\n*** Missing template '%s'. "
+            "Please enter absolute or relative path starting from "
+            "'.' to the template file: " % mtmpl
+        )
+        usr_tmpl = normpath(usr_tmpl.strip())
+        usr_tmpldir = os.path.dirname(usr_tmpl)
+
+        return tmpl_env(paths + [usr_tmpldir]).get_template(
+            os.path.basename(usr_tmpl))
 
 
 def render(filepath, ctx, paths, ask=False):
@@ -94,23 +217,82 @@ def render(filepath, ctx, paths, ask=False):
     :param paths: Template search paths
     :param ask: Ask user for missing template location if True
     """
-    if filepath == '-':
-        return render_s(sys.stdin.read(), ctx, paths)
-    else:
+    return get_template(filepath, paths, ask).render(**ctx)
+
+
+def render_to(filepath, ctx, paths, output, ask=False, encoding="utf-8",
+              bufsize=STREAM_BUFSIZE):
+    """
+    Render template and write the result into the file in chunks, so that
+    the whole result is not held in memory. The output file is replaced
+    atomically after rendered successfully.
+
+    :param filepath: (Base) filepath of template file or '-' (stdin)
+    :param ctx: Context dict needed to instantiate templates
+    :param paths: Template search paths
+    :param output: Output file path
+    :param ask: Ask user for missing template location if True
+    :param encoding: Encoding of the output
+    :param bufsize: Number of template items to buffer before writing
+    """
+    stream = get_template(filepath, paths, ask).stream(**ctx)
+    stream.enable_buffering(bufsize)
+
+    outdir = os.path.dirname(os.path.abspath(output))
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    # Make the temporary file unique not to conflict with others rendering
+    # to the same output at the same time.
+    (fd, tmp) = tempfile.mkstemp(dir=outdir,
+                                 prefix=".%s." % os.path.basename(output))
+    umask = os.umask(0)
+    os.umask(umask)
+    try:
+        with io.open(fd, "wb", buffering=IO_BUFSIZE) as out:
+            os.fchmod(fd, 0o666 & ~umask)  # mkstemp makes it 0600.
+            stream.dump(out, encoding)
+        os.rename(tmp, output)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def precompile(paths=(RPMKIT_TEMPLATE_PATH, ), cachedir=SYSTEM_CACHEDIR):
+    """
+    Compile templates under the search paths and cache their bytecodes, e.g.
+    templates shipped at install time.
+
+    :param paths: Template search paths
+    :param cachedir: Dir to cache compiled templates
+    :return: A list of names of templates compiled
+    """
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir)
+
+    env = tmpl_env(paths, cachedir)
+    res = []
+    for name in env.list_templates(filter_func=lambda n: n.endswith(".j2")):
         try:
-            return render_impl(filepath, ctx, paths)
-        except TemplateNotFound as mtmpl:
-            if not ask:
-                raise RuntimeError("Template Not found: " + str(mtmpl))
-
-            usr_tmpl = raw_input(
-                "\n*** Missing template '%s'. "
-                "Please enter absolute or relative path starting from "
-                "'.' to the template file: " % mtmpl
-            )
-            usr_tmpl = normpath(usr_tmpl.strip())
-            usr_tmpldir = os.path.dirname(usr_tmpl)
-
-            return render_impl(usr_tmpl, ctx, paths + [usr_tmpldir])
+            env.get_template(name)
+            res.append(name)
+        except jinja2.TemplateSyntaxError as exc:
+            logging.warn("Could not compile: %s: %s", name, exc)
+
+    return res
+
+
+def main(argv=None):
+    p = optparse.OptionParser("%prog [OPTION ...] [TEMPLATE_PATH ...]")
+    p.add_option("-C", "--cachedir", default=SYSTEM_CACHEDIR,
+                 help="Dir to cache compiled templates [%default]")
+    (options, args) = p.parse_args(argv)
+
+    for name in precompile(args or [RPMKIT_TEMPLATE_PATH], options.cachedir):
+        print("Compiled: " + name)
+
+
+if __name__ == '__main__':
+    main()
 
 # vim:sw=4:ts=4:et:
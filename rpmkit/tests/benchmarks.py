@@ -0,0 +1,82 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.benchmarks.runner as TT
+import rpmkit.benchmarks.scale as TS
+import rpmkit.tests.common as C
+import rpmkit.utils as U
+
+import glob
+import gzip
+import hashlib
+import os.path
+import unittest
+import xml.etree.ElementTree as ET
+
+
+class Test_10_run(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_run(self):
+        res = TT.run(["utils.*"], repeat=2, number=1)
+        self.assertEquals(sorted(res["results"].keys()),
+                          ["utils.flatten", "utils.select_from_list",
+                           "utils.uniq"])
+        for bres in res["results"].values():
+            self.assertTrue(bres["min"] <= bres["median"])
+
+    def test_20_main__output_and_compare(self):
+        output = os.path.join(self.workdir, "bench.json")
+        args = ["-r", "1", "-n", "1", "utils.uniq"]
+
+        self.assertEquals(TT.main(args + ["-o", output]), 0)
+        res = U.json_load(output)
+        self.assertEquals(list(res["results"].keys()), ["utils.uniq"])
+        self.assertTrue("python" in res["meta"])
+
+        self.assertEquals(TT.main(args + ["-c", output, "-t", "1000"]), 0)
+
+
+class Test_20_make_repo(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_make_repo(self):
+        (_ips, pkgs, errata) = TS.make_catalog(50, 30)
+        TS.make_repo(self.workdir, pkgs, errata)
+
+        repodatadir = os.path.join(self.workdir, "repodata")
+        repomd = ET.parse(os.path.join(repodatadir, "repomd.xml"))
+        ns = "{http://linux.duke.edu/metadata/repo}"
+        datas = repomd.findall(ns + "data")
+        self.assertEquals(sorted(d.get("type") for d in datas),
+                          ["filelists", "other", "primary", "updateinfo"])
+
+        for data in datas:
+            path = os.path.join(self.workdir, data.find(ns + "location")
+                                .get("href"))
+            with open(path, "rb") as inp:
+                self.assertEquals(hashlib.sha256(inp.read()).hexdigest(),
+                                  data.find(ns + "checksum").text)
+
+        path = glob.glob(os.path.join(repodatadir, "*-updateinfo.xml.gz"))[0]
+        updates = ET.parse(gzip.open(path)).getroot().findall("update")
+        self.assertEquals(len(updates), 30)
+        self.assertEquals(updates[0].find("id").text, errata[0]["advisory"])
+
+        path = glob.glob(os.path.join(repodatadir, "*-primary.xml.gz"))[0]
+        ns = "{http://linux.duke.edu/metadata/common}"
+        self.assertEquals(len(ET.parse(gzip.open(path)).getroot()
+                              .findall(ns + "package")), len(pkgs))
+
+# vim:sw=4:ts=4:et:
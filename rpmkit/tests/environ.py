@@ -16,6 +16,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import rpmkit.environ as E
+import rpmkit.tests.common as C
+
+import os.path
+import os
+import subprocess
 import unittest
 
 
@@ -57,4 +62,105 @@ class Test_00(unittest.TestCase):
         self.assertEquals(len(x), 2)
 
 
+_GITCONFIG = r"""
+# comment
+[user]
+    name = "John  Doe" ; comment
+    email = jdoe@example.com
+[Remote "origin"]
+    URL = git://example.com/\
+a.git
+[alias]
+    lg = "log --format=\"%h\\t%s\""
+[include]
+    path = inc.conf
+[includeIf "gitdir:~/work/"]
+    path = ~/work.conf
+"""
+
+
+class Test_10_git_config(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.env = dict(os.environ)
+        os.environ.update(HOME=self.workdir, GIT_CONFIG_NOSYSTEM="1",
+                          XDG_CONFIG_HOME=os.path.join(self.workdir, "xdg"))
+        for key in ("GIT_DIR", "GIT_CONFIG_GLOBAL"):
+            os.environ.pop(key, None)
+
+        self.write(".gitconfig", _GITCONFIG)
+        self.write("inc.conf", "[core]\n  editor = vi\n")
+        self.write("work.conf", "[user]\n  email = jdoe@work.example.com\n")
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.env)
+        C.cleanup_workdir(self.workdir)
+
+    def write(self, path, content):
+        path = os.path.join(self.workdir, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').write(content)
+        return path
+
+    def test_10_parse_git_config(self):
+        res = dict(E.parse_git_config(_GITCONFIG))
+        self.assertEquals(res["user.name"], "John  Doe")
+        self.assertEquals(res["remote.origin.url"],
+                          "git://example.com/a.git")
+        self.assertEquals(res["alias.lg"], 'log --format="%h\\t%s"')
+
+    def test_20_git_config_get(self):
+        self.assertEquals(E.git_config_get("user.name", self.workdir),
+                          "John  Doe")
+        self.assertEquals(E.git_config_get("core.editor", self.workdir), "vi")
+        self.assertEquals(E.git_config_get("user.email", self.workdir),
+                          "jdoe@example.com")
+        self.assertTrue(E.git_config_get("user.signingkey",
+                                         self.workdir) is None)
+
+    def test_30_git_config_get__repo_and_include_if(self):
+        repodir = os.path.join(self.workdir, "work", "a")
+        self.write("work/a/.git/config", "[user]\n  name = J. Doe\n")
+        self.write("xdg/git/config", "[user]\n  name = X\n  signingkey = K\n")
+
+        self.assertEquals(E.find_gitdir(os.path.join(repodir, "b")),
+                          os.path.join(repodir, ".git"))
+        self.assertEquals(E.git_config_get("user.name", repodir), "J. Doe")
+        self.assertEquals(E.git_config_get("user.email", repodir),
+                          "jdoe@work.example.com")
+        self.assertEquals(E.git_config_get("user.signingKey", repodir), "K")
+
+    def test_40_git_config_get__updated(self):
+        self.assertEquals(E.git_config_get("core.editor", self.workdir), "vi")
+
+        path = self.write("inc.conf", "[core]\n  editor = emacs\n")
+        mtime = os.stat(path).st_mtime + 1
+        os.utime(path, (mtime, mtime))
+        self.assertEquals(E.git_config_get("core.editor", self.workdir),
+                          "emacs")
+
+    def test_50_git_config_get__same_as_git(self):
+        if not E.is_git_available():
+            return
+
+        for key in ("user.name", "user.email", "remote.origin.url",
+                    "alias.lg", "core.editor"):
+            out = subprocess.Popen(["git", "config", "--get", key],
+                                   cwd=self.workdir, stdout=subprocess.PIPE
+                                   ).communicate()[0]
+            self.assertEquals(E.git_config_get(key, self.workdir),
+                              out.decode("utf-8").rstrip("\n"))
+
+    def test_60_get_email(self):
+        curdir = os.getcwd()
+        try:
+            os.chdir(self.workdir)
+            self.assertEquals(E.get_email(), "jdoe@example.com")
+            self.assertEquals(E.get_fullname(), "John  Doe")
+        finally:
+            os.chdir(curdir)
+
 # vim:sw=4 ts=4 et:
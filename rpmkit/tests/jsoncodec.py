@@ -0,0 +1,56 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014 Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.jsoncodec as TT
+import rpmkit.tests.common as C
+
+import os.path
+import unittest
+
+
+class Test_10_load_and_dump(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.path = os.path.join(self.workdir, "errata.json")
+        self.data = dict(data=[dict(advisory="RHSA-2014:0001", id=1,
+                                    title=u"テスト")])
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_dump_and_load__uncompressed(self):
+        self.assertEquals(TT.dump(self.data, self.path), self.path)
+        self.assertEquals(TT.load(self.path), self.data)
+
+    def test_20_dump_and_load__compressed(self):
+        for comp in ("gz", "xz"):
+            path = TT.dump(self.data, self.path, comp)
+            self.assertEquals(path, self.path + '.' + comp)
+            self.assertEquals(TT.load(path), self.data)
+            self.assertEquals(TT.load(self.path), self.data)
+            self.assertEquals(TT.find_file(self.path), path)
+
+    def test_30_dump__remove_old_files(self):
+        TT.dump(self.data, self.path)
+        path = TT.dump(self.data, self.path, "gz")
+        self.assertFalse(os.path.exists(self.path))
+
+        TT.dump(self.data, self.path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEquals(TT.find_file(self.path), self.path)
+
+    def test_40_dump__default_compression(self):
+        try:
+            TT.set_default_compression("gz")
+            path = TT.dump(self.data, self.path, True)
+            self.assertEquals(path, self.path + ".gz")
+        finally:
+            TT.set_default_compression(None)
+
+        self.assertEquals(TT.dump(self.data, self.path, True), self.path)
+
+# vim:sw=4:ts=4:et:
@@ -18,11 +18,11 @@ from __future__ import print_function
 
 import rpmkit.environ as E
 import rpmkit.shell as SH
+import rpmkit.tests.common as C
 import rpmkit.utils as U
 import logging
 import os
 import os.path
-import subprocess
 import sys
 import unittest
 
@@ -45,19 +45,6 @@ class Test_00_functions(unittest.TestCase):
         logging.getLogger().setLevel(logging.INFO)
         self.assertFalse(SH._debug_mode())
 
-    def test_10__terminate__not_terminated(self):
-        p = subprocess.Popen("true", shell=True)
-        p.wait()
-        self.assertEquals(SH._terminate(p), 0)
-
-    def test_11__terminate__terminated(self):
-        try:
-            p = subprocess.Popen("sleep 10", shell=True)
-            p.poll()
-            self.assertNotEquals(SH._terminate(p), 0)
-        except OSError:
-            pass  # It looks that test failes in docker.
-
 
 class Test_10_Task(unittest.TestCase):
 
@@ -154,6 +141,32 @@ class Test_20_do_task(unittest.TestCase):
         self.assertNotEquals(SH.do_task(task, stop_on_error=False), 0)
 
 
+class Test_25_execute(unittest.TestCase):
+
+    def test_00_execute(self):
+        res = SH.execute("echo OK", timeout=10)
+        self.assertEquals(res.rc, 0)
+        self.assertEquals(res.stdout, "OK\n")
+        self.assertFalse(res.timedout)
+        self.assertTrue(res.maxrss > 0)
+
+    def test_10_execute__error(self):
+        res = SH.execute("echo NG >&2; exit 3", workdir="/tmp")
+        self.assertEquals(res.rc, 3)
+        self.assertEquals(res.stderr, "NG\n")
+
+    def test_20_execute__timeout(self):
+        res = SH.execute("sleep 10", timeout=1)
+        self.assertNotEquals(res.rc, 0)
+        self.assertTrue(res.timedout)
+        self.assertTrue(res.duration < 5)
+
+    def test_30_execute__not_captured(self):
+        res = SH.execute("true", capture=False)
+        self.assertEquals(res.rc, 0)
+        self.assertTrue(res.stdout is None)
+
+
 class Test_30_run(unittest.TestCase):
 
     def test_00_run(self):
@@ -190,5 +203,113 @@ class Test_40_prun(unittest.TestCase):
         tasks = [SH.Task("true", timeout=10) for _ in range(PRUN_JOBS)]
         self.assertTrue(all(rc == 0 for rc in SH.prun(tasks)))
 
+    def test_10_prun__w_errors(self):
+        tasks = [SH.Task(c, timeout=10) for c in ("true", "false", "true")]
+        self.assertEquals(SH.prun(tasks, 2, stop_on_error=False), [0, 1, 0])
+
+        with self.assertRaises(SH.TaskError):
+            SH.prun(tasks, 2)
+
+
+class Test_50_prun_g(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_00_prun_g__logdir(self):
+        tasks = [SH.Task("echo %d; echo E >&2" % i, timeout=10)
+                 for i in range(PRUN_JOBS)]
+        logdir = os.path.join(self.workdir, "logs")
+
+        for task in SH.prun_g(tasks, 4, logdir):
+            self.assertEquals(task.rc(), 0)
+            self.assertTrue(task.result.duration >= 0)
+            self.assertTrue(task.proc is None)
+
+        for idx, task in enumerate(tasks):
+            self.assertEquals(open(task.logfile).read(), "%d\nE\n" % idx)
+
+    def test_10_prun_g__timeout(self):
+        tasks = [SH.Task("sleep 10", timeout=1), SH.Task("true", timeout=10)]
+        res = list(SH.prun_g(tasks, 2))
+
+        self.assertEquals([t.cmd for t in res], ["true", "sleep 10"])
+        self.assertTrue(res[1].result.timedout)
+        self.assertNotEquals(res[1].rc(), 0)
+
+    def test_20_prun_g__maxjobs(self):
+        tasks = [SH.Task("sleep 0.3", timeout=10) for _ in range(4)]
+        res = list(SH.prun_g(tasks, 2))
+        self.assertEquals(len(res), 4)
+        self.assertTrue(max(t.result.duration for t in res) < 1.0)
+
+
+class Test_60_Graph(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_run__order(self):
+        out = os.path.join(self.workdir, "out")
+        g = SH.Graph()
+        g.add("c", SH.Task("echo c >> " + out, timeout=10), deps=["a", "b"])
+        g.add("a", SH.Task("sleep 0.2; echo a >> " + out, timeout=10))
+        g.add("b", SH.Task("echo b >> " + out, timeout=10))
+
+        res = list(g.run_g(2))
+        self.assertEquals([r[0] for r in res], ["b", "a", "c"])
+        self.assertEquals(open(out).read(), "b\na\nc\n")
+
+    def test_20_run__skip_if_up_to_date(self):
+        (src, dst) = (os.path.join(self.workdir, "src"),
+                      os.path.join(self.workdir, "dst"))
+        open(src, 'w').write("a\n")
+
+        g = SH.Graph()
+        g.add("copy", SH.Task("cp %s %s" % (src, dst), timeout=10),
+              inputs=[src], outputs=[dst])
+        g.add("check", SH.Task("test -f " + dst, timeout=10),
+              deps=["copy"])
+
+        self.assertEquals(g.run(), dict(copy=SH.DONE, check=SH.DONE))
+        self.assertEquals(g.run(), dict(copy=SH.SKIPPED, check=SH.DONE))
+
+        os.utime(src, (os.stat(dst).st_mtime + 10, ) * 2)
+        self.assertEquals(g.run()["copy"], SH.DONE)
+
+    def test_30_run__failure_propagation(self):
+        g = SH.Graph()
+        g.add("a", SH.Task("false", timeout=10))
+        g.add("b", SH.Task("true", timeout=10), deps=["a"])
+        g.add("c", SH.Task("true", timeout=10), deps=["b"])
+        g.add("d", SH.Task("true", timeout=10))
+
+        self.assertEquals(g.run(1), dict(a=SH.FAILED, b=SH.CANCELED,
+                                         c=SH.CANCELED, d=SH.DONE))
+        self.assertEquals(g.run(1, stop_on_error=True),
+                          dict(a=SH.FAILED, b=SH.CANCELED, c=SH.CANCELED,
+                               d=SH.CANCELED))
+
+    def test_40_run__logdir(self):
+        logdir = os.path.join(self.workdir, "logs")
+        g = SH.Graph()
+        g.add("a", SH.Task("echo a", timeout=10))
+        g.run(logdir=logdir)
+
+        self.assertEquals(open(os.path.join(logdir, "a.log")).read(), "a\n")
+
+    def test_50_add__errors(self):
+        g = SH.Graph()
+        g.add("a", SH.Task("true"), deps=["x"])
+        with self.assertRaises(ValueError):
+            g.add("a", SH.Task("true"))
+        with self.assertRaises(ValueError):
+            g.run()
 
 # vim:sw=4 ts=4 et:
@@ -0,0 +1,89 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.template as TT
+import rpmkit.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_tmpl_env(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.cachedir = os.path.join(self.workdir, "cache")
+        self.cachedir_env = os.environ.get("RPMKIT_TEMPLATE_CACHEDIR")
+        os.environ["RPMKIT_TEMPLATE_CACHEDIR"] = self.cachedir
+        open(os.path.join(self.workdir, "a.j2"), 'w').write("a={{ a }}")
+
+    def tearDown(self):
+        if self.cachedir_env is None:
+            del os.environ["RPMKIT_TEMPLATE_CACHEDIR"]
+        else:
+            os.environ["RPMKIT_TEMPLATE_CACHEDIR"] = self.cachedir_env
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_tmpl_env__shared(self):
+        env = TT.tmpl_env([self.workdir], self.cachedir)
+        self.assertTrue(env is TT.tmpl_env((self.workdir, ), self.cachedir))
+        self.assertTrue(env is not TT.tmpl_env([self.workdir, "/tmp"],
+                                               self.cachedir))
+
+    def test_20_render_impl__bytecode_cached(self):
+        env = TT.tmpl_env([self.workdir])
+        self.assertEquals(TT.render_impl("a.j2", dict(a=1), [self.workdir]),
+                          "a=1")
+        self.assertEquals(len(os.listdir(self.cachedir)), 1)
+
+        env.cache.clear()  # Loaded from the bytecode cache.
+        self.assertEquals(env.get_template("a.j2").render(a=2), "a=2")
+
+    def test_30_precompile(self):
+        open(os.path.join(self.workdir, "b.j2"), 'w').write("{% if %}")
+        res = TT.precompile([self.workdir], self.cachedir)
+
+        self.assertEquals(res, ["a.j2"])
+        self.assertEquals(len(os.listdir(self.cachedir)), 1)
+
+    def test_40_tmpl_env__cachedir_not_writable(self):
+        cachedir = os.path.join(self.workdir, "a.j2", "cache")  # Not a dir.
+        env = TT.tmpl_env([self.workdir], cachedir)
+        self.assertEquals(env.get_template("a.j2").render(a=1), "a=1")
+
+
+class Test_20_render_to(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.umask = os.umask(0o022)
+        tmpl = "{% for x in xs %}{{ x }}\n{% endfor %}"
+        open(os.path.join(self.workdir, "a.j2"), 'w').write(tmpl)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_render_to(self):
+        ctx = dict(xs=range(1000))
+        output = os.path.join(self.workdir, "out", "a.txt")
+        TT.render_to("a.j2", ctx, [self.workdir], output, bufsize=10)
+
+        self.assertEquals(open(output).read(),
+                          TT.render("a.j2", ctx, [self.workdir]))
+        self.assertEquals(os.listdir(os.path.dirname(output)), ["a.txt"])
+        self.assertEquals(os.stat(output).st_mode & 0o777, 0o644)
+
+    def test_20_render_to__failed(self):
+        output = os.path.join(self.workdir, "a.txt")
+        open(output, 'w').write("old")
+
+        self.assertRaises(TypeError, TT.render_to, "a.j2", dict(xs=1),
+                          [self.workdir], output)
+        self.assertEquals(open(output).read(), "old")
+        self.assertEquals(sorted(os.listdir(self.workdir)), ["a.j2", "a.txt"])
+
+# vim:sw=4:ts=4:et:
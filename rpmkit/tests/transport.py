@@ -0,0 +1,91 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+# License: GPLv3+
+#
+import rpmkit.shell as SH
+import rpmkit.transport as TT
+import rpmkit.tests.common as C
+
+import errno
+import os.path
+import unittest
+
+
+def _open_failed(*args, **kwargs):
+    raise IOError(errno.EMFILE, "Too many open files")
+
+
+class Test_10_fanout(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_fanout__batched(self):
+        hosts = ["host-%d.example.com" % i for i in range(5)]
+        tasks = [SH.Task("echo $RK_TRANSPORT_HOST", host=h, timeout=10)
+                 for h in hosts for _i in range(3)]
+        tr = TT.LocalTransport()
+
+        self.assertEquals(TT.fanout(tasks, tr, 2), [0] * len(tasks))
+        self.assertEquals(len(tr.commands), len(hosts))  # A batch per host.
+        for task in tasks:
+            self.assertEquals(task.result.stdout, task.host + "\n")
+
+    def test_20_fanout__not_batched(self):
+        tasks = [SH.Task("true", host="a", timeout=10) for _i in range(3)]
+        tr = TT.LocalTransport()
+
+        self.assertEquals(TT.fanout(tasks, tr, batch=False), [0, 0, 0])
+        self.assertEquals(len(tr.commands), 3)
+
+    def test_30_fanout__errors(self):
+        tasks = [SH.Task(c, host="a", workdir=self.workdir, timeout=10)
+                 for c in ("echo 0; exit 3", "pwd", "false")]
+        logdir = os.path.join(self.workdir, "logs")
+
+        self.assertEquals(TT.fanout(tasks, TT.LocalTransport(),
+                                    logdir=logdir), [3, 0, 1])
+        self.assertEquals(open(tasks[0].logfile).read(), "0\n")
+        self.assertEquals(tasks[1].result.stdout, self.workdir + "\n")
+
+    def test_32_fanout__output_not_end_with_newline(self):
+        tasks = [SH.Task(c, host="a", timeout=10)
+                 for c in ("printf x; false", "printf 'y\\n'", "true")]
+
+        self.assertEquals(TT.fanout(tasks, TT.LocalTransport()), [1, 0, 0])
+        self.assertEquals([t.result.stdout for t in tasks], ["x", "y\n", ""])
+
+    def test_40_fanout__timeout(self):
+        tasks = [SH.Task("sleep 10", host="a", timeout=1),
+                 SH.Task("true", host="a", timeout=1)]
+        rcs = TT.fanout(tasks, TT.LocalTransport())
+
+        self.assertTrue(all(rc != 0 for rc in rcs))
+        self.assertTrue(tasks[0].result.timedout)
+
+    def test_50_fanout__home_workdir(self):
+        tasks = [SH.Task("pwd", host="a", workdir=w, timeout=10)
+                 for w in ("~", "~/", "~")]
+        for batch in (True, False):
+            self.assertEquals(TT.fanout(tasks, TT.LocalTransport(),
+                                        batch=batch), [0, 0, 0])
+            for task in tasks:
+                self.assertEquals(os.path.realpath(task.result.stdout.strip()),
+                                  os.path.realpath(os.path.expanduser("~")))
+
+    def test_60_fanout__not_started(self):
+        tasks = [SH.Task("true", host="a", timeout=10) for _i in range(2)]
+        SH.open = _open_failed  # Could not open log files to start tasks.
+        try:
+            rcs = TT.fanout(tasks, TT.LocalTransport())
+        finally:
+            del SH.open
+
+        self.assertEquals(rcs, [-1, -1])
+        self.assertEquals([t.result.stdout for t in tasks], ['', ''])
+
+# vim:sw=4:ts=4:et:
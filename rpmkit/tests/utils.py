@@ -18,6 +18,8 @@
 import rpmkit.utils as TT
 import functools
 import operator
+import random
+import sys
 import unittest
 
 
@@ -28,6 +30,33 @@ def plus(xs):
     return functools.reduce(operator.add, xs)
 
 
+def lcs_by_full_table(s, t):
+    """The original implementation keeps the full DP table."""
+    (n, m) = (len(s), len(t))
+    dp = [[0 for j in range(m + 1)] for i in range(n + 1)]
+
+    for i, si in enumerate(s):
+        for j, tj in enumerate(t):
+            if si == tj:
+                dp[i + 1][j + 1] = dp[i][j] + 1
+            else:
+                dp[i + 1][j + 1] = max(dp[i][j + 1], dp[i + 1][j])
+
+    result = []
+    (x, y) = (n, m)
+    while x != 0 and y != 0:
+        if dp[x][y] == dp[x - 1][y]:
+            x -= 1
+        elif dp[x][y] == dp[x][y - 1]:
+            y -= 1
+        else:
+            result = [s[x - 1]] + result
+            x -= 1
+            y -= 1
+
+    return ''.join(result) if isinstance(s, str) else result
+
+
 class Test_00(unittest.TestCase):
 
     def test_00_typecheck(self):
@@ -50,8 +79,105 @@ class Test_00(unittest.TestCase):
         self.assertFalse(TT.is_local("repo-server.example.com"))
         self.assertFalse(TT.is_local("127.0.0.1"))  # special case
 
+    def test_30_longest_common_substring(self):
+        names = ["rhel-%d-server-rpms-%d" % (i % 3, i) for i in range(100)]
+        self.assertEquals(TT.longest_common_substring(*names),
+                          "-server-rpms-")
+
+        xss = [[1, 2, 3, 4, 5], (x for x in [0, 2, 3, 4, 1]), [3, 4, 2, 3, 4]]
+        self.assertEquals(TT.longest_common_substring(*xss), [2, 3, 4])
+
+    def test_40_longest_common_subsequence(self):
+        (s, t) = ("abcbdab" * 50, "bdcaba" * 50)
+        lcs = TT.longest_common_subsequence(s, t)
+        for xs in (s, t):
+            ixs = iter(xs)
+            self.assertTrue(all(c in ixs for c in lcs))
+        self.assertEquals(len(lcs),
+                          TT.longest_common_subsequence_length(s, t))
+        self.assertEquals(TT.longest_common_subsequence(list(s), list(t)),
+                          list(lcs))
+
+    def test_42_longest_common_subsequence__same_as_full_table(self):
+        rand = random.Random(0)
+        for i in range(500):
+            (s, t) = (''.join(rand.choice("abc") for _ in
+                              range(rand.randint(0, n)))
+                      for n in (20, 200 if i % 50 == 0 else 20))
+            self.assertEquals(TT.longest_common_subsequence(s, t),
+                              lcs_by_full_table(s, t))
+            self.assertEquals(TT.longest_common_subsequence(t, s),
+                              lcs_by_full_table(t, s))
+
+        (s, t) = ([[c] for c in "abcbdab" * 30], [[c] for c in "bdcaba" * 30])
+        self.assertEquals(TT.longest_common_subsequence(s, t),
+                          lcs_by_full_table(s, t))
+
+    def test_50_select_from_list(self):
+        ref_xs = ["rhel-%d-server-%s-rpms" % (v, k) for v in (6, 7)
+                  for k in ("optional", "extras")]
+        xs = ["rhel-7*", "rhel-6-server-extras-rpms", "*-optional-.*",
+              "(?i)RHEL-6.*", "(x)\\1", "x(y", "nosuch"]
+        self.assertEquals(TT.select_from_list(xs, ref_xs),
+                          ref_xs[2:] + ref_xs[1:2] + ref_xs[0::2] +
+                          ref_xs[:2])
+
     def test_90_pcall(self):
         res = TT.pcall(plus, [(1, 2), (2, 3, 4)], 2)
         self.assertEquals(res, [3, 9])
 
+    def test_92_pcall__executor(self):
+        with TT.Executor(2) as executor:
+            res = TT.pcall(plus, [(1, 2), (2, 3, 4)], executor=executor)
+            self.assertEquals(res, [3, 9])
+
+            res = TT.pcall(plus, [(i, i) for i in range(100)], chunksize=10,
+                           executor=executor)
+            self.assertEquals(res, [i * 2 for i in range(100)])
+
+
+_INITIALIZED = []
+
+
+def _init_worker(x):
+    _INITIALIZED.append(x)
+
+
+def _initialized(_x):
+    return _INITIALIZED
+
+
+class Test_10_Executor(unittest.TestCase):
+
+    def test_10_imap_unordered(self):
+        for threads in (False, True):
+            with TT.Executor(3, threads) as executor:
+                res = executor.imap_unordered(plus, ((i, 1) for i
+                                                     in range(50)))
+                self.assertEquals(sorted(res), list(range(1, 51)))
+
+    def test_20_initializer(self):
+        with TT.Executor(2, initializer=_init_worker,
+                         initargs=("x", )) as executor:
+            res = executor.map(_initialized, range(10), 1)
+            self.assertTrue(all(r == ["x"] for r in res))
+
+
+class Test_20_lazy_import(unittest.TestCase):
+
+    def test_10_lazy_import(self):
+        name = "xml.dom.pulldom"
+        sys.modules.pop(name, None)
+
+        mod = TT.lazy_import(name)
+        self.assertFalse(name in sys.modules)
+        self.assertTrue(mod.PullDOM is not None)
+        self.assertTrue(name in sys.modules)
+        self.assertTrue("PullDOM" in dir(mod))
+
+    def test_20_lazy_import__not_found(self):
+        mod = TT.lazy_import("rpmkit.module_not_exist")
+        with self.assertRaises(ImportError):
+            mod.foo
+
 # vim:sw=4 ts=4 et:
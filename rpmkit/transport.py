@@ -0,0 +1,329 @@
+#
+# Transports to run commands on (remote) hosts.
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Transports to run commands of rpmkit.shell.Task on hosts.
+
+SSHTransport reuses one SSH connection per host with ControlMaster and
+ControlPersist of OpenSSH, so that only the first command to each host pays
+the handshake. :function:`fanout_g` runs tasks on hosts with batching
+commands per host and bounding the number of hosts run commands at once.
+LocalTransport runs commands in the local host instead for testing.
+"""
+import rpmkit.shell as SH
+
+import binascii
+import logging
+import os.path
+import os
+import re
+import shutil
+import tempfile
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+LOG = logging.getLogger(__name__)
+
+CONTROL_PERSIST = 600  # [sec]
+MAX_HOSTS = 32  # Max number of hosts run commands at once.
+
+
+def quote_workdir(workdir):
+    """
+    Quote the working dir except for the leading '~' or '~/' to expand it to
+    the home dir in the host.
+
+    >>> quote_workdir("/tmp/a b")
+    "'/tmp/a b'"
+    >>> quote_workdir("~/a b")
+    "~/'a b'"
+    >>> quote_workdir("~")
+    '~'
+    """
+    if workdir == "~":
+        return workdir
+
+    if workdir.startswith("~/"):
+        return "~/" + quote(workdir[2:])
+
+    return quote(workdir)
+
+
+class Transport(object):
+    """
+    Base class of transports.
+    """
+
+    def command(self, cmd, user, host, workdir=os.curdir):
+        """
+        :param cmd: Command string to run on the host
+        :param user: User to run command
+        :param host: Host to run command
+        :param workdir: Working directory in the host
+        :return: Command string to run it in the local host
+        """
+        raise NotImplementedError("Inherited class must implement this!")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalTransport(Transport):
+    """
+    Transport runs commands in the local host as if these are run in the
+    hosts, for testing. The host is passed in the environment variable
+    RK_TRANSPORT_HOST.
+
+    >>> LocalTransport().command("echo a", "foo", "a.example.com", "/tmp")
+    "cd /tmp && RK_TRANSPORT_HOST=a.example.com sh -c 'echo a'"
+    """
+
+    def __init__(self):
+        self.commands = []  # [(user, host, cmd)]
+
+    def command(self, cmd, user, host, workdir=os.curdir):
+        self.commands.append((user, host, cmd))
+        return "cd %s && RK_TRANSPORT_HOST=%s sh -c %s" % \
+            (quote_workdir(workdir), quote(host), quote(cmd))
+
+
+class SSHTransport(Transport):
+    """
+    Transport runs commands via SSH connections multiplexed per host.
+
+    >>> tr = SSHTransport(control_dir="/tmp/ctl")
+    >>> cmd = tr.command("true", "foo", "a.example.com", "/tmp")
+    >>> "ControlPath=/tmp/ctl/%r@%h:%p" in cmd
+    True
+    >>> cmd.endswith(" foo@a.example.com 'cd /tmp && true'")
+    True
+    """
+
+    def __init__(self, control_dir=None, persist=CONTROL_PERSIST,
+                 connect_timeout=SH.MIN_TIMEOUT, options=()):
+        """
+        :param control_dir: Dir to make control sockets in or None to make a
+            temporary dir removed when closed
+        :param persist: Time in seconds to keep connections opened idle
+        :param connect_timeout: Time out of connections in seconds
+        :param options: Extra options passed to ssh
+        """
+        self._tmpdir = control_dir is None
+        if control_dir is None:
+            control_dir = tempfile.mkdtemp(prefix="rk-ssh-")
+
+        self.control_dir = control_dir
+        self.options = ["-o", "ControlMaster=auto",
+                        "-o", "ControlPath=%s/%%r@%%h:%%p" % control_dir,
+                        "-o", "ControlPersist=%d" % persist,
+                        "-o", "ConnectTimeout=%d" % connect_timeout,
+                        "-o", "BatchMode=yes"] + list(options)
+        self.targets = set()  # [user@host] connected.
+
+    def command(self, cmd, user, host, workdir=os.curdir):
+        target = "%s@%s" % (user, host)
+        self.targets.add(target)
+
+        return ' '.join(["ssh"] + [quote(o) for o in self.options] +
+                        [target, quote("cd %s && %s" %
+                                       (quote_workdir(workdir), cmd))])
+
+    def close(self):
+        """
+        Close connections to hosts.
+        """
+        for target in sorted(self.targets):
+            cmd = ' '.join(["ssh", "-O", "exit"] +
+                           [quote(o) for o in self.options] + [target])
+            res = SH.execute(cmd, timeout=SH.MIN_TIMEOUT)
+            if res.rc != 0:
+                LOG.debug("Could not close the connection: %s", target)
+
+        self.targets.clear()
+        if self._tmpdir and os.path.exists(self.control_dir):
+            shutil.rmtree(self.control_dir)
+
+
+def batch_script(tasks, marker):
+    """
+    Make a script to run commands of tasks in sequence and print outputs
+    and return codes of them delimited by the marker. A newline is printed
+    before the end marker as outputs may not end with newlines.
+
+    :param tasks: Task objects run on the same host
+    :param marker: Marker string to delimit outputs
+    :return: Script string
+
+    >>> tasks = [SH.Task("true", workdir="/tmp"), SH.Task("echo a")]
+    >>> print(batch_script(tasks, "@@X"))
+    echo '@@X 0'; (cd /tmp && true) 2>&1; printf '\\n%s\\n' "@@X 0 $?"
+    echo '@@X 1'; (cd . && echo a) 2>&1; printf '\\n%s\\n' "@@X 1 $?"
+    """
+    return '\n'.join("echo '%s %d'; (cd %s && %s) 2>&1; "
+                     "printf '\\n%%s\\n' \"%s %d $?\"" %
+                     (marker, idx, quote_workdir(task.rworkdir), task.rcmd,
+                      marker, idx) for idx, task in enumerate(tasks))
+
+
+def parse_batch_output(output, marker, ntasks):
+    """
+    :param output: Output of the script :function:`batch_script` made
+    :param marker: Marker string to delimit outputs
+    :param ntasks: Number of tasks in the batch
+    :return: A list of (return code or None if not finished, output) of tasks
+
+    >>> out = "@@X 0\\na\\n\\n@@X 0 0\\n@@X 1\\nb\\n@@X 1 2\\n@@X 2\\nc\\n"
+    >>> parse_batch_output(out, "@@X", 4)
+    [(0, 'a\\n'), (2, 'b'), (None, 'c\\n'), (None, '')]
+    """
+    res = [(None, '') for _i in range(ntasks)]
+    mre = re.compile(r"^%s (\d+)(?: (\d+))?$" % re.escape(marker))
+    (idx, lines) = (None, [])
+    for line in output.splitlines(True):
+        match = mre.match(line.rstrip("\n"))
+        if not match:
+            if idx is not None:
+                lines.append(line)
+            continue
+
+        (idx, rc) = (int(match.group(1)), match.group(2))
+        if rc is None:
+            lines = []
+        elif idx < ntasks:
+            out = ''.join(lines)
+            if out.endswith("\n"):  # Printed before the end marker.
+                out = out[:-1]
+            res[idx] = (int(rc), out)
+            idx = None
+
+    if idx is not None and idx < ntasks:  # Interrupted.
+        res[idx] = (None, ''.join(lines))
+
+    return res
+
+
+def _read(path):
+    """
+    :return: Content of the file or '' if it's not available, e.g. the task
+        could not be started
+    """
+    if path is None or not os.path.exists(path):
+        return ''
+
+    with open(path) as inp:
+        return inp.read()
+
+
+def _write(path, content):
+    with open(path, 'w') as out:
+        out.write(content)
+
+
+def fanout_g(tasks, transport, maxhosts=MAX_HOSTS, logdir=None, batch=True):
+    """
+    Run tasks on hosts via the transport and yield these finished. Tasks on
+    the same host are run in a batch, in a connection, in sequence.
+
+    :param tasks: Task objects
+    :param transport: Transport object to run commands on hosts
+    :param maxhosts: Max number of hosts run commands at once
+    :param logdir: Dir to save outputs of tasks as <logdir>/<index>.log or
+        None. Outputs are also in Task.result.stdout.
+    :param batch: Run tasks on the same host in a batch if True
+    :return: A generator yields Task objects finished
+
+    >>> tasks = [SH.Task("echo $RK_TRANSPORT_HOST", host=h)
+    ...          for h in ("a", "b", "a")]
+    >>> sorted(t.result.stdout for t in fanout_g(tasks, LocalTransport()))
+    ['a\\n', 'a\\n', 'b\\n']
+    """
+    tasks = list(tasks)
+    groups = dict()  # {(user, host): [idx]}
+    for idx, task in enumerate(tasks):
+        groups.setdefault((task.user, task.host), []).append(idx)
+
+    if logdir is not None and not os.path.exists(logdir):
+        os.makedirs(logdir)
+
+    marker = "@@RK-" + binascii.hexlify(os.urandom(8)).decode("ascii")
+    jtasks = []
+    jobs = dict()  # {id(job task): (indices of tasks, batched?)}
+    for (user, host), idxs in sorted(groups.items(), key=lambda g: g[1][0]):
+        if batch and len(idxs) > 1:
+            btasks = [tasks[i] for i in idxs]
+            timeouts = [t.timeout for t in btasks]
+            jtask = SH.Task(batch_script(btasks, marker), user, host,
+                            timeout=(None if None in timeouts else
+                                     sum(timeouts)), transport=transport)
+            jobs[id(jtask)] = (idxs, True)
+            jtasks.append(jtask)
+        else:
+            for idx in idxs:
+                task = tasks[idx]
+                jtask = SH.Task(task.rcmd, user, host, task.rworkdir,
+                                task.timeout, transport)
+                jobs[id(jtask)] = ([idx], False)
+                jtasks.append(jtask)
+
+    tmpdir = tempfile.mkdtemp(prefix="rk-fanout-")
+    try:
+        for jtask in SH.prun_g(jtasks, maxhosts, tmpdir):
+            (idxs, batched) = jobs[id(jtask)]
+            output = _read(jtask.logfile)
+            if batched:
+                results = parse_batch_output(output, marker, len(idxs))
+            else:
+                results = [(jtask.rc(), output)]
+
+            for idx, (rc, out) in zip(idxs, results):
+                task = tasks[idx]
+                task.returncode = jtask.rc() if rc is None else rc
+                task.result = SH.Result(task.cmd, task.returncode, out,
+                                        duration=jtask.result.duration,
+                                        timedout=jtask.result.timedout)
+                if logdir is not None:
+                    task.logfile = os.path.join(logdir, "%d.log" % idx)
+                    _write(task.logfile, out)
+                yield task
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def fanout(tasks, transport, maxhosts=MAX_HOSTS, logdir=None, batch=True):
+    """
+    Run tasks on hosts via the transport, see :function:`fanout_g`.
+
+    :return: A list of return codes of tasks in the same order as `tasks`
+    """
+    tasks = list(tasks)
+    for _task in fanout_g(tasks, transport, maxhosts, logdir, batch):
+        pass
+
+    return [task.rc() for task in tasks]
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,177 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Extract RPM DBs from archives of hosts' data lazily.
+
+Archives of hosts' data, <host>.tar.gz or <host>.tar.xz, are extracted just
+before these hosts are analyzed into the scratch dir (tmpfs if available) and
+removed after that, so that RPM DBs of hosts are not needed to be unpacked up
+front. Only RPM DB files (var/lib/rpm/*) are extracted from archives.
+"""
+from __future__ import absolute_import
+
+import contextlib
+import logging
+import os.path
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+try:
+    import lzma  # tarfile supports xz if it is available.
+except ImportError:
+    lzma = None
+
+
+LOG = logging.getLogger(__name__)
+
+RPMDB_SUBDIR = "var/lib/rpm"
+ARCHIVE_SUFFIXES = (".tar.gz", ".tgz", ".tar.xz", ".txz")
+XZ_SUFFIXES = (".tar.xz", ".txz")
+
+DEFAULT_SCRATCHDIR = "/dev/shm" if os.path.isdir("/dev/shm") else \
+    tempfile.gettempdir()
+
+
+def is_archive(path):
+    """
+    >>> is_archive("/tmp/hosts/abc.example.com.tar.xz")
+    True
+    >>> is_archive("/tmp/hosts/abc.example.com")
+    False
+    """
+    return path.endswith(ARCHIVE_SUFFIXES)
+
+
+def host_id(path):
+    """
+    :param path: Archive path
+    :return: Host identity from the archive's filename
+
+    >>> host_id("/tmp/hosts/abc.example.com.tar.gz")
+    'abc.example.com'
+    >>> host_id("/tmp/hosts/abc.example.com.txz")
+    'abc.example.com'
+    """
+    fname = os.path.basename(path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if fname.endswith(suffix):
+            return fname[:-len(suffix)]
+
+    return fname
+
+
+def rpmdb_member_path(name, subdir=RPMDB_SUBDIR):
+    """
+    :param name: Name of the member of the archive
+    :return: Relative path to extract to, var/lib/rpm/..., or None if it's not
+        a RPM DB file or its path is not safe to extract
+
+    >>> rpmdb_member_path("./var/lib/rpm/Packages")
+    'var/lib/rpm/Packages'
+    >>> rpmdb_member_path("abc.example.com/var/lib/rpm/Name")
+    'var/lib/rpm/Name'
+    >>> rpmdb_member_path("var/lib/rpm/__db.001")
+    >>> rpmdb_member_path("var/lib/rpm/../../../etc/passwd")
+    >>> rpmdb_member_path("etc/yum.repos.d/rhel.repo")
+    """
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+    if ".." in parts:
+        return None
+
+    sparts = subdir.split('/')
+    nsub = len(sparts)
+    for idx in range(len(parts) - nsub):
+        if parts[idx:idx + nsub] == sparts:
+            rest = parts[idx + nsub:]
+            if rest[-1].startswith("__db."):  # BDB environment files.
+                return None
+
+            return '/'.join(sparts + rest)
+
+    return None
+
+
+def _open(archive):
+    """
+    :return: A tuple of (tarfile.TarFile object to read in stream mode,
+        subprocess.Popen object of the decompressor or None)
+    """
+    if archive.endswith(XZ_SUFFIXES) and lzma is None:
+        proc = subprocess.Popen(["xz", "-dc", archive],
+                                stdout=subprocess.PIPE)
+        return (tarfile.open(fileobj=proc.stdout, mode="r|"), proc)
+
+    return (tarfile.open(archive, mode="r|*"), None)
+
+
+def extract_rpmdb(archive, destdir):
+    """
+    Extract RPM DB files from the archive.
+
+    :param archive: Archive path
+    :param destdir: Dir to extract RPM DB files into
+    :return: Number of files extracted
+    """
+    (tar, proc) = _open(archive)
+    nfiles = 0
+    try:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            relpath = rpmdb_member_path(member.name)
+            if relpath is None:
+                continue
+
+            path = os.path.join(destdir, relpath)
+            pdir = os.path.dirname(path)
+            if not os.path.exists(pdir):
+                os.makedirs(pdir)
+
+            src = tar.extractfile(member)
+            with open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+            os.utime(path, (member.mtime, member.mtime))
+            nfiles += 1
+    finally:
+        tar.close()
+        if proc is not None:
+            proc.stdout.close()
+            proc.wait()
+
+    return nfiles
+
+
+@contextlib.contextmanager
+def rpmdb_root(root, scratchdir=None):
+    """
+    Context manager to extract the RPM DB from the archive into the scratch
+    dir and remove it on exit, if `root` is an archive.
+
+    :param root: RPM DB root dir or an archive contains it
+    :param scratchdir: Dir to extract RPM DBs into temporally
+
+    :return: RPM DB root dir
+    """
+    if root is None or not is_archive(root):
+        yield root
+        return
+
+    if scratchdir is None:
+        scratchdir = DEFAULT_SCRATCHDIR
+
+    workdir = tempfile.mkdtemp(dir=scratchdir,
+                               prefix="rpmkit-%s-" % host_id(root))
+    try:
+        LOG.debug("Extracting RPM DB from %s into %s", root, workdir)
+        extract_rpmdb(root, workdir)
+        yield workdir
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# vim:sw=4:ts=4:et:
@@ -66,6 +66,20 @@ class Base(object):
 
         return xs
 
+    def repo_revisions(self):
+        """
+        :return: A list of (repo_id, revision) of enabled repos, and revision
+            may be None if it's not available
+        """
+        return [(rid, None) for rid in self.repos]
+
+    def close(self):
+        """
+        Release resources and lists of packages. This object is not usable
+        after that.
+        """
+        self._packages.clear()
+
     def list_installed_impl(self, **kwargs):
         raise NotImplementedError("list_installed_impl")
 
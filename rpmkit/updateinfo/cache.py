@@ -0,0 +1,337 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Persistent cache of errata converted from yum repo metadata.
+
+Errata converted from updateinfo metadata of yum repos do not change until
+these repos' metadata are updated, so that converted errata are cached and
+keyed by repo IDs and revisions of their metadata (repomd.xml).
+
+The cache also holds an index of advisory ID -> package NEVRAs to find
+applicable errata for installed packages without converting errata again.
+Errata are looked up by (name, arch) of packages as dnf (hawkey) does, and
+the cache records (name, arch) pairs of which errata were added so that
+errata of other packages can be added later.
+"""
+import contextlib
+import copy
+import fcntl
+import hashlib
+import logging
+import os.path
+import os
+import socket
+
+import rpmkit.utils as U
+
+
+LOG = logging.getLogger(__name__)
+
+# The errata cache is disabled if RPMKIT_ERRATA_CACHEDIR is set to "".
+DEFAULT_CACHEDIR = os.environ.get(
+    "RPMKIT_ERRATA_CACHEDIR",
+    os.path.join(os.environ.get("XDG_CACHE_HOME",
+                                os.path.expanduser("~/.cache")),
+                 "rpmkit", "errata")) or None
+
+NEVRA_KEYS = ("name", "epoch", "version", "release", "arch")
+
+
+def set_default_cachedir(cachedir):
+    """
+    :param cachedir: Top dir to save errata cache files or None to disable
+        the errata cache
+    """
+    global DEFAULT_CACHEDIR
+    DEFAULT_CACHEDIR = cachedir or None
+
+
+def cache_key(repo_revs):
+    """
+    :param repo_revs: A list of (repo_id, revision) pairs
+    :return: A str to identify the cache
+
+    >>> k = cache_key([("rhel-7-server-rpms", "1414566215")])
+    >>> k == cache_key([("rhel-7-server-rpms", "1414566215")])
+    True
+    >>> k == cache_key([("rhel-7-server-rpms", "1414566216")])
+    False
+    >>> (cache_key([('a', '1'), ('b', '2')]) ==
+    ...  cache_key([('b', '2'), ('a', '1')]))
+    True
+    """
+    content = ','.join("%s:%s" % rr for rr in sorted(repo_revs))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def errata_to_nevras(errata, keys=NEVRA_KEYS):
+    """
+    :param errata: A dict represents an errata
+    :return: A list of NEVRA lists of packages in given errata
+
+    >>> e = dict(advisory="RHBA-2014:0001",
+    ...          packages=[dict(name="a", epoch="0", version="1",
+    ...                         release="2", arch="x86_64", evr="1-2")])
+    >>> errata_to_nevras(e)
+    [['a', '0', '1', '2', 'x86_64']]
+    """
+    return [[p[k] for k in keys] for p in errata.get("packages", [])]
+
+
+class ErrataCache(object):
+    """
+    Errata cache of yum repos of specific metadata revisions.
+    """
+    # The cache file loaded last in this process to share it among hosts:
+    # {path: (errata, index, covered)}
+    _last = {}
+
+    def __init__(self, repo_revs, cachedir=None):
+        """
+        :param repo_revs: A list of (repo_id, revision) pairs
+        :param cachedir: Top dir to save errata cache files or None to keep
+            errata in memory only
+        """
+        self.repo_revs = sorted(tuple(rr) for rr in repo_revs)
+        if cachedir is None:
+            (self.path, self.index_path, self.lock_path) = (None, None, None)
+        else:
+            key = cache_key(self.repo_revs)
+            self.path = os.path.join(cachedir, key + ".json")
+            self.index_path = os.path.join(cachedir, key + ".index.json")
+            self.lock_path = os.path.join(cachedir, key + ".lock")
+
+        self._errata = None
+        self._index = None
+        self._covered = set()  # {(name, arch)}
+        self._naidx = None
+
+    def __len__(self):
+        return len(self._index) if self._index else 0
+
+    def _remember(self):
+        self._last.clear()
+        self._last[self.index_path] = (self._errata, self._index,
+                                       self._covered)
+
+    def _load_index(self):
+        """
+        :return: Data of the index file or None if not available
+        """
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return None
+
+        try:
+            data = U.json_load(self.index_path)
+            if sorted(tuple(rr) for rr in data["repos"]) != self.repo_revs:
+                LOG.warn("Cache key conflicts: %s", self.index_path)
+                return None
+
+            if not isinstance(data.get("index"), dict):
+                raise ValueError("No index found")
+
+            return data
+        except (IOError, OSError, ValueError, KeyError) as exc:
+            LOG.warn("Failed to load the errata cache %s: %s",
+                     self.index_path, exc)
+            return None
+
+    def load(self):
+        """
+        Load the index of errata from the cache file if exists.
+
+        :return: True if loaded successfully
+        """
+        if self._index is not None:
+            return True
+
+        if self.index_path is not None and self.index_path in self._last:
+            (self._errata, self._index, self._covered) = \
+                self._last[self.index_path]
+            return True
+
+        data = self._load_index()
+        if data is None:
+            return False
+
+        self._index = data["index"]
+        self._covered = set(tuple(na) for na in data.get("covered", []))
+        self._remember()
+        return True
+
+    def _load_errata(self):
+        if self._errata is None:
+            self._errata = U.json_load(self.path)["data"]
+            self._remember()
+
+        return self._errata
+
+    def update(self, errata, covered=()):
+        """
+        Set errata and the index of them but not save them.
+
+        :param errata: A list of errata dicts
+        :param covered: A list of (name, arch) of packages all errata of
+            which are in `errata`
+        """
+        self._errata = dict((e["advisory"], e) for e in errata)
+        self._index = dict((e["advisory"], errata_to_nevras(e)) for e
+                           in errata)
+        self._covered = set(tuple(na) for na in covered)
+        self._naidx = None
+
+    def add(self, errata, covered=()):
+        """
+        Add errata and the index of them but not save them.
+
+        :param errata: A list of errata dicts
+        :param covered: Same as :meth:`update`
+        """
+        if self._index is None:
+            return self.update(errata, covered)
+
+        self._load_errata()
+        for ert in errata:
+            self._errata[ert["advisory"]] = ert
+            self._index[ert["advisory"]] = errata_to_nevras(ert)
+
+        self._covered.update(tuple(na) for na in covered)
+        self._naidx = None
+
+    def uncovered(self, names_archs):
+        """
+        :param names_archs: A list of (name, arch) of packages
+        :return: A sorted list of (name, arch) of packages errata of which
+            may not be in the cache
+        """
+        return sorted(set(tuple(na) for na in names_archs) - self._covered)
+
+    def _merge_saved(self):
+        """
+        Merge errata saved by others since this cache was loaded.
+        """
+        data = self._load_index()
+        if data is None:
+            return
+
+        advs = [adv for adv in data["index"] if adv not in self._index]
+        if advs:
+            saved = U.json_load(self.path)["data"]
+            for adv in advs:
+                if adv in saved:
+                    self._errata[adv] = saved[adv]
+                    self._index[adv] = data["index"][adv]
+            self._naidx = None
+
+        self._covered.update(tuple(na) for na in data.get("covered", []))
+
+    def save(self, errata=None, covered=()):
+        """
+        Save converted errata and the index of them into cache files.
+
+        Errata saved by other processes in the meantime are merged, so that
+        errata in the cache only increase and the errata file always has all
+        errata in the index file.
+
+        :param errata: A list of errata dicts to set (see :meth:`update`) or
+            None to save errata set or added already
+        :param covered: Same as :meth:`update`
+        """
+        if errata is not None:
+            self.update(errata, covered)
+
+        cachedir = os.path.dirname(self.path)
+        if not os.path.exists(cachedir):
+            LOG.debug("Creating cache dir: %s", cachedir)
+            os.makedirs(cachedir)
+
+        with _locked(self.lock_path):
+            self._merge_saved()
+
+            # Write the errata file at first because it's the index file
+            # decides whether the cache is available or not.
+            _dump_atomically(dict(repos=self.repo_revs, data=self._errata),
+                             self.path)
+            _dump_atomically(dict(repos=self.repo_revs, index=self._index,
+                                  covered=sorted(self._covered)),
+                             self.index_path)
+
+        self._remember()
+
+    def _name_arch_index(self):
+        """
+        :return: A dict of {(name, arch): [(epoch, version, release, adv)]}
+        """
+        if self._naidx is None:
+            self._naidx = dict()
+            for adv, nevras in self._index.items():
+                for (name, epoch, ver, rel, arch) in nevras:
+                    self._naidx.setdefault((name, arch), []).append(
+                        ((str(epoch), ver, rel), adv))
+
+        return self._naidx
+
+    def list_applicable_advisories(self, nevras, evr_cmp):
+        """
+        :param nevras: A list of (name, epoch, version, release, arch) of
+            installed packages
+        :param evr_cmp: A function to compare EVRs, (epoch, version, release)
+            and return an int < 0, 0 or > 0
+
+        :return: A sorted list of advisory IDs of errata applicable to
+            packages of given NEVRAs
+        """
+        naidx = self._name_arch_index()
+        advs = set()
+
+        for (name, epoch, ver, rel, arch) in nevras:
+            ievr = (str(epoch), ver, rel)
+            for evr, adv in naidx.get((name, arch), []):
+                if adv not in advs and evr_cmp(evr, ievr) > 0:
+                    advs.add(adv)
+
+        return sorted(advs)
+
+    def list_applicable_errata(self, nevras, evr_cmp):
+        """
+        Similar to the above but returns errata dicts.
+
+        Returned errata are copies of cached ones and callers are free to
+        modify them.
+        """
+        return self.get_errata(self.list_applicable_advisories(nevras,
+                                                               evr_cmp))
+
+    def get_errata(self, advs):
+        """
+        :param advs: A list of advisory IDs
+        :return: A list of copies of errata dicts of given advisory IDs
+        """
+        errata = self._load_errata()
+        return [copy.deepcopy(errata[adv]) for adv in advs]
+
+
+def _dump_atomically(data, filepath):
+    """
+    Dump data into a temporary file and rename it to `filepath` to avoid
+    other processes read incomplete files.
+    """
+    tmp = "%s.%s.%d.tmp" % (filepath, socket.gethostname(), os.getpid())
+    U.json_dump(data, tmp)
+    os.rename(tmp, filepath)
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """
+    Lock the file exclusively among processes.
+    """
+    with open(path, 'a') as lockf:
+        fcntl.flock(lockf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockf, fcntl.LOCK_UN)
+
+# vim:sw=4:ts=4:et:
@@ -8,8 +8,11 @@
 #
 # License: GPLv3+
 #
+import rpmkit.updateinfo.cache as RUC
 import rpmkit.updateinfo.main as RUM
 import rpmkit.updateinfo.multihosts as RUMS
+import rpmkit.updateinfo.spool as RUSPOOL
+import rpmkit.jsoncodec
 import datetime
 import optparse
 import os.path
@@ -17,9 +20,14 @@ import os.path
 
 _TODAY = datetime.datetime.now().strftime("%F")
 _DEFAULTS = dict(path=None, workdir="/tmp/rk-updateinfo-{}".format(_TODAY),
-                 repos=[], multiproc=False, id=None,
+                 repos=[], multiproc=False, nprocs=None, memlimit=None,
+                 incremental=False, spool=None, worker=False,
+                 lease=RUSPOOL.DEFAULT_LEASE, scratchdir=None,
+                 compress=rpmkit.jsoncodec.DEFAULT_COMPRESSION,
+                 id=None,
                  score=0, keywords=RUM.ERRATA_KEYWORDS,
                  rpms=RUM.CORE_RPMS, period='', cachedir=None, refdir=None,
+                 errata_cachedir=RUC.DEFAULT_CACHEDIR, no_errata_cache=False,
                  backend=RUM.DEFAULT_BACKEND, verbosity=0)
 _USAGE = """\
 %prog [Options...] ROOT
@@ -42,10 +50,43 @@ def option_parser(defaults=_DEFAULTS, usage=_USAGE, backends=RUM.BACKENDS):
                       "RPM DBs automatically, and please not that any other "
                       "repos are disabled if this option was set.")
     p.add_option("-I", "--id", help="Data ID [None]")
-    # TODO: Disabled until issue of yum vs. multiprocessing module is fixed.
-    # p.add_option("-M", "--multiproc", action="store_true",
-    #             help="Specify this option if you want to analyze data "
-    #                  "in parallel (disabled currently)")
+    p.add_option("-M", "--multiproc", action="store_true",
+                 help="Specify this option if you want to analyze hosts' "
+                      "data in parallel [multihosts mode]")
+    p.add_option('', "--nprocs", type="int",
+                 help="Max number of worker processes in parallel. "
+                      "Number of CPUs will be used if not given.")
+    p.add_option('', "--memlimit", type="int",
+                 help="Max memory size of each worker process in MB. "
+                      "No limits by default.")
+    p.add_option('', "--incremental", action="store_true",
+                 help="Skip hosts of which RPM DBs, yum repos' metadata and "
+                      "options are not changed since the previous run, and "
+                      "resume interrupted runs [multihosts mode]")
+    p.add_option('', "--scratchdir",
+                 help="Dir to extract RPM DBs from archives of hosts' data, "
+                      "<host>.tar.gz or <host>.tar.xz, temporally. "
+                      "/dev/shm (tmpfs) will be used if not given "
+                      "[multihosts mode]")
+    p.add_option('', "--spool",
+                 help="Spool dir on the shared file system to distribute "
+                      "analysis of hosts across machines. Jobs are enqueued "
+                      "into this dir and processed by workers (see --worker) "
+                      "[multihosts mode]")
+    p.add_option('', "--worker", action="store_true",
+                 help="Run as a worker to process jobs in the spool dir "
+                      "given by --spool. ROOT is not needed in this mode.")
+    p.add_option('', "--lease", type="int",
+                 help="Lease time in seconds of jobs in the spool dir. Jobs "
+                      "of workers not responding longer than this are "
+                      "processed by other workers again [%default]")
+    p.add_option('', "--compress",
+                 choices=[c[1:] for c in rpmkit.jsoncodec.COMPRESSIONS],
+                 help="Compress result files of packages, errata and "
+                      "updates in JSON format, e.g. errata.json.xz. "
+                      "Choices: %s [%%default]" %
+                      ", ".join(c[1:] for c in
+                                rpmkit.jsoncodec.COMPRESSIONS))
     p.add_option("-B", "--backend", choices=backends.keys(),
                  help="Specify backend to get updates and errata. Choices: "
                       "%s [%%default]" % ', '.join(backends.keys()))
@@ -66,6 +107,12 @@ def option_parser(defaults=_DEFAULTS, usage=_USAGE, backends=RUM.BACKENDS):
                       "If end date is omitted, Today will be used instead")
     p.add_option("-C", "--cachedir",
                  help="Specify yum repo metadata cachedir [root/var/cache]")
+    p.add_option('', "--errata-cachedir",
+                 help="Dir to cache errata converted from yum repos' "
+                      "metadata [%default]")
+    p.add_option('', "--no-errata-cache", action="store_true",
+                 help="Do not cache errata converted from yum repos' "
+                      "metadata")
     p.add_option("-R", "--refdir",
                  help="Output 'delta' result compared to the data in this dir")
     p.add_option("-v", "--verbose", action="count", dest="verbosity",
@@ -79,6 +126,15 @@ def option_parser(defaults=_DEFAULTS, usage=_USAGE, backends=RUM.BACKENDS):
 def main():
     p = option_parser()
     (options, args) = p.parse_args()
+    rpmkit.jsoncodec.set_default_compression(options.compress)
+    RUC.set_default_cachedir(None if options.no_errata_cache else
+                             options.errata_cachedir)
+
+    if options.worker:
+        assert options.spool, "Spool dir must be given with --spool"
+        RUM.set_loglevel(options.verbosity)
+        RUSPOOL.work(options.spool, options.lease)
+        return
 
     root = args[0] if args else raw_input("Host[s] data dir (root) > ")
     assert os.path.exists(root), "Not found RPM DB Root: %s" % root
@@ -90,15 +146,23 @@ def main():
                  options.score, options.keywords, options.rpms, period,
                  options.cachedir, options.refdir, options.verbosity,
                  options.backend)
+    elif options.spool:
+        RUSPOOL.main(options.spool, root, options.workdir, options.repos,
+                     options.score, options.keywords, options.rpms, period,
+                     options.cachedir, options.refdir, options.verbosity,
+                     options.backend, options.lease)
     else:
         # multihosts mode.
-        #
-        # TODO: multiproc mode is disabled and options.multiproc is not passed
-        # to RUMS.main until the issue of yum that its thread locks conflict w/
-        # multiprocessing module is fixed.
+        memlimit = options.memlimit
+        if memlimit:
+            memlimit = memlimit * 1024 * 1024
+
         RUMS.main(root, options.workdir, options.repos, options.score,
                   options.keywords, options.rpms, period, options.cachedir,
-                  options.refdir, options.verbosity, options.backend)
+                  options.refdir, options.verbosity, options.multiproc,
+                  options.backend, nprocs=options.nprocs, memlimit=memlimit,
+                  incremental=options.incremental,
+                  scratchdir=options.scratchdir)
 
 
 if __name__ == '__main__':
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 import collections
 import dnf.conf
 import dnf
+import hashlib
 import hawkey
 import itertools
 import logging
@@ -17,6 +18,8 @@ import operator
 import os.path
 
 import rpmkit.updateinfo.base
+import rpmkit.updateinfo.cache
+import rpmkit.updateinfo.timings
 import rpmkit.utils
 
 
@@ -132,11 +135,60 @@ def hadv_to_errata(hadv):
     return errata
 
 
+def _hpkg_to_nevra(hpkg):
+    """
+    :param hpkg: A hawkey.Package object
+    :return: A tuple of (name, epoch, version, release, arch)
+    """
+    return (hpkg.name, hpkg.epoch, hpkg.v, hpkg.r, hpkg.a)
+
+
+def _evr_to_s(evr):
+    """
+    >>> _evr_to_s(('0', '1.0', '1.el7'))
+    '0:1.0-1.el7'
+    """
+    return "%s:%s-%s" % tuple(evr)
+
+
+def repo_revision(repo):
+    """
+    Get the revision of metadata of given repo.
+
+    Where the revision is available differs among versions of dnf, so that
+    try some and fallback to the checksum of repomd.xml.
+
+    :param repo: A dnf.repo.Repo object of which metadata was loaded
+    :return: The revision (str) or None if it's not available
+    """
+    try:
+        rev = repo._repo.getRevision()  # libdnf based dnf >= 3.
+        if rev:
+            return str(rev)
+    except AttributeError:
+        pass
+
+    md = getattr(repo, "metadata", None)
+    for attr in ("revision", "_revision"):
+        rev = getattr(md, attr, None)
+        if rev:
+            return str(rev)
+
+    cachedir = getattr(repo, "_cachedir", getattr(repo, "cachedir", None))
+    if cachedir:
+        repomd = os.path.join(cachedir, "repodata", "repomd.xml")
+        if os.path.exists(repomd):
+            return hashlib.sha1(open(repomd, "rb").read()).hexdigest()
+
+    return None
+
+
 class Base(rpmkit.updateinfo.base.Base):
     name = "rpmkit.updateinfo.dnfbase"
 
     def __init__(self, root='/', repos=[], disabled_repos=['*'],
-                 workdir=None, cacheonly=False, **kwargs):
+                 workdir=None, cacheonly=False,
+                 errata_cachedir=True, **kwargs):
         """
         Create and initialize dnf.Base or dnf.cli.cli.BaseCli object.
 
@@ -144,6 +196,11 @@ class Base(rpmkit.updateinfo.base.Base):
         :param repos: A list of repos to enable
         :param disabled_repos: A list of repos to disable
         :param workdir: Working dir to save logs and results
+        :param cachedir: Dir to save metadata cache of yum repos in, or None
+            to save under the root
+        :param errata_cachedir: Dir to cache errata converted from repo
+            metadata, None to disable the errata cache or True to use
+            rpmkit.updateinfo.cache.DEFAULT_CACHEDIR (may be None)
 
         see also: :function:`dnf.automatic.main.main`
 
@@ -162,9 +219,18 @@ class Base(rpmkit.updateinfo.base.Base):
             conf.logdir = os.path.join(self.root, conf.logdir[1:])
             conf.persistdir = os.path.join(self.root, conf.persistdir[1:])
 
+        # Keep metadata of repos in the cache dir given, e.g. not in the
+        # temporal root RPM DBs extracted from archives into.
+        if kwargs.get("cachedir") is not None:
+            conf.cachedir = os.path.join(kwargs["cachedir"], "dnf")
+
         self.base = dnf.Base(conf)
 
         self.cacheonly = cacheonly
+        if errata_cachedir is True:
+            errata_cachedir = rpmkit.updateinfo.cache.DEFAULT_CACHEDIR
+        self.errata_cachedir = errata_cachedir
+        self._repos_loaded = False
         self._repo_md_ready = False
         self._hpackages = collections.defaultdict(list)
 
@@ -223,11 +289,12 @@ class Base(rpmkit.updateinfo.base.Base):
 
         return self._hpackages["obsoletes"]
 
-    def prepare(self):
+    def _load_repos(self):
         """
-        Initialize RPM DB (sack) and Yum repo metadata (fetch from remote).
+        Enable repos and load their metadata (repomd.xml, etc.) but not
+        load them into the sack.
         """
-        if not self._repo_md_ready:
+        if not self._repos_loaded:
             self.base.read_all_repos()
             for rid in self.base.repos.keys():
                 if rid in self.repos:
@@ -235,14 +302,54 @@ class Base(rpmkit.updateinfo.base.Base):
                 else:
                     self.base.repos[rid].disable()
 
+            for repo in self.base.repos.iter_enabled():
+                repo.load()
+
+            self._repos_loaded = True
+
+    def prepare(self, timings=None):
+        """
+        Initialize RPM DB (sack) and Yum repo metadata (fetch from remote).
+
+        :param timings: A rpmkit.updateinfo.timings.Timings object to record
+            timings of loading repos' metadata, filling the sack with them,
+            loading the RPM DB and resolving updates, or None
+        """
+        if not self._repo_md_ready:
+            if timings is None:
+                timings = rpmkit.updateinfo.timings.Timings()
+
             # It will take some time to get metadata from remote repos.
             # see :method:`run` in :class:`dnf.cli.cli.Cli`.
-            self.base.fill_sack(load_system_repo='auto')
-            self.base.upgrade_all()
-            self.base.resolve()
+            with timings.phase("repos load"):
+                self._load_repos()
+
+            with timings.phase("sack fill"):
+                self.base.fill_sack(load_system_repo=False)
+
+            with timings.phase("rpmdb load"):
+                try:
+                    self.base.sack.load_system_repo(build_cache=False)
+                except IOError:  # Same as load_system_repo='auto'.
+                    LOG.warn("Could not load the RPM DB: %s", self.root)
+
+            with timings.phase("resolve"):
+                self.base.upgrade_all()
+                self.base.resolve()
 
             self._repo_md_ready = True
 
+    def close(self):
+        """
+        Release dnf.Base object, the sack and lists of packages.
+        """
+        close = getattr(self.base, "close", None)  # Not in older dnf.
+        if close is not None:
+            close()
+
+        self._hpackages.clear()
+        super(Base, self).close()
+
     def list_installed_impl(self, **kwargs):
         """
         List installed packages.
@@ -260,18 +367,96 @@ class Base(rpmkit.updateinfo.base.Base):
 
         return self._packages["installed"]
 
+    def repo_revisions(self):
+        """
+        :return: A list of (repo_id, revision) of enabled repos, and revision
+            may be None if it's not available
+        """
+        self._load_repos()
+        return sorted((r.id, repo_revision(r)) for r
+                      in self.base.repos.iter_enabled())
+
+    def _evr_cmp(self, evr1, evr2):
+        """
+        :param evr1, evr2: A tuple of (epoch, version, release)
+        """
+        return self.base.sack.evr_cmp(_evr_to_s(evr1), _evr_to_s(evr2))
+
+    def _errata_cache(self):
+        """
+        :return: An ErrataCache object loaded if the cache file exists or
+            None if the errata cache is disabled or not available
+        """
+        if self.errata_cachedir is None:
+            return None
+
+        rrevs = self.repo_revisions()
+        if not rrevs or any(rev is None for _rid, rev in rrevs):
+            LOG.info("Revisions of some repos are not available: %s",
+                     ", ".join(rid for rid, rev in rrevs if rev is None))
+            return None
+
+        cache = rpmkit.updateinfo.cache.ErrataCache(rrevs,
+                                                    self.errata_cachedir)
+        cache.load()
+        return cache
+
+    def _list_advisories(self, pkgs):
+        """
+        :param pkgs: A list of hawkey.Package objects
+        :return: A list of _hawkey.Advisory objects of packages of same names
+            and archs as given packages, of any versions
+        """
+        cmp_type = hawkey.LT | hawkey.EQ | hawkey.GT
+        advs = itertools.chain(*(p.get_advisories(cmp_type) for p in pkgs))
+        return rpmkit.utils.uniq(advs, key=operator.attrgetter("id"))
+
+    def _cover_errata(self, cache, pkgs):
+        """
+        Convert errata of packages of which errata are not in the cache yet,
+        add them into the cache and save it.
+
+        :param cache: An ErrataCache object
+        :param pkgs: A list of hawkey.Package objects
+        """
+        nas = cache.uncovered((p.name, p.arch) for p in pkgs)
+        if not nas:
+            return
+
+        snas = set(nas)
+        pkgs = [p for p in pkgs if (p.name, p.arch) in snas]
+        LOG.info("Converting errata of %d packages: %s", len(nas),
+                 cache.path)
+        cache.add([hadv_to_errata(a) for a in self._list_advisories(pkgs)],
+                  nas)
+        if cache.path is not None:
+            cache.save()
+
     def list_errata_impl(self, **kwargs):
         """
         List errata.
+
+        Converted errata are cached by revisions of repos' metadata and reused
+        as much as possible if the errata cache is enabled. Errata are found
+        by names, archs and versions of installed packages in both cases.
         """
         self.prepare()
-        if not self._hpackages["errata"]:
-            ips = self._list_dnf_installed()
+        if self._packages["errata"]:
+            return self._packages["errata"]
+
+        ips = self._list_dnf_installed()
+        cache = self._errata_cache()
+
+        if cache is None:
             advs = itertools.chain(*(pkg.get_advisories(hawkey.GT) for pkg
                                      in ips))
             advs = rpmkit.utils.uniq(advs, key=operator.attrgetter("id"))
-            self._hpackages["errata"] = advs
             self._packages["errata"] = [hadv_to_errata(a) for a in advs]
+        else:
+            self._cover_errata(cache, ips)
+            nevras = [_hpkg_to_nevra(p) for p in ips]
+            self._packages["errata"] = \
+                cache.list_applicable_errata(nevras, self._evr_cmp)
 
         return self._packages["errata"]
 
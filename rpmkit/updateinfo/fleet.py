@@ -0,0 +1,203 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Backend to analyze many hosts share yum repos efficiently.
+
+:class:`rpmkit.updateinfo.dnfbase.Base` loads all metadata of yum repos into
+the sack of each host and computes applicable errata and updates by the sack,
+that is, it takes O(hosts x sack) time to analyze hosts.
+
+The backend in this module loads RPM DB of each host only and computes
+applicable errata and updates with the index of packages and errata available
+from yum repos shared among hosts. Results are memoized per installed NEVRA
+and errata and updates of each host are the union of results of its installed
+packages, so that it takes O(distinct installed packages) time mostly.
+"""
+from __future__ import absolute_import
+
+import copy
+import logging
+
+import rpmkit.updateinfo.cache
+import rpmkit.updateinfo.dnfbase
+import rpmkit.updateinfo.timings
+
+
+LOG = logging.getLogger(__name__)
+
+
+class FleetIndex(object):
+    """
+    Index of packages and errata available from yum repos shared among hosts.
+    """
+    _indexes = {}  # Indexes built in this process: {key: index}
+
+    def __init__(self, base):
+        """
+        :param base: A dnfbase.Base object of the host to build index, and
+            root and repos of it are used to load yum repos' metadata
+        """
+        self.repos = tuple(sorted(base.repos))
+
+        LOG.info("Loading repos to build the fleet index: %s",
+                 ", ".join(self.repos))
+        ibase = rpmkit.updateinfo.dnfbase.Base(base.root, base.repos,
+                                               workdir=base.workdir,
+                                               cachedir=base._cachedir,
+                                               errata_cachedir=base.
+                                               errata_cachedir)
+        ibase._load_repos()
+        ibase.base.fill_sack(load_system_repo=False)
+        ibase._repo_md_ready = True
+
+        self._pkgs = dict()  # {(name, arch): [(evr, hawkey.Package)]}
+        aps = ibase.base.sack.query().available()
+        if not isinstance(aps, list):
+            aps = aps.run()
+        for hpkg in aps:
+            (name, epoch, ver, rel, arch) = \
+                rpmkit.updateinfo.dnfbase._hpkg_to_nevra(hpkg)
+            self._pkgs.setdefault((name, arch), []).append(((str(epoch), ver,
+                                                             rel), hpkg))
+
+        self.errata_cache = ibase._errata_cache()
+        if self.errata_cache is None:  # Kept in memory only.
+            self.errata_cache = \
+                rpmkit.updateinfo.cache.ErrataCache(ibase.repo_revisions())
+        ibase._cover_errata(self.errata_cache, aps)
+
+        self.evr_cmp = ibase._evr_cmp
+        self._advs = dict()  # {nevra: [advisory]}
+        self._updates = dict()  # {nevra: [update package]}
+
+    @staticmethod
+    def key(base):
+        """
+        :param base: A dnfbase.Base object of the host
+        :return: A tuple of (repos, revisions of repos' metadata, releasever)
+            of the host; hosts of which these are same share the index
+        """
+        releasever = getattr(base.base.conf, "releasever", None)
+        return (tuple(sorted(base.repos)), tuple(base.repo_revisions()),
+                releasever)
+
+    @classmethod
+    def get(cls, base):
+        """
+        :param base: A dnfbase.Base object of the host
+        :return: FleetIndex object for the repos of given host
+        """
+        key = cls.key(base)
+        if key not in cls._indexes:
+            cls._indexes[key] = cls(base)
+
+        return cls._indexes[key]
+
+    def advisories(self, nevra):
+        """
+        :param nevra: A tuple of (name, epoch, version, release, arch) of the
+            installed package
+        :return: A list of advisory IDs of errata applicable to the package
+
+        .. note:: Errata of packages not available from yum repos are not
+           found unlike dnf, as these are looked up by available packages.
+        """
+        advs = self._advs.get(nevra)
+        if advs is None:
+            advs = self.errata_cache.list_applicable_advisories([nevra],
+                                                                self.evr_cmp)
+            self._advs[nevra] = advs
+
+        return advs
+
+    def updates(self, nevra):
+        """
+        :param nevra: A tuple of (name, epoch, version, release, arch) of the
+            installed package
+        :return: A list of packages of same name and arch and newer than the
+            installed package
+
+        .. note:: Arch changes (e.g. x86_64 -> noarch) and obsoletes are not
+           taken into account unlike dnf.
+        """
+        ups = self._updates.get(nevra)
+        if ups is None:
+            (name, epoch, ver, rel, arch) = nevra
+            ievr = (str(epoch), ver, rel)
+            ups = [rpmkit.updateinfo.dnfbase._to_pkg(p) for evr, p
+                   in self._pkgs.get((name, arch), [])
+                   if self.evr_cmp(evr, ievr) > 0]
+            self._updates[nevra] = ups
+
+        return ups
+
+
+class Base(rpmkit.updateinfo.dnfbase.Base):
+    name = "rpmkit.updateinfo.fleet"
+    _fleet_index = None  # FleetIndex object set on preparation.
+
+    def prepare(self, timings=None):
+        """
+        Initialize RPM DB (sack) only. Metadata of yum repos are loaded once
+        to build the index shared among hosts.
+
+        The index is built here, while the root exists, as the root may be
+        temporal, e.g. RPM DBs extracted from archives.
+
+        :param timings: A rpmkit.updateinfo.timings.Timings object to record
+            timings of loading the RPM DB and getting the index, or None
+        """
+        if not self._repo_md_ready:
+            if timings is None:
+                timings = rpmkit.updateinfo.timings.Timings()
+
+            with timings.phase("rpmdb load"):
+                self.base.fill_sack(load_system_repo='auto',
+                                    load_available_repos=False)
+            self._repo_md_ready = True
+
+            with timings.phase("fleet index"):
+                self._fleet_index = FleetIndex.get(self)
+
+    def _installed_nevras(self):
+        return [rpmkit.updateinfo.dnfbase._hpkg_to_nevra(p) for p
+                in self._list_dnf_installed()]
+
+    def list_errata_impl(self, **kwargs):
+        """
+        List errata applicable to installed packages.
+        """
+        self.prepare()
+        if not self._packages["errata"]:
+            idx = self._fleet_index
+            advs = set()
+            for nevra in self._installed_nevras():
+                advs.update(idx.advisories(nevra))
+
+            errata = idx.errata_cache.get_errata(sorted(advs))
+            self._packages["errata"] = errata
+
+        return self._packages["errata"]
+
+    def list_updates_impl(self, **kwargs):
+        """
+        List update packages of installed packages.
+        """
+        self.prepare()
+        if not self._packages["updates"]:
+            idx = self._fleet_index
+            ups = dict()
+            for nevra in self._installed_nevras():
+                for pkg in idx.updates(nevra):
+                    key = tuple(pkg[k] for k in ("name", "epoch", "version",
+                                                 "release", "arch"))
+                    ups[key] = pkg
+
+            # Copy them as these are shared among hosts.
+            self._packages["updates"] = [copy.copy(ups[k]) for k
+                                         in sorted(ups)]
+
+        return self._packages["updates"]
+
+# vim:sw=4:ts=4:et:
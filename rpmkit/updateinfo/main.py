@@ -11,25 +11,29 @@
 from rpmkit.globals import _
 from operator import itemgetter
 
-import rpmkit.updateinfo.dnfbase
+import rpmkit.updateinfo.timings
 import rpmkit.updateinfo.utils
+import rpmkit.jsoncodec
 import rpmkit.memoize
 import rpmkit.rpmutils
 import rpmkit.utils as U
 
-# It looks available in EPEL for RHELs:
-#   https://apps.fedoraproject.org/packages/python-bunch
-import bunch
 import calendar
 import collections
 import datetime
 import functools
+import hashlib
+import importlib
 import itertools
 import logging
 import os
 import os.path
 import re
-import tablib
+
+# It looks available in EPEL for RHELs:
+#   https://apps.fedoraproject.org/packages/python-bunch
+bunch = U.lazy_import("bunch")
+tablib = U.lazy_import("tablib")
 
 if os.environ.get("RPMKIT_MEMORY_DEBUG", False):
     try:
@@ -51,8 +55,10 @@ _RPM_LIST_FILE = "packages.json"
 _ERRATA_LIST_FILE = "errata.json"
 _UPDATES_LIST_FILE = "updates.json"
 
-BACKENDS = dict(dnf=rpmkit.updateinfo.dnfbase.Base, )
-DEFAULT_BACKEND = BACKENDS["dnf"]
+# Backends, {name: module provides Base class}, imported when used.
+BACKENDS = dict(dnf="rpmkit.updateinfo.dnfbase",
+                fleet="rpmkit.updateinfo.fleet")
+DEFAULT_BACKEND = "dnf"
 
 NEVRA_KEYS = ["name", "epoch", "version", "release", "arch"]
 
@@ -78,7 +84,8 @@ def set_loglevel(verbosity=0, backend=False):
     if not backend:
         llvl = logging.WARN
 
-    rpmkit.updateinfo.dnfbase.LOG.setLevel(llvl)
+    for modname in BACKENDS.values():
+        logging.getLogger(modname).setLevel(llvl)
 
 
 def rpm_list_path(workdir, filename=_RPM_LIST_FILE):
@@ -343,10 +350,11 @@ def compute_delta(refdir, errata, updates, nevra_keys=NEVRA_KEYS):
     emsg = "Reference %s not found: %s"
     assert os.path.exists(refdir), emsg % ("data dir", refdir)
 
-    ref_es_file = os.path.join(refdir, "errata.json")
-    ref_us_file = os.path.join(refdir, "updates.json")
-    assert os.path.exists(ref_es_file), emsg % ("errata file", ref_es_file)
-    assert os.path.exists(ref_us_file), emsg % ("updates file", ref_us_file)
+    ref_es_file = errata_list_path(refdir)
+    ref_us_file = updates_file_path(refdir)
+    for (name, path) in (("errata file", ref_es_file),
+                         ("updates file", ref_us_file)):
+        assert rpmkit.jsoncodec.find_file(path), emsg % (name, path)
 
     ref_es_data = U.json_load(ref_es_file)
     ref_us_data = U.json_load(ref_us_file)
@@ -741,7 +749,7 @@ def dump_xls(dataset, filepath):
 
 def dump_results(workdir, rpms, errata, updates, score=0,
                  keywords=ERRATA_KEYWORDS, core_rpms=[], details=True,
-                 rpmkeys=NEVRA_KEYS, vendor="redhat"):
+                 rpmkeys=NEVRA_KEYS, vendor="redhat", timings=None):
     """
     :param workdir: Working dir to dump the result
     :param rpms: A list of installed RPMs
@@ -751,7 +759,12 @@ def dump_results(workdir, rpms, errata, updates, score=0,
     :param keywords: Keyword list to filter 'important' RHBAs
     :param core_rpms: Core RPMs to filter errata by them
     :param details: Dump details also if True
+    :param timings: A rpmkit.updateinfo.timings.Timings object to record
+        timings of phases or None
     """
+    if timings is None:
+        timings = rpmkit.updateinfo.timings.Timings()
+
     rpms_rebuilt = [p for p in rpms if p.get("rebuilt", False)]
     rpms_replaced = [p for p in rpms if p.get("replaced", False)]
     rpms_from_others = [p for p in rpms if p.get("origin", '') != vendor]
@@ -762,8 +775,11 @@ def dump_results(workdir, rpms, errata, updates, score=0,
     nps = len(rpms)
     nus = len(updates)
 
-    data = dict(errata=analyze_errata(errata, updates, score, keywords,
-                                      core_rpms),
+    with timings.phase("analysis") as rec:
+        edata = analyze_errata(errata, updates, score, keywords, core_rpms)
+        rec["count"] = len(errata)
+
+    data = dict(errata=edata,
                 installed=dict(list=rpms,
                                list_rebuilt=rpms_rebuilt,
                                list_replaced=rpms_replaced,
@@ -774,7 +790,8 @@ def dump_results(workdir, rpms, errata, updates, score=0,
                                    (_("packages not need updates"),
                                     nps - nus)]))
 
-    U.json_dump(data, os.path.join(workdir, "summary.json"))
+    with timings.phase("dump summary.json"):
+        U.json_dump(data, os.path.join(workdir, "summary.json"))
 
     # FIXME: How to keep DRY principle?
     lrpmkeys = [_("name"), _("epoch"), _("version"), _("release"), _("arch")]
@@ -840,7 +857,8 @@ def dump_results(workdir, rpms, errata, updates, score=0,
                                _("RPMs from other vendors"), rpmdkeys,
                                lrpmdkeys))
 
-    dump_xls(ds, os.path.join(workdir, "errata_summary.xls"))
+    with timings.phase("dump errata_summary.xls"):
+        dump_xls(ds, os.path.join(workdir, "errata_summary.xls"))
 
     if details:
         dds = [make_dataset(errata, _("Errata Details"),
@@ -854,18 +872,53 @@ def dump_results(workdir, rpms, errata, updates, score=0,
                make_dataset(updates, _("Update RPMs"), rpmkeys, lrpmkeys),
                make_dataset(rpms, _("Installed RPMs"), rpmdkeys, lrpmdkeys)]
 
-        dump_xls(dds, os.path.join(workdir, "errata_details.xls"))
+        with timings.phase("dump errata_details.xls"):
+            dump_xls(dds, os.path.join(workdir, "errata_details.xls"))
+
+
+def rpms_fingerprint(rpms, nevra_keys=NEVRA_KEYS):
+    """
+    Compute a stable fingerprint of the set of RPMs. Hosts having the same
+    installed RPMs have the same fingerprint.
+
+    :param rpms: A list of RPM dicts contain NEVRA info
+    :return: A str represents hash of the sorted NEVRA set of RPMs
+
+    >>> p0 = dict(name="a", epoch=0, version="1", release="1", arch="noarch")
+    >>> p1 = dict(name="b", epoch="0", version="1", release="1", arch="noarch")
+    >>> rpms_fingerprint([p0, p1]) == rpms_fingerprint([p1, p0, p1])
+    True
+    >>> rpms_fingerprint([p0]) == rpms_fingerprint([p1])
+    False
+    """
+    nevras = sorted(set('\t'.join(str(p[k]) for k in nevra_keys) for p
+                        in rpms))
+    content = '\n'.join(nevras)
+
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
 
 
 def get_backend(backend, backends=BACKENDS):
+    """
+    :param backend: Backend name or class
+    :param backends: Backend list, {name: module provides Base class}
+    :return: Backend class; the module is imported only at this time
+
+    >>> get_backend(dict) == dict
+    True
+    """
+    if callable(backend):
+        return backend
+
     LOG.info("Using the backend: %s", backend)
-    return backends.get(backend, DEFAULT_BACKEND)
+    modname = backends.get(backend, BACKENDS[DEFAULT_BACKEND])
+    return importlib.import_module(modname).Base
 
 
 @profile
 def prepare(root, workdir=None, repos=[], did=None, cachedir=None,
             backend=DEFAULT_BACKEND, backends=BACKENDS,
-            nevra_keys=NEVRA_KEYS):
+            nevra_keys=NEVRA_KEYS, timings=None, base=None):
     """
     :param root: Root dir of RPM db, ex. / (/var/lib/rpm)
     :param workdir: Working dir to save results
@@ -874,6 +927,10 @@ def prepare(root, workdir=None, repos=[], did=None, cachedir=None,
     :param cachedir: A dir to save metadata cache of yum repos
     :param backend: Backend module to use to get updates and errata
     :param backends: Backend list
+    :param timings: A rpmkit.updateinfo.timings.Timings object to record
+        timings of phases, or None to make new one
+    :param base: Backend object initialized for `root` already to reuse, or
+        None to make new one
 
     :return: A bunch.Bunch object of (Base, workdir, installed_rpms_list)
     """
@@ -894,6 +951,9 @@ def prepare(root, workdir=None, repos=[], did=None, cachedir=None,
     host = bunch.bunchify(dict(id=did, root=root, workdir=workdir,
                                repos=repos, available=False,
                                cachedir=cachedir))
+    if timings is None:
+        timings = rpmkit.updateinfo.timings.Timings(did)
+    host.timings = timings
 
     # pylint: disable=maybe-no-member
     if not rpmkit.updateinfo.utils.check_rpmdb_root(root):
@@ -901,21 +961,36 @@ def prepare(root, workdir=None, repos=[], did=None, cachedir=None,
                  host.id, root)
         return host
 
-    base = get_backend(backend)(host.root, host.repos, workdir=host.workdir,
-                                cachedir=cachedir)
+    if base is None:
+        bcls = get_backend(backend, backends)
+        base = bcls(host.root, host.repos, workdir=host.workdir,
+                    cachedir=cachedir)
     LOG.debug(_("%s: Initialized backend %s"), host.id, base.name)
     host.base = base
 
+    # Backends record timings of phases of preparation, e.g. loading repos'
+    # metadata and the RPM DB, by themselves.
+    prepare_base = getattr(base, "prepare", None)
+    if prepare_base is not None:
+        prepare_base(timings=timings)
+
     LOG.debug(_("%s: Dump Installed RPMs list loaded from %s"),
               host.id, host.root)
-    host.installed = sorted(host.base.list_installed(),
-                            key=itemgetter(*nevra_keys))
+    with timings.phase("installed query") as rec:
+        host.installed = sorted(host.base.list_installed(),
+                                key=itemgetter(*nevra_keys))
+        rec["count"] = len(host.installed)
+
+    host.fingerprint = rpms_fingerprint(host.installed, nevra_keys)
     LOG.info(_("%s: Found %d (rebuilt=%d, replaced=%d) Installed RPMs"),
              host.id, len(host.installed),
              len([p for p in host.installed if p.get("rebuilt", False)]),
              len([p for p in host.installed if p.get("replaced", False)]))
 
-    U.json_dump(dict(data=host.installed, ), rpm_list_path(host.workdir))
+    with timings.phase("dump packages.json"):
+        U.json_dump(dict(data=host.installed, fingerprint=host.fingerprint),
+                    rpm_list_path(host.workdir), compression=True)
+    timings.dump(host.workdir)
     host.available = True
     # pylint: enable=maybe-no-member
 
@@ -973,6 +1048,9 @@ def analyze(host, score=0, keywords=ERRATA_KEYWORDS, core_rpms=[],
     """
     base = host.base
     workdir = host.workdir
+    timings = host.get("timings")
+    if timings is None:
+        timings = host.timings = rpmkit.updateinfo.timings.Timings(host.id)
 
     timestamp = datetime.datetime.now().strftime("%F %T")
     metadata = bunch.bunchify(dict(id=host.id, root=host.root,
@@ -980,23 +1058,39 @@ def analyze(host, score=0, keywords=ERRATA_KEYWORDS, core_rpms=[],
                                    backend=host.base.name, score=score,
                                    keywords=keywords,
                                    installed=len(host.installed),
+                                   fingerprint=host.fingerprint,
                                    hosts=[host.id, ],
                                    generated=timestamp))
     # pylint: disable=maybe-no-member
     LOG.debug(_("%s: Dump metadata for %s"), host.id, host.root)
     # pylint: enable=maybe-no-member
-    U.json_dump(metadata.toDict(), os.path.join(workdir, "metadata.json"))
+    with timings.phase("dump metadata.json"):
+        U.json_dump(metadata.toDict(), os.path.join(workdir,
+                                                    "metadata.json"))
+
+    with timings.phase("updates query") as rec:
+        us = U.uniq(base.list_updates(), key=itemgetter(*nevra_keys))
+        rec["count"] = len(us)
+
+    with timings.phase("errata query") as rec:
+        es = base.list_errata()
+        rec["count"] = len(es)
+
+    with timings.phase("complement") as rec:
+        es = U.uniq(errata_complement_g(es, us, score), key=itemgetter("id"),
+                    reverse=True)
+        rec["count"] = len(es)
 
-    us = U.uniq(base.list_updates(), key=itemgetter(*nevra_keys))
-    es = base.list_errata()
-    es = U.uniq(errata_complement_g(es, us, score), key=itemgetter("id"),
-                reverse=True)
     LOG.info(_("%s: Found %d Errata, %d Update RPMs"), host.id, len(es),
              len(us))
 
     LOG.debug(_("%s: Dump Errata and Update RPMs list..."), host.id)
-    U.json_dump(dict(data=es, ), errata_list_path(workdir))
-    U.json_dump(dict(data=us, ), updates_file_path(workdir))
+    with timings.phase("dump errata.json"):
+        U.json_dump(dict(data=es, ), errata_list_path(workdir),
+                    compression=True)
+    with timings.phase("dump updates.json"):
+        U.json_dump(dict(data=us, ), updates_file_path(workdir),
+                    compression=True)
 
     host.errata = es
     host.updates = us
@@ -1004,7 +1098,8 @@ def analyze(host, score=0, keywords=ERRATA_KEYWORDS, core_rpms=[],
 
     LOG.info(_("%s: Analyze and dump results of errata data in %s"),
              host.id, workdir)
-    dump_results(workdir, ips, es, us, score, keywords, core_rpms)
+    dump_results(workdir, ips, es, us, score, keywords, core_rpms,
+                 timings=timings)
 
     if period:
         (start_date, end_date) = period_to_dates(*period)
@@ -1017,12 +1112,14 @@ def analyze(host, score=0, keywords=ERRATA_KEYWORDS, core_rpms=[],
             LOG.debug(_("%s: Creating period working dir %s"), host.id, pdir)
             os.makedirs(pdir)
 
-        dump_results(pdir, ips, pes, us, score, keywords, core_rpms, False)
+        dump_results(pdir, ips, pes, us, score, keywords, core_rpms, False,
+                     timings=timings)
 
     if refdir:
         LOG.debug(_("%s [delta]: Analyze delta errata data by refering %s"),
                   host.id, refdir)
-        (es, us) = compute_delta(refdir, es, us)
+        with timings.phase("delta"):
+            (es, us) = compute_delta(refdir, es, us)
         LOG.info(_("%s [delta]: Found %d Errata, %d Update RPMs"), host.id,
                  len(es), len(us))
 
@@ -1032,12 +1129,19 @@ def analyze(host, score=0, keywords=ERRATA_KEYWORDS, core_rpms=[],
                       host.id, deltadir)
             os.makedirs(deltadir)
 
-        U.json_dump(dict(data=es, ), errata_list_path(deltadir))
-        U.json_dump(dict(data=us, ), updates_file_path(deltadir))
+        with timings.phase("dump errata.json"):
+            U.json_dump(dict(data=es, ), errata_list_path(deltadir),
+                        compression=True)
+        with timings.phase("dump updates.json"):
+            U.json_dump(dict(data=us, ), updates_file_path(deltadir),
+                        compression=True)
 
         LOG.info(_("%s: Analyze and dump results of delta errata in %s"),
                  host.id, deltadir)
-        dump_results(workdir, ips, es, us, score, keywords, core_rpms)
+        dump_results(workdir, ips, es, us, score, keywords, core_rpms,
+                     timings=timings)
+
+    timings.dump(workdir)
 
 
 def main(root, workdir=None, repos=[], did=None, score=0,
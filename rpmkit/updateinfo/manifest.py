@@ -0,0 +1,139 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Manifest of inputs and results of analysis of hosts.
+
+A manifest is saved in each host's working dir after its analysis finished
+and records the inputs, that is, the identity of the RPM DB and revisions of
+yum repos' metadata, and options used. Hosts of which inputs and options are
+same as the ones in their manifests can be skipped in the next run, and runs
+interrupted can be resumed as only finished hosts have their manifests.
+"""
+import datetime
+import logging
+import os.path
+import os
+
+import rpmkit.utils as U
+
+
+LOG = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+RPMDB_SUBDIR = "var/lib/rpm"
+
+
+def rpmdb_identity(root, subdir=RPMDB_SUBDIR):
+    """
+    Compute the identity of RPM DB files cheaply from their stats.
+
+    :param root: RPM DB root dir
+    :return: A list of [filename, size, mtime] of RPM DB files
+    """
+    rpmdbdir = os.path.join(root, subdir)
+    ids = []
+    for fname in sorted(os.listdir(rpmdbdir)):
+        if fname.startswith("__db."):  # Skip BDB environment files.
+            continue
+
+        st = os.stat(os.path.join(rpmdbdir, fname))
+        ids.append([fname, st.st_size, int(st.st_mtime)])
+
+    return ids
+
+
+def host_inputs(root, base):
+    """
+    :param root: RPM DB root dir
+    :param base: Backend object to get repos' metadata revisions
+    :return: A dict represents inputs of analysis of the host
+    """
+    return dict(rpmdb=rpmdb_identity(root),
+                repos=[[rid, rev] for rid, rev in base.repo_revisions()])
+
+
+def run_options(score=0, keywords=[], rpms=[], period=(), refdir=None,
+                backend=None):
+    """
+    :return: A dict represents options affect results of analysis
+
+    >>> run_options(4.0, ["crash"], ["kernel"], ("2014-01-01", ))["period"]
+    ['2014-01-01']
+    """
+    return dict(score=score, keywords=list(keywords), rpms=list(rpms),
+                period=list(period), refdir=refdir,
+                backend=getattr(backend, "name", backend))
+
+
+def manifest_path(workdir, filename=MANIFEST_FILE):
+    return os.path.join(workdir, filename)
+
+
+def load(workdir):
+    """
+    :param workdir: Host's working dir
+    :return: A dict of the manifest or None if not found or broken
+    """
+    mpath = manifest_path(workdir)
+    if not os.path.exists(mpath):
+        return None
+
+    try:
+        return U.json_load(mpath)
+    except (IOError, OSError, ValueError) as exc:
+        LOG.warn("Failed to load the manifest %s: %s", mpath, exc)
+        return None
+
+
+def save(workdir, inputs, options, fingerprint, ref=None):
+    """
+    Save the manifest of the host finished its analysis.
+
+    :param workdir: Host's working dir
+    :param inputs: A dict of inputs, see :function:`host_inputs`
+    :param options: A dict of options, see :function:`run_options`
+    :param fingerprint: Fingerprint of the host's installed RPMs
+    :param ref: ID of the reference host results refer to or None
+    """
+    timestamp = datetime.datetime.now().strftime("%F %T")
+    mpath = manifest_path(workdir)
+    tmp = "%s.%d.tmp" % (mpath, os.getpid())
+
+    U.json_dump(dict(inputs=inputs, options=options, fingerprint=fingerprint,
+                     ref=ref, finished=timestamp), tmp)
+    os.rename(tmp, mpath)
+
+
+def is_up_to_date(manifest, inputs, options):
+    """
+    :param manifest: A dict of the manifest or None
+    :param inputs: A dict of the current inputs
+    :param options: A dict of the current options
+    :return: True if results of the previous run are still valid
+
+    >>> inputs = dict(rpmdb=[["Packages", 1, 1]], repos=[["a", "1"]])
+    >>> opts = run_options()
+    >>> m = dict(inputs=inputs, options=opts, fingerprint="x")
+    >>> is_up_to_date(m, inputs, opts)
+    True
+    >>> is_up_to_date(None, inputs, opts)
+    False
+    >>> is_up_to_date(m, dict(inputs, repos=[["a", "2"]]), opts)
+    False
+    >>> is_up_to_date(m, inputs, run_options(score=4.0))
+    False
+    >>> inputs = dict(rpmdb=[["Packages", 1, 1]], repos=[["a", None]])
+    >>> is_up_to_date(dict(m, inputs=inputs), inputs, opts)
+    False
+    """
+    if not manifest:
+        return False
+
+    if any(rev is None for _rid, rev in inputs["repos"]):
+        return False  # Revisions of some repos are unknown.
+
+    return manifest.get("inputs") == inputs and \
+        manifest.get("options") == options
+
+# vim:sw=4:ts=4:et:
@@ -9,22 +9,42 @@
 #
 from rpmkit.globals import _
 
+import rpmkit.updateinfo.archive as RUARCH
 import rpmkit.updateinfo.main as RUM
+import rpmkit.updateinfo.manifest as RUMF
+import rpmkit.updateinfo.store as RUSTORE
+import rpmkit.updateinfo.timings as RUT
 import rpmkit.updateinfo.utils
 import rpmkit.utils as U
 
-# It looks available in EPEL for RHELs:
-#   https://apps.fedoraproject.org/packages/python-bunch
-import bunch
+import collections
 import glob
-import itertools
 import logging
 import multiprocessing
 import operator
 import os
 import os.path
 import shutil
+import traceback
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
+# It looks available in EPEL for RHELs:
+#   https://apps.fedoraproject.org/packages/python-bunch
+bunch = U.lazy_import("bunch")
 
 LOG = logging.getLogger("rpmkit.updateinfo")
 
@@ -41,11 +61,22 @@ def hosts_rpmroot_g(hosts_datadir):
     <host_identity> may be a hostname, host id, fqdn or something to
     identify that host.
 
+    Archives of hosts' data, <host_identity>.tar.gz or .tar.xz, are also
+    accepted instead of dirs and RPM DBs in them are extracted later just
+    before analysis (see :function:`rpmkit.updateinfo.archive.rpmdb_root`).
+
     :param hosts_datadir: Dir in which rpm db roots of hosts exist
     :return: A generator to yield a tuple,
-        (host_identity, host_rpmroot or None)
+        (host_identity, host_rpmroot or archive path or None)
     """
     for hostdir in glob.glob(os.path.join(hosts_datadir, '*')):
+        if RUARCH.is_archive(hostdir):
+            yield (RUARCH.host_id(hostdir), hostdir)
+            continue
+
+        if not os.path.isdir(hostdir):
+            continue  # e.g. fingerprints.json if workdir == hosts_datadir.
+
         if rpmkit.updateinfo.utils.check_rpmdb_root(hostdir):
             yield (os.path.basename(hostdir), hostdir)
         else:
@@ -54,11 +85,12 @@ def hosts_rpmroot_g(hosts_datadir):
 
 
 def touch(filepath):
-    open(filepath, 'w').write()
+    open(filepath, 'w').close()
 
 
 def prepare(hosts_datadir, workdir=None, repos=[], cachedir=None,
-            backend=RUM.DEFAULT_BACKEND, backends=RUM.BACKENDS):
+            backend=RUM.DEFAULT_BACKEND, backends=RUM.BACKENDS,
+            options=None, scratchdir=None):
     """
     Scan and collect hosts' basic data (installed rpms list, etc.).
 
@@ -68,9 +100,12 @@ def prepare(hosts_datadir, workdir=None, repos=[], cachedir=None,
     :param cachedir: A dir to save metadata cache of yum repos
     :param backend: Backend module to use to get updates and errata
     :param backends: Backend list
+    :param options: A dict of options affect results (see
+        :function:`rpmkit.updateinfo.manifest.run_options`) to skip hosts
+        of which results are up-to-date, or None to process all hosts
+    :param scratchdir: Dir to extract RPM DBs from archives of hosts' data
 
-    :return: A generator to yield a tuple,
-        (host_identity, host_rpmroot or None)
+    :return: A generator to yield host objects
     """
     if workdir is None:
         LOG.info(_("Set workdir to hosts_datadir: %s"), hosts_datadir)
@@ -80,17 +115,9 @@ def prepare(hosts_datadir, workdir=None, repos=[], cachedir=None,
             LOG.debug(_("Creating working dir: %s"), workdir)
             os.makedirs(workdir)
 
-    for h, root in hosts_rpmroot_g(hosts_datadir):
-        hworkdir = os.path.join(workdir, h)
-        if not hworkdir:
-            os.makedirs(hworkdir)
-
-        if root is None:
-            touch(os.path.join(hworkdir, "RPMDB_NOT_AVAILABLE"))
-            yield bunch.bunchify(dict(id=h, workdir=hworkdir, available=False))
-        else:
-            yield RUM.prepare(root, hworkdir, repos, h, cachedir, backend,
-                              backends)
+    for hdesc in host_descriptors_g(hosts_datadir, workdir, repos, cachedir,
+                                    backend, backends, options, scratchdir):
+        yield prepare_host(hdesc)
 
 
 def p2nevra(p):
@@ -101,46 +128,429 @@ def p2nevra(p):
                                "arch")(p)
 
 
-def add_host_to_metadata(workdir, host):
+_FINGERPRINTS_FILE = "fingerprints.json"
+
+
+def load_fingerprints(workdir, filename=_FINGERPRINTS_FILE):
+    """
+    Load fingerprints of hosts' installed RPMs saved in previous runs.
+
+    :param workdir: Working dir to save results
+    :return: A dict of {fingerprint: reference_host_id}
+    """
+    fpath = os.path.join(workdir, filename)
+    if not os.path.exists(fpath):
+        return dict()
+
+    try:
+        return U.json_load(fpath).get("refs", dict())
+    except (IOError, OSError, ValueError) as exc:
+        LOG.warn(_("Failed to load fingerprints from %s: %s"), fpath, exc)
+        return dict()
+
+
+def save_fingerprints(workdir, hgroups, filename=_FINGERPRINTS_FILE):
+    """
+    :param workdir: Working dir to save results
+    :param hgroups: A list of (fingerprint, ref_host_id, [host_id])
+    """
+    refs = dict((fp, ref) for fp, ref, _hids in hgroups)
+    hosts = dict((hid, fp) for fp, _ref, hids in hgroups for hid in hids)
+    U.json_dump(dict(refs=refs, hosts=hosts),
+                os.path.join(workdir, filename))
+
+
+def group_by_fingerprints(hosts, prev_refs=None,
+                          fingerprint=operator.attrgetter("fingerprint"),
+                          hid=operator.attrgetter("id")):
+    """
+    Group hosts by fingerprints of their installed RPMs in O(n).
+
+    :param hosts: A list of host objects
+    :param prev_refs: A dict of {fingerprint: reference_host_id} loaded from
+        results of the previous run, to keep selecting the same reference
+        host across runs as much as possible
+    :param fingerprint: A function to get the fingerprint of a host object
+    :param hid: A function to get the ID of a host object
+
+    :return: A list of (fingerprint, [host]) and the first one in hosts of
+        each item is the reference host
+
+    >>> hs = [("a", "x"), ("b", "y"), ("c", "x"), ("d", "x")]
+    >>> (fpf, hidf) = (operator.itemgetter(1), operator.itemgetter(0))
+    >>> group_by_fingerprints(hs, None, fpf, hidf)
+    [('x', [('a', 'x'), ('c', 'x'), ('d', 'x')]), ('y', [('b', 'y')])]
+    >>> group_by_fingerprints(hs, dict(x='c'), fpf, hidf)[0]
+    ('x', [('c', 'x'), ('a', 'x'), ('d', 'x')])
+    """
+    groups = collections.OrderedDict()
+    for host in hosts:
+        groups.setdefault(fingerprint(host), []).append(host)
+
+    if prev_refs:
+        for fp, hs in groups.items():
+            ref = prev_refs.get(fp)
+            idx = [i for i, h in enumerate(hs) if hid(h) == ref]
+            if idx and idx[0] > 0:
+                hs.insert(0, hs.pop(idx[0]))
+
+    return list(groups.items())
+
+
+def add_hosts_to_metadata(workdir, hids):
+    """
+    Add hosts to the list of hosts share results in the metadata at once.
+
+    :param workdir: Working dir of the reference host
+    :param hids: A list of host IDs
+    """
     metadatafile = os.path.join(workdir, "metadata.json")
 
     shutil.copy2(metadatafile, metadatafile + ".save")
     metadata = U.json_load(metadatafile)
-    metadata["hosts"].append(host)
-    U.json_dump(metadata, metadatafile)
+    hosts = [h for h in hids if h not in metadata["hosts"]]
+    if hosts:
+        metadata["hosts"].extend(hosts)
+        U.json_dump(metadata, metadatafile)
 
 
-def mk_symlinks_to_results_of_ref_host(href, hsrest):
+def link_results_of_ref_host(href, hsrest, storedir):
     """
+    Save results of the reference host into the content-addressed store and
+    make hard links to them in working dirs of other hosts.
+
     :param href: Reference host object
     :param hsrest: A list of hosts having same installed rpms as `href`
-
-    TODO: Ugly code around symlinks ...
+    :param storedir: Store dir, see :function:`rpmkit.updateinfo.store.put`
     """
-    orgdir = os.path.abspath(os.curdir)
+    add_hosts_to_metadata(href.workdir, [h.id for h in hsrest])
 
+    files = RUSTORE.put_results(storedir, href.workdir,
+                                (RUMF.MANIFEST_FILE, "metadata.json.save",
+                                 RUT.TIMINGS_FILE))
     for h in hsrest:
-        os.chdir(h.workdir)
-        href_workdir = os.path.join('..', href.id)  # TODO: Keep consistency.
-        LOG.info(_("%s: Make symlinks to results in %s/"), h.id, href_workdir)
-        for src in glob.glob(os.path.join(href_workdir, '*.*')):
-            dst = os.path.basename(src)
-            if not os.path.exists(dst):
-                LOG.debug("Make a symlink to %s", src)
-                os.symlink(src, dst)
-
-        add_host_to_metadata(href_workdir, h.id)
-        os.chdir(orgdir)
+        LOG.info(_("%s: Make links to results of %s"), h.id, href.id)
+        RUSTORE.link_results(storedir, files, h.workdir)
 
 
 def analyze(args):
     RUM.analyze(*args)
 
 
+def host_descriptors_g(hosts_datadir, workdir=None, repos=[], cachedir=None,
+                       backend=RUM.DEFAULT_BACKEND, backends=RUM.BACKENDS,
+                       options=None, scratchdir=None):
+    """
+    Make picklable descriptors of hosts can be passed to worker processes.
+    Each worker initializes its backend from the descriptor by itself because
+    backend objects (dnf.Base, etc.) are neither picklable nor fork-safe.
+
+    :param hosts_datadir: Dir in which rpm db roots of hosts exist
+    :param workdir: Working dir to save results
+    :param repos: List of yum repos to get updateinfo data (errata and updtes)
+    :param cachedir: A dir to save metadata cache of yum repos, or None to
+        save under the host's RPM DB root or workdir if it's an archive
+    :param backend: Backend module to use to get updates and errata
+    :param backends: Backend list
+    :param options: A dict of options or None, see :function:`prepare`
+    :param scratchdir: Dir to extract RPM DBs from archives of hosts' data
+
+    :return: A generator to yield a dict represents a host
+    """
+    if workdir is None:
+        workdir = hosts_datadir
+
+    for h, root in hosts_rpmroot_g(hosts_datadir):
+        hworkdir = os.path.join(workdir, h)
+        if not os.path.exists(hworkdir):
+            os.makedirs(hworkdir)
+
+        if root is None:
+            touch(os.path.join(hworkdir, "RPMDB_NOT_AVAILABLE"))
+
+        hcachedir = cachedir
+        if hcachedir is None and root is not None and \
+                RUARCH.is_archive(root):
+            # Keep metadata of repos on persistent storage as RPM DBs
+            # extracted from archives are removed after analysis.
+            hcachedir = os.path.join(hworkdir, "var/cache")
+
+        yield dict(id=h, root=root, workdir=hworkdir, repos=repos,
+                   cachedir=hcachedir, backend=backend, backends=backends,
+                   options=options, scratchdir=scratchdir)
+
+
+def _prepare_host(hdesc, base=None):
+    """
+    :param hdesc: A dict represents a host, see :function:`host_descriptors_g`
+    :param base: Backend object initialized for the host already or None
+    :return: A host object
+    """
+    RUSTORE.release(hdesc["workdir"])
+    with RUARCH.rpmdb_root(hdesc["root"], hdesc.get("scratchdir")) as root:
+        host = RUM.prepare(root, hdesc["workdir"], hdesc["repos"],
+                           hdesc["id"], hdesc["cachedir"], hdesc["backend"],
+                           hdesc["backends"], base=base)
+
+    if base is not None and not host.available:
+        base.close()
+
+    archive = hdesc.get("archive", hdesc["root"])
+    if RUARCH.is_archive(archive):
+        host.root = os.path.abspath(archive)  # Not the temporal one.
+
+    return host
+
+
+def check_host_inputs(hdesc):
+    """
+    Check inputs of the host and its manifest saved in the previous run.
+
+    :param hdesc: A dict represents a host, see :function:`host_descriptors_g`
+    :return: A tuple of (inputs, manifest or None if results are outdated,
+        backend object initialized to compute inputs and can be reused to
+        prepare the host)
+    """
+    (root, repos) = (hdesc["root"], hdesc["repos"])
+    if not repos:
+        repos = rpmkit.updateinfo.utils.guess_rhel_repos(root)
+
+    bcls = RUM.get_backend(hdesc["backend"], hdesc["backends"])
+    base = bcls(root, repos, workdir=hdesc["workdir"],
+                cachedir=hdesc["cachedir"])
+    try:
+        inputs = RUMF.host_inputs(root, base)
+    except Exception:
+        base.close()
+        raise
+
+    manifest = RUMF.load(hdesc["workdir"])
+
+    if RUMF.is_up_to_date(manifest, inputs, hdesc["options"]):
+        return (inputs, manifest, base)
+
+    return (inputs, None, base)
+
+
+def prepare_host(hdesc):
+    """
+    :param hdesc: A dict represents a host, see :function:`host_descriptors_g`
+    :return: A host object
+    """
+    if hdesc["root"] is None:
+        return bunch.Bunch(id=hdesc["id"], workdir=hdesc["workdir"],
+                           available=False)
+
+    if hdesc["options"] is None:
+        return _prepare_host(hdesc)
+
+    # Extract the RPM DB from the archive only once if it's an archive.
+    with RUARCH.rpmdb_root(hdesc["root"], hdesc.get("scratchdir")) as root:
+        xdesc = dict(hdesc, root=root, archive=hdesc["root"])
+        (inputs, manifest, base) = check_host_inputs(xdesc)
+        if manifest:
+            base.close()
+            LOG.info(_("%s: Skip as its inputs were not changed since %s"),
+                     hdesc["id"], manifest.get("finished"))
+            return bunch.Bunch(id=hdesc["id"], root=hdesc["root"],
+                               workdir=hdesc["workdir"], available=True,
+                               skipped=True, inputs=inputs,
+                               fingerprint=manifest["fingerprint"],
+                               ref=manifest.get("ref"))
+
+        host = _prepare_host(xdesc, base)
+
+    host.inputs = inputs
+    return host
+
+
+def _claim_ref(refs, host):
+    """
+    Register the host as the reference host of its group of hosts having
+    same installed RPMs, or find the reference host already registered of
+    which results can be used for the host.
+
+    :param refs: A dict (or a dict proxy shared among processes) of
+        {fingerprint: reference host}, updated in this function
+    :param host: A light host object, see :function:`_light_host`
+    :return: The reference host if results of it can be used for `host`, or
+        None if `host` must be analyzed (or skipped as its results are
+        up-to-date)
+
+    >>> refs = dict()
+    >>> hs = [bunch.Bunch(id=c, fingerprint="x", skipped=False,
+    ...                   inputs=dict(repos=[["r", "1"]])) for c in "ab"]
+    >>> _claim_ref(refs, hs[0]) is None
+    True
+    >>> _claim_ref(refs, hs[1]).id
+    'a'
+    >>> refs = dict(x=bunch.Bunch(hs[0], skipped=True,
+    ...                           inputs=dict(repos=[["r", "0"]])))
+    >>> _claim_ref(refs, hs[1]) is None
+    True
+    >>> refs["x"].id
+    'b'
+    """
+    ref = refs.get(host.fingerprint)
+    if host.skipped:  # Results are up-to-date.
+        if ref is None and host.ref in (None, host.id):
+            refs[host.fingerprint] = host
+        return None
+
+    # Results of the reference host skipped can be used only if these were
+    # generated with same repos.
+    if ref is not None and (not ref.skipped or
+                            ref.inputs["repos"] == host.inputs["repos"]):
+        return ref
+
+    refs[host.fingerprint] = host
+    return None
+
+
+def save_manifest(host, options, ref=None):
+    """
+    :param host: A host object finished its analysis
+    :param options: A dict of options, see :function:`prepare`
+    :param ref: The reference host if results of `host` refer to it
+    """
+    if options is not None and host.get("inputs") is not None:
+        RUMF.save(host.workdir, host.inputs, options, host.fingerprint,
+                  None if ref is None else ref.id)
+
+
+def analyze_host_worker(args):
+    """
+    Prepare a host and analyze it in a worker process unless results of
+    other host having same installed RPMs can be used for it.
+
+    :param args: A tuple of (host_descriptor, refs, lock, score, keywords,
+        rpms, period, refdir) where `refs` is a dict proxy shared among
+        workers, see :function:`_claim_ref`, and `lock` is a lock for it
+    :return: A dict represents the light host object with 'analyzed' and
+        'refer' (the ID of the reference host or None) or None if RPM DB of
+        the host is not available
+    """
+    (hdesc, refs, lock) = args[:3]
+    host = prepare_host(hdesc)
+    if not host.available:
+        return None
+
+    lhost = _light_host(host)
+    with lock:
+        ref = _claim_ref(refs, lhost)
+
+    analyzed = not lhost.skipped and ref is None
+    if analyzed:
+        analyze((host, ) + tuple(args[3:]))
+
+    if host.get("base") is not None:
+        host.base.close()
+
+    return dict(lhost, analyzed=analyzed, refer=None if ref is None else
+                ref.id)
+
+
+def _set_memlimit(memlimit):
+    """
+    :param memlimit: Max memory (address space) size of the process in bytes
+    """
+    if memlimit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memlimit, memlimit))
+
+
+def _run_worker(func, idx, arg, memlimit, results):
+    """
+    :param results: A multiprocessing.Queue to put pickled (idx, result,
+        error) where either result or error is None
+    """
+    _set_memlimit(memlimit)
+    try:
+        res = pickle.dumps((idx, func(arg), None), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        res = pickle.dumps((idx, None, traceback.format_exc()))
+
+    results.put(res)
+
+
+def _drain(results, received, timeout):
+    """
+    Read all results in the queue.
+
+    :param results: A multiprocessing.Queue, see :function:`_run_worker`
+    :param received: A dict of {idx: (result, error)}, updated
+    :param timeout: Timeout in seconds to wait for the first result
+    """
+    try:
+        item = results.get(timeout=timeout)
+        while True:
+            (idx, res, err) = pickle.loads(item)
+            received[idx] = (res, err)
+            item = results.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def run_in_parallel(func, args_list, nprocs=None, memlimit=None):
+    """
+    Run `func` for each args in `args_list` in worker processes, at most
+    `nprocs` workers at once. Each job runs in a newly forked process so that
+    errors or crashes of it will not affect others.
+
+    :param func: Function to run in worker processes
+    :param args_list: A list of picklable args to pass to `func`
+    :param nprocs: Max number of worker processes run in parallel
+    :param memlimit: Max memory size of each worker process in bytes
+
+    :return: A generator to yield a tuple of (arg, result, error), and either
+        result or error is None
+    """
+    if nprocs is None:
+        nprocs = multiprocessing.cpu_count()
+
+    results = multiprocessing.Queue()
+    pending = list(enumerate(args_list))
+    procs = dict()  # {idx: process}
+    received = dict()  # {idx: (result, error)}
+    args = dict(pending)
+
+    while pending or procs:
+        while pending and len(procs) < nprocs:
+            (idx, arg) = pending.pop(0)
+            proc = multiprocessing.Process(target=_run_worker,
+                                           args=(func, idx, arg, memlimit,
+                                                 results))
+            proc.start()
+            procs[idx] = proc
+
+        # Results must be read before joining workers as they may block until
+        # the results are read.
+        _drain(results, received, 0.5)
+
+        for idx, proc in list(procs.items()):
+            if proc.is_alive():
+                continue
+
+            proc.join()
+            del procs[idx]
+            if idx not in received:  # It may be put just before exited.
+                _drain(results, received, 0.1)
+
+            (res, err) = received.pop(idx, (None, "Worker process exited "
+                                            "without results: exitcode=%d"
+                                            % proc.exitcode))
+            yield (args.pop(idx), res, err)
+
+
+def _log_errors(errors):
+    for hid, err in errors:
+        LOG.error(_("%s: Failed to analyze: %s"), hid, err)
+
+
 def main(hosts_datadir, workdir=None, repos=[], score=-1,
          keywords=RUM.ERRATA_KEYWORDS, rpms=[], period=(), cachedir=None,
          refdir=None, verbosity=0, multiproc=False,
-         backend=RUM.DEFAULT_BACKEND, backends=RUM.BACKENDS):
+         backend=RUM.DEFAULT_BACKEND, backends=RUM.BACKENDS, nprocs=None,
+         memlimit=None, incremental=False, scratchdir=None):
     """
     :param hosts_datadir: Dir in which rpm db roots of hosts exist
     :param workdir: Working dir to save results
@@ -158,40 +568,216 @@ def main(hosts_datadir, workdir=None, repos=[], score=-1,
         in parallel as much as possible if True
     :param backend: Backend module to use to get updates and errata
     :param backends: Backend list
+    :param nprocs: Max number of worker processes in multiproc mode
+    :param memlimit: Max memory size of each worker process in bytes
+    :param incremental: Skip hosts of which RPM DBs, repos' metadata and
+        options are not changed since the previous run if True. Runs
+        interrupted are also resumed from unfinished hosts.
+    :param scratchdir: Dir to extract RPM DBs from archives of hosts' data
+        temporally, tmpfs (/dev/shm) by default
     """
     RUM.set_loglevel(verbosity)
 
-    all_hosts = list(prepare(hosts_datadir, workdir, repos, cachedir, backend,
-                             backends))
-    hosts = [h for h in all_hosts if h.available]
-
-    LOG.info(_("Analyze %d/%d hosts"), len(hosts), len(all_hosts))
-
-    ilen = lambda h: len(h.installed)
-    hps = lambda h: [p2nevra(p) for p in h.installed]
-    gby = lambda xs, kf: itertools.groupby(sorted(xs, key=kf), kf)
-
-    # Group hosts by installed rpms to degenerate these hosts and avoid to
-    # analyze for same installed RPMs more than once. his :: [[[h]]]
-    his = [[list(g2) for _k2, g2 in gby(g, hps)] for _k, g in gby(hosts, ilen)]
-
-    for hss in his:
-        hset = [(hs[0], hs[1:]) for hs in hss]
-        hsdata = [(h, score, keywords, rpms, period, refdir) for h, _hrest
-                  in hset]
-
-        # Disabled until fixing bugs:
-        # if multiproc:
-        #    pool = multiprocessing.Pool(multiprocessing.cpu_count())
-        #    pool.map(analyze, hsdata)
-        for args in hsdata:
-            analyze(args)
-
-        for h, hsrest in hset:
-            if hsrest:
-                LOG.info(_("Skip to analyze %s as its installed RPMs are "
-                           "exactly same as %s's"),
-                         ','.join(x.id for x in hsrest), h)
-                mk_symlinks_to_results_of_ref_host(h, hsrest)
+    if incremental:
+        options = RUMF.run_options(score, keywords, rpms, period, refdir,
+                                   backend)
+    else:
+        options = None
+
+    if multiproc:
+        return main_multiproc(hosts_datadir, workdir, repos, score, keywords,
+                              rpms, period, cachedir, refdir, backend,
+                              backends, nprocs, memlimit, options,
+                              scratchdir)
+
+    # Process hosts one by one and keep light objects of them only to keep
+    # memory usage bounded.
+    workdir = hosts_datadir if workdir is None else workdir
+    storedir = RUSTORE.store_dir(workdir)
+    prev_refs = load_fingerprints(workdir)
+
+    # Try reference hosts in the previous run at first to reuse their results
+    # as much as possible.
+    prev_ref_ids = set(prev_refs.values())
+    hdescs = sorted(host_descriptors_g(hosts_datadir, workdir, repos, cachedir,
+                                       backend, backends, options, scratchdir),
+                    key=lambda hdesc: hdesc["id"] not in prev_ref_ids)
+
+    groups = collections.OrderedDict()  # {fingerprint: bunch.Bunch}
+    refs = dict()  # {fingerprint: ref_host}
+    links = collections.OrderedDict()  # {ref_host_id: (ref_host, [host])}
+
+    processed = []  # IDs of hosts prepared in this run.
+    for hdesc in hdescs:
+        lhost = _process_host(hdesc, groups, refs, links, score, keywords,
+                              rpms, period, refdir, options)
+        if lhost is not None and not lhost.skipped:
+            processed.append(lhost.id)
+
+    LOG.info(_("Analyzed %d hosts, and results of other %d hosts refer to "
+               "them"), len([g for g in groups.values() if g.analyzed]),
+             sum(len(hs) for _ref, hs in links.values()))
+
+    for ref, hs in links.values():
+        LOG.info(_("Skip to analyze %s as its installed RPMs are "
+                   "exactly same as %s's"), ','.join(x.id for x in hs),
+                 ref.id)
+        link_results_of_ref_host(ref, hs, storedir)
+        for x in hs:
+            save_manifest(x, options, ref)
+
+    save_fingerprints(workdir, _fingerprint_groups(groups, refs))
+    RUT.dump_rollup(workdir, processed)
+
+
+def _fingerprint_groups(groups, refs):
+    """
+    :param groups: A dict of {fingerprint: bunch.Bunch(hids=[host_id], ...)}
+    :param refs: A dict of {fingerprint: reference host}
+    :return: A list of (fingerprint, ref_host_id, [host_id])
+    """
+    return [(fp, refs[fp].id if fp in refs else g.hids[0], g.hids)
+            for fp, g in groups.items()]
+
+
+def _light_host(host):
+    """
+    :param host: A host object
+    :return: A light copy of the host object without backend and packages
+    """
+    return bunch.Bunch(id=host.id, workdir=host.workdir,
+                       fingerprint=host.fingerprint,
+                       skipped=host.get("skipped", False),
+                       inputs=host.get("inputs"), ref=host.get("ref"))
+
+
+def _process_host(hdesc, groups, refs, links, score, keywords, rpms,
+                  period, refdir, options):
+    """
+    Prepare a host, analyze it if any other hosts have same installed RPMs
+    were not analyzed yet, and release its backend and packages.
+
+    :param hdesc: A dict represents a host, see :function:`host_descriptors_g`
+    :param groups: A dict of {fingerprint: bunch.Bunch(hids=[host_id],
+        analyzed=bool)}, updated in this function
+    :param refs: A dict of {fingerprint: reference host}, updated in this
+        function, see :function:`_claim_ref`
+    :param links: A dict of {ref_host_id: (ref_host, [host])} of hosts to make
+        links to results of the reference host, updated in this function
+
+    :return: A light host object or None if the RPM DB is not available
+
+    The backend of the host is released even if it failed to analyze it.
+    """
+    host = prepare_host(hdesc)
+    if not host.available:
+        return None
+
+    try:
+        lhost = _light_host(host)
+        group = groups.setdefault(host.fingerprint,
+                                  bunch.Bunch(hids=[], analyzed=False))
+        group.hids.append(host.id)
+
+        ref = _claim_ref(refs, lhost)
+        if lhost.skipped:
+            return lhost
+
+        if ref is not None:
+            links.setdefault(ref.id, (ref, []))[1].append(lhost)
+        else:
+            analyze((host, score, keywords, rpms, period, refdir))
+            save_manifest(lhost, options)
+            group.analyzed = True
+
+        return lhost
+    finally:
+        if host.get("base") is not None:  # Skipped hosts have no backend.
+            host.base.close()
+
+
+def main_multiproc(hosts_datadir, workdir=None, repos=[], score=-1,
+                   keywords=RUM.ERRATA_KEYWORDS, rpms=[], period=(),
+                   cachedir=None, refdir=None, backend=RUM.DEFAULT_BACKEND,
+                   backends=RUM.BACKENDS, nprocs=None, memlimit=None,
+                   options=None, scratchdir=None):
+    """
+    Multiprocessing version of :function:`main`. See it for parameters.
+
+    Each host is prepared and analyzed in a worker process, only once. The
+    first worker prepared a host of each group of hosts having same
+    installed RPMs registers the host as the reference host and analyzes it,
+    and workers of other hosts in the group skip to analyze, via a dict
+    shared among workers. Links to results of reference hosts are made
+    after all workers finished.
+
+    :param options: A dict of options to skip hosts of which results are
+        up-to-date, or None, see :function:`prepare`
+
+    RPM DBs in archives of hosts' data are extracted in each worker, so that
+    at most `nprocs` RPM DBs are extracted at once.
+    """
+    workdir = hosts_datadir if workdir is None else workdir
+    storedir = RUSTORE.store_dir(workdir)
+
+    # Try reference hosts in the previous run at first to reuse their results
+    # as much as possible.
+    prev_ref_ids = set(load_fingerprints(workdir).values())
+    hdescs = sorted(host_descriptors_g(hosts_datadir, workdir, repos, cachedir,
+                                       backend, backends, options, scratchdir),
+                    key=lambda hdesc: hdesc["id"] not in prev_ref_ids)
+
+    manager = multiprocessing.Manager()
+    (srefs, lock) = (manager.dict(), manager.Lock())
+    hsargs = [(hdesc, srefs, lock, score, keywords, rpms, period, refdir)
+              for hdesc in hdescs]
+    hosts = dict()  # {host_id: light host}
+    errors = []
+    try:
+        for args, res, err in run_in_parallel(analyze_host_worker,
+                                              hsargs, nprocs, memlimit):
+            if err is not None:
+                errors.append((args[0]["id"], err))
+            elif res is not None:
+                hosts[res["id"]] = bunch.Bunch(res)
+        refs = dict(srefs)
+    finally:
+        manager.shutdown()
+
+    groups = collections.OrderedDict()  # {fingerprint: bunch.Bunch}
+    links = collections.OrderedDict()  # {ref_host_id: [host]}
+    for hdesc in hdescs:
+        h = hosts.get(hdesc["id"])
+        if h is None:
+            continue
+
+        groups.setdefault(h.fingerprint,
+                          bunch.Bunch(hids=[])).hids.append(h.id)
+        if h.analyzed:
+            save_manifest(h, options)
+        elif h.refer is not None:
+            links.setdefault(h.refer, []).append(h)
+
+    LOG.info(_("Analyzed %d/%d hosts"),
+             len([h for h in hosts.values() if h.analyzed]), len(hdescs))
+
+    for hid, hsrest in links.items():
+        ref = hosts.get(hid)
+        if ref is None:
+            errors.extend((h.id, "Failed to analyze the reference host: %s" %
+                           hid) for h in hsrest)
+            continue
+
+        LOG.info(_("Skip to analyze %s as its installed RPMs are "
+                   "exactly same as %s's"), ','.join(x.id for x in hsrest),
+                 hid)
+        link_results_of_ref_host(ref, hsrest, storedir)
+        for x in hsrest:
+            save_manifest(x, options, ref)
+
+    save_fingerprints(workdir, _fingerprint_groups(groups, refs))
+    RUT.dump_rollup(workdir, [h.id for h in hosts.values() if not h.skipped])
+    _log_errors(errors)
+    return errors
 
 # vim:sw=4:ts=4:et:
@@ -0,0 +1,378 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Distribute analysis of hosts across machines via a spool dir.
+#
+# Copyright (C) 2014 Satoru SATOH <ssato@redhat.com>
+# License: GPLv3+
+#
+"""File-spool work queue to analyze hosts on multiple machines.
+
+The coordinator enqueues jobs to analyze hosts into the spool dir on a shared
+file system, and workers on any machines claim jobs, analyze hosts and write
+results into working dirs of hosts. Layout of the spool dir:
+
+  <spooldir>/new/<host>.json              jobs not claimed yet
+  <spooldir>/claimed/<host>~<claim>.json  jobs claimed by workers
+  <spooldir>/done/<host>.json             jobs finished successfully
+  <spooldir>/failed/<host>.json           jobs failed, with errors
+
+Jobs are claimed by atomic rename(2) from new/ to claimed/, so that each job
+is claimed by only one worker. Each claim has its own path in claimed/, so
+that workers never touch nor finish jobs claimed again by others. Workers
+touch jobs they claimed periodically (heartbeat) and jobs not touched for a
+while (lease expired) are regarded as ones of dead workers and returned back
+to new/.
+"""
+from rpmkit.globals import _
+
+import rpmkit.updateinfo.main as RUM
+import rpmkit.updateinfo.multihosts as RUMS
+import rpmkit.updateinfo.timings as RUT
+import rpmkit.jsoncodec
+import rpmkit.utils as U
+
+import glob
+import logging
+import os.path
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+
+LOG = logging.getLogger("rpmkit.updateinfo")
+
+SUBDIRS = (NEW, CLAIMED, DONE, FAILED) = ("new", "claimed", "done", "failed")
+
+DEFAULT_LEASE = 600  # [sec]
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def init(spooldir):
+    """
+    :param spooldir: Spool dir
+    """
+    for sdir in SUBDIRS:
+        path = os.path.join(spooldir, sdir)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+
+def list_jobs(spooldir, state=NEW):
+    """
+    :param spooldir: Spool dir
+    :param state: Job state, one of SUBDIRS
+    :return: A list of paths of job files in given state
+    """
+    return sorted(glob.glob(os.path.join(spooldir, state, "*.json")))
+
+
+def _job_path(spooldir, state, jobid):
+    return os.path.join(spooldir, state, jobid + ".json")
+
+
+def _claimed_path(spooldir, jobid):
+    return _job_path(spooldir, CLAIMED, "%s~%s" % (jobid, uuid.uuid4().hex))
+
+
+def _jobid(path):
+    """
+    >>> _jobid("/tmp/spool/claimed/a.example.com~0123abcd.json")
+    'a.example.com'
+    >>> _jobid("/tmp/spool/new/a.example.com.json")
+    'a.example.com'
+    """
+    jobid = os.path.basename(path)[:-len(".json")]
+    if os.path.basename(os.path.dirname(path)) == CLAIMED:
+        jobid = jobid.rsplit('~', 1)[0]
+
+    return jobid
+
+
+def _dump_job(job, path):
+    tmp = "%s.%s.%d.tmp" % (path, socket.gethostname(), os.getpid())
+    U.json_dump(job, tmp)
+    os.rename(tmp, path)
+
+
+def _move(src, dst):
+    """
+    :return: True if moved, or False if `src` was moved by others
+    """
+    try:
+        os.rename(src, dst)
+        return True
+    except OSError:
+        return False
+
+
+def backend_name(backend, backends=RUM.BACKENDS):
+    """
+    :param backend: Backend name, module name or class
+    :return: Backend name can be serialized
+
+    >>> backend_name("dnf")
+    'dnf'
+    >>> backend_name(RUM.BACKENDS["dnf"])
+    'dnf'
+    """
+    modname = getattr(backend, "__module__", backend)
+    for name, bmod in backends.items():
+        if modname == bmod:
+            return name
+
+    return backend
+
+
+def enqueue(spooldir, hosts_datadir, workdir=None, repos=[], score=-1,
+            keywords=RUM.ERRATA_KEYWORDS, rpms=[], period=(), cachedir=None,
+            refdir=None, backend=RUM.DEFAULT_BACKEND):
+    """
+    Enqueue jobs to analyze hosts.
+
+    Paths should be ones on the shared file system and accessible from
+    workers with same paths. See :function:`rpmkit.updateinfo.multihosts.main`
+    for other parameters.
+
+    :param spooldir: Spool dir
+    :return: Number of jobs enqueued
+    """
+    init(spooldir)
+    workdir = os.path.abspath(hosts_datadir if workdir is None else workdir)
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+
+    njobs = 0
+    for hdesc in RUMS.host_descriptors_g(hosts_datadir, workdir, repos,
+                                         cachedir, backend):
+        if hdesc["root"] is None:
+            continue
+
+        host = dict((k, hdesc[k]) for k in ("id", "workdir", "repos",
+                                            "cachedir"))
+        host["root"] = os.path.abspath(hdesc["root"])
+        host["backend"] = backend_name(backend)
+
+        job = dict(host=host, score=score, keywords=keywords, rpms=rpms,
+                   period=list(period), refdir=refdir, attempts=0,
+                   compression=rpmkit.jsoncodec.DEFAULT_COMPRESSION)
+        _dump_job(job, _job_path(spooldir, NEW, hdesc["id"]))
+        njobs += 1
+
+    LOG.info(_("Enqueued %d jobs in %s"), njobs, spooldir)
+    return njobs
+
+
+def requeue_expired(spooldir, lease=DEFAULT_LEASE):
+    """
+    Return jobs of which lease expired (workers may be dead) back to new/.
+
+    :param spooldir: Spool dir
+    :param lease: Lease time of jobs in seconds
+    :return: Number of jobs requeued
+    """
+    now = time.time()
+    nrequeued = 0
+    for path in list_jobs(spooldir, CLAIMED):
+        try:
+            if now - os.stat(path).st_mtime < lease:
+                continue
+        except OSError:  # Finished or requeued by others.
+            continue
+
+        newpath = _job_path(spooldir, NEW, _jobid(path))
+        if _move(path, newpath):
+            LOG.warn(_("Lease of the job expired and requeued: %s"), newpath)
+            nrequeued += 1
+
+    return nrequeued
+
+
+def claim(spooldir, worker, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Claim a job.
+
+    :param spooldir: Spool dir
+    :param worker: Worker ID
+    :param max_attempts: Max number of attempts for each job
+
+    :return: A tuple of (path of the job claimed, job) or None if there are
+        no jobs
+    """
+    for path in list_jobs(spooldir, NEW):
+        jobid = _jobid(path)
+        cpath = _claimed_path(spooldir, jobid)
+        if not _move(path, cpath):
+            continue  # Claimed by other workers.
+
+        # Start the lease now; rename(2) keeps the mtime of enqueued one.
+        os.utime(cpath, None)
+
+        job = U.json_load(cpath)
+        job["attempts"] = job.get("attempts", 0) + 1
+        job["worker"] = worker
+
+        if job["attempts"] > max_attempts:
+            job["error"] = "Too many attempts: %d" % (job["attempts"] - 1)
+            _finish(job, cpath, _job_path(spooldir, FAILED, jobid))
+            continue
+
+        _dump_job(job, cpath)
+        return (cpath, job)
+
+    return None
+
+
+def _finish(job, path, dst):
+    """
+    Move the job claimed to `dst` and save it there.
+
+    :return: True if finished, or False if the job was requeued by others
+    """
+    if not _move(path, dst):
+        return False
+
+    _dump_job(job, dst)
+    return True
+
+
+class Heartbeat(threading.Thread):
+    """
+    Thread to touch the job claimed periodically to keep its lease.
+    """
+
+    def __init__(self, path, interval):
+        super(Heartbeat, self).__init__()
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            try:
+                os.utime(self.path, None)
+            except OSError:
+                break  # Requeued by others as the lease expired.
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Analyze the host of the job. The backend of the host is released even if
+    it failed to analyze it, not to leak it in long-running workers.
+
+    :param job: A dict represents a job, see :function:`enqueue`
+    """
+    rpmkit.jsoncodec.set_default_compression(job.get("compression"))
+    hdesc = dict(job["host"], backends=RUM.BACKENDS)
+    host = RUMS._prepare_host(hdesc)
+    try:
+        if host.available:
+            RUM.analyze(host, job["score"], job["keywords"], job["rpms"],
+                        job["period"], job["refdir"])
+    finally:
+        if host.get("base") is not None:
+            host.base.close()
+
+
+def work(spooldir, lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS,
+         wait=False, interval=5):
+    """
+    Worker to claim jobs and run them until no jobs are left.
+
+    :param spooldir: Spool dir
+    :param lease: Lease time of jobs in seconds
+    :param max_attempts: Max number of attempts for each job
+    :param wait: Keep waiting for new jobs if True
+    :param interval: Interval in seconds to wait for new jobs
+
+    :return: Number of jobs processed
+    """
+    init(spooldir)
+    worker = "%s:%d" % (socket.gethostname(), os.getpid())
+    njobs = 0
+
+    while True:
+        requeue_expired(spooldir, lease)
+        claimed = claim(spooldir, worker, max_attempts)
+        if claimed is None:
+            if wait or list_jobs(spooldir, CLAIMED):
+                time.sleep(interval)
+                continue
+            break
+
+        (path, job) = claimed
+        LOG.info(_("%s: Claimed the job: %s"), worker, path)
+        heartbeat = Heartbeat(path, max(lease / 3.0, 0.1))
+        heartbeat.start()
+        try:
+            run_job(job)
+            state = DONE
+        except Exception:
+            job["error"] = traceback.format_exc()
+            LOG.error(_("%s: Failed the job %s: %s"), worker, path,
+                      job["error"])
+            state = FAILED
+        finally:
+            heartbeat.stop()
+
+        job["finished"] = time.strftime("%F %T")
+        if not _finish(job, path, _job_path(spooldir, state, _jobid(path))):
+            LOG.warn(_("%s: The job was requeued as its lease expired: %s"),
+                     worker, path)
+        njobs += 1
+
+    return njobs
+
+
+def status(spooldir):
+    """
+    :param spooldir: Spool dir
+    :return: A dict of {state: number of jobs in the state}
+    """
+    return dict((s, len(list_jobs(spooldir, s))) for s in SUBDIRS)
+
+
+def main(spooldir, hosts_datadir, workdir=None, repos=[], score=-1,
+         keywords=RUM.ERRATA_KEYWORDS, rpms=[], period=(), cachedir=None,
+         refdir=None, verbosity=0, backend=RUM.DEFAULT_BACKEND,
+         lease=DEFAULT_LEASE, interval=5):
+    """
+    Coordinator to enqueue jobs and wait for workers to finish them.
+
+    See :function:`rpmkit.updateinfo.multihosts.main` for parameters.
+
+    :param spooldir: Spool dir
+    :param lease: Lease time of jobs in seconds
+    :param interval: Interval in seconds to check status of jobs
+    :return: A dict of {state: number of jobs in the state}
+    """
+    RUM.set_loglevel(verbosity)
+    workdir = os.path.abspath(hosts_datadir if workdir is None else workdir)
+    enqueue(spooldir, hosts_datadir, workdir, repos, score, keywords, rpms,
+            period, cachedir, refdir, backend)
+
+    while True:
+        requeue_expired(spooldir, lease)
+        stat = status(spooldir)
+        if not stat[NEW] and not stat[CLAIMED]:
+            break
+
+        LOG.info(_("Waiting for workers: %(new)d new, %(claimed)d claimed, "
+                   "%(done)d done, %(failed)d failed"), stat)
+        time.sleep(interval)
+
+    for path in list_jobs(spooldir, FAILED):
+        LOG.error(_("Failed: %s: %s"), path, U.json_load(path).get("error"))
+
+    RUT.dump_rollup(workdir)
+    return stat
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,216 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Content-addressed store of result files shared among hosts.
+
+Hosts having exactly same installed RPMs have same results, so that result
+files of the reference host are saved in the store as blobs named by hashes
+of their content and hosts refer to them by hard links (or copies if hard
+links are not available).
+
+Only result files are saved and linked, not other files in the host's
+working dir which may be the rpm db root of the host (the default). Blobs are
+copies of original result files, so that results of hosts can be updated
+independently; Hard links to blobs in the host's working dir are recorded in
+the links file and must be released by :function:`release` before the host
+is analyzed again.
+"""
+import errno
+import glob
+import hashlib
+import json
+import logging
+import os.path
+import os
+import re
+import shutil
+import socket
+
+
+LOG = logging.getLogger(__name__)
+
+STORE_DIR = ".store"
+LINKS_FILE = ".links.json"
+
+# Sub dirs to save results in: delta/ and <start_date>_<end_date>/.
+_RESULT_SUBDIR_RE = re.compile(r"^(delta|[0-9-]+_[0-9-]+)$")
+
+
+def store_dir(workdir, subdir=STORE_DIR):
+    """
+    :param workdir: Top working dir to save results of hosts
+    """
+    return os.path.join(workdir, subdir)
+
+
+def file_digest(filepath, bufsize=65536):
+    """
+    :param filepath: File path
+    :return: SHA-1 hex digest of the content of given file
+    """
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def blob_path(storedir, digest):
+    """
+    >>> blob_path("/tmp/w/.store", "0123abcd")
+    '/tmp/w/.store/01/23abcd'
+    """
+    return os.path.join(storedir, digest[:2], digest[2:])
+
+
+def _tmppath(path):
+    """
+    :return: Path of temporary file unique among processes on hosts share
+        the store, e.g. on NFS
+    """
+    return "%s.%s.%d.tmp" % (path, socket.gethostname(), os.getpid())
+
+
+def _link_or_copy(src, dst):
+    """
+    Make a hard link or a copy of `src` at `dst` atomically.
+    """
+    tmp = _tmppath(dst)
+    try:
+        os.link(src, tmp)
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(src, tmp)
+
+    os.rename(tmp, dst)
+
+
+def put(storedir, filepath):
+    """
+    Save a copy of the file in the store if not saved yet.
+
+    :param storedir: Store dir
+    :param filepath: File path to save
+    :return: Digest of the file
+    """
+    digest = file_digest(filepath)
+    blob = blob_path(storedir, digest)
+
+    if not os.path.exists(blob):
+        bdir = os.path.dirname(blob)
+        if not os.path.exists(bdir):
+            os.makedirs(bdir)
+
+        tmp = _tmppath(blob)
+        shutil.copy2(filepath, tmp)
+        os.rename(tmp, blob)
+
+    return digest
+
+
+def list_results(workdir, excludes=()):
+    """
+    List result files in the host's working dir.
+
+    :param workdir: Host's working dir
+    :param excludes: File names (not paths) to exclude
+    :return: A list of paths relative to `workdir`
+    """
+    res = []
+    subdirs = [d for d in os.listdir(workdir) if _RESULT_SUBDIR_RE.match(d)]
+    for subdir in [''] + sorted(subdirs):
+        for path in sorted(glob.glob(os.path.join(workdir, subdir, "*.*"))):
+            if os.path.basename(path) in excludes or \
+                    os.path.islink(path) or not os.path.isfile(path):
+                continue
+
+            res.append(os.path.relpath(path, workdir))
+
+    return res
+
+
+def put_results(storedir, workdir, excludes=()):
+    """
+    Save result files in the host's working dir into the store.
+
+    :param storedir: Store dir
+    :param workdir: Host's working dir
+    :param excludes: File names (not paths) to exclude
+    :return: A dict of {path relative to `workdir`: digest}
+    """
+    return dict((relpath, put(storedir, os.path.join(workdir, relpath)))
+                for relpath in list_results(workdir, excludes))
+
+
+def _links_path(workdir):
+    return os.path.join(workdir, LINKS_FILE)
+
+
+def load_links(workdir):
+    """
+    :param workdir: Host's working dir
+    :return: A list of paths relative to `workdir` linked to blobs
+    """
+    try:
+        return json.load(open(_links_path(workdir)))
+    except (IOError, ValueError):
+        return []
+
+
+def link_results(storedir, files, workdir):
+    """
+    Make hard links to blobs in the store in the host's working dir and
+    record them in the links file.
+
+    :param storedir: Store dir
+    :param files: A dict of {relative path: digest}, see
+        :function:`put_results`
+    :param workdir: Host's working dir
+    """
+    links = sorted(set(load_links(workdir)) | set(files.keys()))
+    path = _links_path(workdir)
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+
+    # Record links before making them not to leave unrecorded ones.
+    tmp = _tmppath(path)
+    json.dump(links, open(tmp, 'w'))
+    os.rename(tmp, path)
+
+    for relpath, digest in files.items():
+        dst = os.path.join(workdir, relpath)
+        ddir = os.path.dirname(dst)
+        if not os.path.exists(ddir):
+            os.makedirs(ddir)
+
+        _link_or_copy(blob_path(storedir, digest), dst)
+
+
+def release(workdir):
+    """
+    Remove hard links to blobs recorded in the links file (and symlinks to
+    results of other hosts made in older versions) in the host's working dir
+    to avoid results shared with other hosts from being overwritten. Other
+    files are never removed.
+
+    :param workdir: Host's working dir
+    """
+    if not os.path.isdir(workdir):
+        return
+
+    for relpath in load_links(workdir):
+        path = os.path.join(workdir, relpath)
+        if os.path.lexists(path):
+            os.remove(path)
+
+    for path in glob.glob(os.path.join(workdir, "*.*")):
+        if os.path.islink(path):
+            os.remove(path)
+
+    if os.path.exists(_links_path(workdir)):
+        os.remove(_links_path(workdir))
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,56 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.archive as TT
+import rpmkit.tests.common as C
+
+import os.path
+import os
+import tarfile
+import unittest
+
+
+class Test_10_rpmdb_root(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+        srcdir = os.path.join(self.workdir, "src")
+        for fname in ("var/lib/rpm/Packages", "var/lib/rpm/__db.001",
+                      "etc/hosts"):
+            path = os.path.join(srcdir, fname)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').write(fname)
+
+        self.archive = os.path.join(self.workdir, "host-a.tar.gz")
+        tar = tarfile.open(self.archive, "w:gz")
+        tar.add(srcdir, "host-a")
+        tar.close()
+
+        self.scratchdir = os.path.join(self.workdir, "scratch")
+        os.makedirs(self.scratchdir)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_extract_rpmdb(self):
+        destdir = os.path.join(self.workdir, "dest")
+        self.assertEquals(TT.extract_rpmdb(self.archive, destdir), 1)
+        self.assertEquals(os.listdir(os.path.join(destdir, "var/lib/rpm")),
+                          ["Packages"])
+
+    def test_20_rpmdb_root(self):
+        with TT.rpmdb_root(self.archive, self.scratchdir) as root:
+            self.assertTrue(root.startswith(self.scratchdir))
+            self.assertTrue(os.path.exists(os.path.join(root, "var/lib/rpm",
+                                                        "Packages")))
+
+        self.assertEquals(os.listdir(self.scratchdir), [])
+
+        with TT.rpmdb_root(self.workdir, self.scratchdir) as root:
+            self.assertEquals(root, self.workdir)
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,111 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.cache as TT
+import rpmkit.tests.common as C
+
+import os.path
+import unittest
+
+
+def _pkg(name, epoch, version, release, arch="x86_64"):
+    return dict(name=name, epoch=epoch, version=version, release=release,
+                arch=arch, evr="%s-%s" % (version, release))
+
+
+def _evr_cmp(evr1, evr2):
+    """Naive EVR comparison enough for tests."""
+    return (evr1 > evr2) - (evr1 < evr2)
+
+
+_ERRATA = [dict(advisory="RHBA-2014:0001",
+                packages=[_pkg("a", '0', '1', '2'), _pkg("b", '0', '1', '2')]),
+           dict(advisory="RHBA-2014:0002",
+                packages=[_pkg("a", '0', '1', '3')]),
+           dict(advisory="RHBA-2014:0003",
+                packages=[_pkg("c", '0', '1', '1', "i686")])]
+
+_REPO_REVS = [("rhel-7-server-rpms", "1414566215")]
+
+
+class Test_10_ErrataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.cachedir = os.path.join(self.workdir, "errata")
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_load__not_exist(self):
+        cache = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        self.assertFalse(cache.load())
+
+    def test_20_save_and_load(self):
+        cache = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        cache.save(_ERRATA)
+
+        self.assertTrue(os.path.exists(cache.path))
+        self.assertTrue(os.path.exists(cache.index_path))
+
+        TT.ErrataCache._last.clear()
+        cache2 = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        self.assertTrue(cache2.load())
+        self.assertEquals(len(cache2), len(_ERRATA))
+
+        rrevs = [(_REPO_REVS[0][0], "1414566216")]
+        self.assertFalse(TT.ErrataCache(rrevs, self.cachedir).load())
+
+    def test_30_list_applicable_errata(self):
+        cache = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        cache.save(_ERRATA)
+
+        nevras = [("a", 0, '1', '2', "x86_64"), ("c", 0, '1', '1', "x86_64")]
+        advs = cache.list_applicable_advisories(nevras, _evr_cmp)
+        self.assertEquals(advs, ["RHBA-2014:0002"])
+
+        nevras = [("a", 0, '1', '1', "x86_64"), ("b", 0, '1', '1', "x86_64")]
+        es = cache.list_applicable_errata(nevras, _evr_cmp)
+        self.assertEquals([e["advisory"] for e in es],
+                          ["RHBA-2014:0001", "RHBA-2014:0002"])
+
+        # Returned errata are copies and modifications should not affect.
+        es[0]["updates"] = []
+        es2 = cache.list_applicable_errata(nevras, _evr_cmp)
+        self.assertFalse("updates" in es2[0])
+
+    def test_40_add_and_save__merged(self):
+        TT.ErrataCache._last.clear()
+        cache = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        cache.save(_ERRATA[:1], [("a", "x86_64"), ("b", "x86_64")])
+        self.assertEquals(cache.uncovered([("a", "x86_64"), ("c", "i686")]),
+                          [("c", "i686")])
+
+        # Errata added by other processes in the meantime.
+        TT.ErrataCache._last.clear()
+        cache2 = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        self.assertTrue(cache2.load())
+        cache2.add(_ERRATA[2:], [("c", "i686")])
+        cache2.save()
+
+        cache.add(_ERRATA[1:2], [("a", "x86_64")])
+        cache.save()
+        self.assertEquals(len(cache), len(_ERRATA))
+
+        TT.ErrataCache._last.clear()
+        cache3 = TT.ErrataCache(_REPO_REVS, self.cachedir)
+        self.assertTrue(cache3.load())
+        self.assertEquals(len(cache3), len(_ERRATA))
+        self.assertEquals(cache3.uncovered([("c", "i686")]), [])
+        self.assertEquals(len(cache3.get_errata(["RHBA-2014:0003"])), 1)
+
+    def test_50_in_memory(self):
+        cache = TT.ErrataCache(_REPO_REVS, None)
+        self.assertFalse(cache.load())
+
+        cache.add(_ERRATA, [("a", "x86_64")])
+        self.assertEquals(len(cache), len(_ERRATA))
+
+# vim:sw=4:ts=4:et:
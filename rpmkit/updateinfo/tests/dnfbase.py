@@ -43,4 +43,14 @@ if RUU.is_rhel_or_fedora():
             es = self.base.list_errata()
             self.assertTrue(isinstance(es, list))
 
+        def test_50_list_errata__cached(self):
+            cachedir = os.path.join(self.workdir, "errata")
+            uncached = TT.Base(self.workdir, errata_cachedir=None)
+            ref = sorted(e["advisory"] for e in uncached.list_errata())
+
+            for _i in range(2):  # Errata are converted and loaded.
+                base = TT.Base(self.workdir, errata_cachedir=cachedir)
+                self.assertEquals(sorted(e["advisory"] for e
+                                         in base.list_errata()), ref)
+
 # vim:sw=4:ts=4:et:
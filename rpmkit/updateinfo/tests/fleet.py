@@ -0,0 +1,134 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.fleet as TT
+import rpmkit.updateinfo.cache as RUC
+import rpmkit.updateinfo.utils as RUU
+import rpmkit.tests.common as C
+
+import collections
+import os.path
+import os
+import shutil
+import unittest
+
+
+def _pkg(name, version, release, arch="x86_64", epoch="0"):
+    return dict(name=name, epoch=epoch, version=version, release=release,
+                arch=arch)
+
+
+def _evr_cmp(evr1, evr2):
+    return (evr1 > evr2) - (evr1 < evr2)
+
+
+def _index(pkgs, errata):
+    """
+    :return: A FleetIndex object of given packages and errata available,
+        without loading repos
+    """
+    idx = TT.FleetIndex.__new__(TT.FleetIndex)
+    idx._pkgs = dict()
+    for pkg in pkgs:
+        idx._pkgs.setdefault((pkg["name"], pkg["arch"]), []).append(
+            ((pkg["epoch"], pkg["version"], pkg["release"]), pkg))
+
+    idx.errata_cache = RUC.ErrataCache([("repo-0", "1")])
+    idx.errata_cache.update(errata)
+    idx.evr_cmp = _evr_cmp
+    idx._advs = dict()
+    idx._updates = dict()
+
+    return idx
+
+
+class FakeBase(TT.Base):
+
+    def __init__(self, nevras, index):
+        self._packages = collections.defaultdict(list)
+        self._nevras = nevras
+        self._fleet_index = index
+
+    def prepare(self):
+        pass
+
+    def _installed_nevras(self):
+        return self._nevras
+
+
+class Test_00_join(unittest.TestCase):
+
+    def setUp(self):
+        (a2, a3, b1) = (_pkg("a", "1", "2"), _pkg("a", "1", "3"),
+                        _pkg("b", "1", "1", "noarch"))
+        errata = [dict(advisory="RHBA-2014:0002", packages=[a2]),
+                  dict(advisory="RHBA-2014:0003", packages=[a3]),
+                  dict(advisory="RHBA-2014:0010", packages=[b1])]
+        self.index = _index([a2, a3, b1], errata)
+
+    def test_10_list_errata(self):
+        nevras = [("a", "0", "1", "2", "x86_64"), ("c", "0", "1", "1", "x")]
+        base = FakeBase(nevras, self.index)
+        self.assertEquals([e["advisory"] for e in base.list_errata_impl()],
+                          ["RHBA-2014:0003"])
+
+        nevras = [("a", "0", "1", "1", "x86_64"), ("b", "0", "0", "1", "i686"),
+                  ("b", "0", "0", "1", "noarch")]
+        base = FakeBase(nevras, self.index)
+        self.assertEquals([e["advisory"] for e in base.list_errata_impl()],
+                          ["RHBA-2014:0002", "RHBA-2014:0003",
+                           "RHBA-2014:0010"])
+
+    def test_20_list_updates(self):
+        nevras = [("a", "0", "1", "1", "x86_64"),
+                  ("a", "0", "1", "2", "x86_64"),
+                  ("b", "0", "1", "1", "noarch")]
+        base = FakeBase(nevras, self.index)
+        ups = base.list_updates_impl()
+        self.assertEquals([(p["name"], p["release"]) for p in ups],
+                          [("a", "2"), ("a", "3")])
+
+        # Results are memoized per NEVRA and copied per host.
+        self.assertTrue(("a", "0", "1", "1", "x86_64") in self.index._updates)
+        ups[0]["release"] = "x"
+        self.assertEquals(self.index.updates(nevras[0])[0]["release"], "2")
+
+
+if RUU.is_rhel_or_fedora():
+    class Test_10_Base(unittest.TestCase):
+
+        def setUp(self):
+            self.workdir = C.setup_workdir()
+
+            rpmdbdir = os.path.join(self.workdir, RUU.RPMDB_SUBDIR)
+            os.makedirs(rpmdbdir)
+
+            for dbn in RUU._RPM_DB_FILENAMES:
+                shutil.copy(os.path.join('/', RUU.RPMDB_SUBDIR, dbn), rpmdbdir)
+
+            self.base = TT.Base(self.workdir)
+
+        def tearDown(self):
+            C.cleanup_workdir(self.workdir)
+
+        def test_20_list_installed(self):
+            pkgs = self.base.list_installed()
+            self.assertTrue(isinstance(pkgs, list))
+            self.assertTrue(bool(pkgs))
+
+        def test_30_list_updates(self):
+            pkgs = self.base.list_updates()
+            self.assertTrue(isinstance(pkgs, list))
+
+        def test_40_list_errata(self):
+            es = self.base.list_errata()
+            self.assertTrue(isinstance(es, list))
+
+        def test_50_index_is_shared(self):
+            base2 = TT.Base(self.workdir)
+            self.assertTrue(TT.FleetIndex.get(self.base) is
+                            TT.FleetIndex.get(base2))
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,49 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.manifest as TT
+import rpmkit.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_manifest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+        rpmdbdir = os.path.join(self.workdir, TT.RPMDB_SUBDIR)
+        os.makedirs(rpmdbdir)
+        for fname in ("Packages", "Name", "__db.001"):
+            open(os.path.join(rpmdbdir, fname), 'w').write(fname)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_rpmdb_identity(self):
+        ids = TT.rpmdb_identity(self.workdir)
+        self.assertEquals([i[0] for i in ids], ["Name", "Packages"])
+        self.assertEquals(ids[1][1], len("Packages"))
+
+    def test_20_save_and_load(self):
+        self.assertTrue(TT.load(self.workdir) is None)
+
+        inputs = dict(rpmdb=TT.rpmdb_identity(self.workdir),
+                      repos=[["rhel-7-server-rpms", "1414566215"]])
+        opts = TT.run_options(4.0)
+        TT.save(self.workdir, inputs, opts, "abc")
+
+        manifest = TT.load(self.workdir)
+        self.assertEquals(manifest["fingerprint"], "abc")
+        self.assertTrue(TT.is_up_to_date(manifest, inputs, opts))
+
+        open(os.path.join(self.workdir, TT.RPMDB_SUBDIR, "Packages"),
+             'w').write("Packages updated")
+        inputs2 = dict(inputs, rpmdb=TT.rpmdb_identity(self.workdir))
+        self.assertFalse(TT.is_up_to_date(manifest, inputs2, opts))
+
+# vim:sw=4:ts=4:et:
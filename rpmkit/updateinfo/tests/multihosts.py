@@ -0,0 +1,136 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.multihosts as TT
+import rpmkit.tests.common as C
+import rpmkit.utils as U
+
+import bunch
+import os.path
+import os
+import sys
+import unittest
+
+
+def _double(x):
+    return x * 2
+
+
+def _fail_if_odd(x):
+    if x % 2:
+        raise ValueError("odd: %d" % x)
+
+    return x
+
+
+def _die_if_odd(x):
+    if x % 2:
+        os._exit(1)
+
+    return x
+
+
+def _exit_if_odd(x):
+    if x % 2:
+        sys.exit(0)
+
+    return x
+
+
+class Test_10_run_in_parallel(unittest.TestCase):
+
+    def test_10_results(self):
+        res = sorted(TT.run_in_parallel(_double, range(10), 4))
+        self.assertEquals(res, [(x, x * 2, None) for x in range(10)])
+
+    def test_20_errors_are_isolated(self):
+        res = sorted(TT.run_in_parallel(_fail_if_odd, range(6), 2))
+        self.assertEquals([(x, r) for x, r, _e in res if _e is None],
+                          [(0, 0), (2, 2), (4, 4)])
+        self.assertTrue(all("odd" in e for x, _r, e in res if x % 2))
+
+    def test_30_crashes_are_isolated(self):
+        res = sorted(TT.run_in_parallel(_die_if_odd, range(6), 3))
+        self.assertEquals([(x, r) for x, r, _e in res if _e is None],
+                          [(0, 0), (2, 2), (4, 4)])
+        self.assertTrue(all(e for x, _r, e in res if x % 2))
+
+    def test_40_exited_without_results(self):
+        res = sorted(TT.run_in_parallel(_exit_if_odd, range(4), 2))
+        self.assertEquals([(x, r) for x, r, _e in res if _e is None],
+                          [(0, 0), (2, 2)])
+        self.assertTrue(all("without results" in e for x, _r, e in res
+                            if x % 2))
+
+
+class Test_20_fingerprints(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_group_by_fingerprints(self):
+        hosts = [bunch.Bunch(id=str(i), fingerprint=str(i % 3)) for i
+                 in range(10)]
+        hgroups = TT.group_by_fingerprints(hosts)
+
+        self.assertEquals([fp for fp, _hs in hgroups], ['0', '1', '2'])
+        self.assertEquals([h.id for h in hgroups[0][1]], ['0', '3', '6', '9'])
+
+    def test_20_save_and_load_fingerprints(self):
+        self.assertEquals(TT.load_fingerprints(self.workdir), dict())
+
+        TT.save_fingerprints(self.workdir, [('0', "b", ["a", "b"]),
+                                            ('1', "c", ["c"])])
+        refs = TT.load_fingerprints(self.workdir)
+        self.assertEquals(refs, {'0': "b", '1': "c"})
+
+        hosts = [bunch.Bunch(id=i, fingerprint='0') for i in "ab"]
+        hgroups = TT.group_by_fingerprints(hosts, refs)
+        self.assertEquals([h.id for h in hgroups[0][1]], ["b", "a"])
+
+    def test_30_link_results_of_ref_host(self):
+        hosts = [bunch.Bunch(id=i, workdir=os.path.join(self.workdir, i))
+                 for i in "abc"]
+        os.makedirs(hosts[0].workdir)
+        U.json_dump(dict(hosts=["a"]),
+                    os.path.join(hosts[0].workdir, "metadata.json"))
+
+        storedir = os.path.join(self.workdir, ".store")
+        TT.link_results_of_ref_host(hosts[0], hosts[1:], storedir)
+
+        for h in hosts:
+            metadata = U.json_load(os.path.join(h.workdir, "metadata.json"))
+            self.assertEquals(metadata["hosts"], ["a", "b", "c"])
+
+
+class Test_30_host_descriptors_g(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_cachedir_of_archives(self):
+        datadir = os.path.join(self.workdir, "hosts")
+        os.makedirs(os.path.join(datadir, "b"))
+        TT.touch(os.path.join(datadir, "a.tar.xz"))
+
+        workdir = os.path.join(self.workdir, "out")
+        hdescs = dict((h["id"], h) for h
+                      in TT.host_descriptors_g(datadir, workdir))
+        self.assertEquals(hdescs["a"]["cachedir"],
+                          os.path.join(workdir, "a", "var/cache"))
+        self.assertTrue(hdescs["b"]["cachedir"] is None)
+
+        hdescs = dict((h["id"], h) for h
+                      in TT.host_descriptors_g(datadir, workdir,
+                                               cachedir="/tmp/cache"))
+        self.assertEquals(hdescs["a"]["cachedir"], "/tmp/cache")
+
+# vim:sw=4:ts=4:et:
@@ -0,0 +1,82 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.spool as TT
+import rpmkit.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+def _enqueue(spooldir, hids):
+    TT.init(spooldir)
+    for hid in hids:
+        TT._dump_job(dict(host=dict(id=hid), attempts=0),
+                     TT._job_path(spooldir, TT.NEW, hid))
+
+
+class Test_10_spool(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.spooldir = os.path.join(self.workdir, "spool")
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_claim(self):
+        _enqueue(self.spooldir, ["a", "b"])
+
+        (path, job) = TT.claim(self.spooldir, "w1")
+        self.assertEquals(job["host"]["id"], "a")
+        self.assertEquals(job["attempts"], 1)
+        self.assertEquals(os.path.dirname(path),
+                          os.path.join(self.spooldir, TT.CLAIMED))
+
+        (_path, job) = TT.claim(self.spooldir, "w2")
+        self.assertEquals(job["host"]["id"], "b")
+        self.assertTrue(TT.claim(self.spooldir, "w3") is None)
+
+        stat = TT.status(self.spooldir)
+        self.assertEquals((stat[TT.NEW], stat[TT.CLAIMED]), (0, 2))
+
+    def test_20_requeue_expired(self):
+        _enqueue(self.spooldir, ["a"])
+        TT.claim(self.spooldir, "w1")
+
+        self.assertEquals(TT.requeue_expired(self.spooldir, 600), 0)
+        self.assertEquals(TT.requeue_expired(self.spooldir, 0), 1)
+        self.assertEquals(TT.status(self.spooldir)[TT.NEW], 1)
+
+    def test_30_max_attempts(self):
+        _enqueue(self.spooldir, ["a"])
+        for _i in range(2):
+            TT.claim(self.spooldir, "w1", 2)
+            TT.requeue_expired(self.spooldir, 0)
+
+        self.assertTrue(TT.claim(self.spooldir, "w1", 2) is None)
+        self.assertEquals(TT.status(self.spooldir)[TT.FAILED], 1)
+
+    def test_40_claim__lease_owned_by_claim(self):
+        _enqueue(self.spooldir, ["a"])
+        os.utime(TT._job_path(self.spooldir, TT.NEW, "a"), (0, 0))
+
+        (path, _job) = TT.claim(self.spooldir, "w1")
+        self.assertEquals(TT.requeue_expired(self.spooldir, 600), 0)
+
+        TT.requeue_expired(self.spooldir, 0)
+        (path2, job) = TT.claim(self.spooldir, "w2")
+        self.assertNotEquals(path, path2)
+        self.assertFalse(os.path.exists(path))
+
+        # The job of the first claim was requeued and must not be finished.
+        self.assertFalse(TT._finish(job, path, TT._job_path(self.spooldir,
+                                                            TT.DONE, "a")))
+        self.assertTrue(TT._finish(job, path2, TT._job_path(self.spooldir,
+                                                            TT.DONE, "a")))
+        self.assertEquals(TT.status(self.spooldir)[TT.DONE], 1)
+
+# vim:sw=4:ts=4:et:
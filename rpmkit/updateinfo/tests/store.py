@@ -0,0 +1,74 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.store as TT
+import rpmkit.tests.common as C
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_store(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+        self.storedir = TT.store_dir(self.workdir)
+
+        self.refdir = os.path.join(self.workdir, "ref")
+        os.makedirs(os.path.join(self.refdir, "delta"))
+        os.makedirs(os.path.join(self.refdir, "var/lib/rpm"))
+        for fname in ("errata.json", "delta/errata.json", "manifest.json",
+                      "var/lib/rpm/Packages"):
+            open(os.path.join(self.refdir, fname), 'w').write(fname)
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_put_results(self):
+        files = TT.put_results(self.storedir, self.refdir, ("manifest.json", ))
+        self.assertEquals(sorted(files.keys()),
+                          ["delta/errata.json", "errata.json"])
+        for digest in files.values():
+            self.assertTrue(os.path.exists(TT.blob_path(self.storedir,
+                                                        digest)))
+
+    def test_20_link_results_and_release(self):
+        files = TT.put_results(self.storedir, self.refdir)
+        hdir = os.path.join(self.workdir, "host")
+        TT.link_results(self.storedir, files, hdir)
+
+        path = os.path.join(hdir, "delta/errata.json")
+        self.assertEquals(open(path).read(), "delta/errata.json")
+
+        TT.release(hdir)
+        self.assertFalse(os.path.exists(path))
+
+        # Blobs are not affected by updates of the reference host's results.
+        open(os.path.join(self.refdir, "errata.json"), 'w').write("updated")
+        blob = TT.blob_path(self.storedir, files["errata.json"])
+        self.assertEquals(open(blob).read(), "errata.json")
+
+    def test_30_link_results_and_release__rpmdb_root(self):
+        files = TT.put_results(self.storedir, self.refdir)
+        self.assertFalse("var/lib/rpm/Packages" in files)
+
+        # Rpm db files of the host hard linked (deduplicated) by others.
+        hdir = os.path.join(self.workdir, "host")
+        os.makedirs(os.path.join(hdir, "var/lib/rpm"))
+        rpmdb = os.path.join(hdir, "var/lib/rpm/Packages")
+        open(rpmdb, 'w').write("host")
+        os.link(rpmdb, os.path.join(self.workdir, "Packages.dedup"))
+
+        TT.link_results(self.storedir, files, hdir)
+        self.assertEquals(open(rpmdb).read(), "host")
+        self.assertEquals(sorted(TT.load_links(hdir)), sorted(files.keys()))
+
+        TT.release(hdir)
+        self.assertEquals(open(rpmdb).read(), "host")
+        self.assertFalse(os.path.exists(os.path.join(hdir, "errata.json")))
+        self.assertEquals(TT.load_links(hdir), [])
+
+# vim:sw=4:ts=4:et:
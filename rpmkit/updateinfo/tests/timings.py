@@ -0,0 +1,67 @@
+#
+# Copyright (C) 2014 Red Hat, Inc.
+# Red Hat Author(s): Satoru SATOH <ssato at redhat.com>
+# License: GPLv3+
+#
+import rpmkit.updateinfo.timings as TT
+import rpmkit.tests.common as C
+import rpmkit.utils as U
+
+import os.path
+import os
+import unittest
+
+
+class Test_10_Timings(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = C.setup_workdir()
+
+    def tearDown(self):
+        C.cleanup_workdir(self.workdir)
+
+    def test_10_phase(self):
+        tms = TT.Timings("a")
+        with tms.phase("rpmdb load") as rec:
+            rec["count"] = 10
+
+        with tms.phase("dump packages.json"):
+            pass
+
+        self.assertEquals(list(tms.phases.keys()),
+                          ["rpmdb load", "dump packages.json"])
+        self.assertEquals(tms.phases["rpmdb load"]["count"], 10)
+        self.assertEquals(tms.phases["dump packages.json"]["count"], 0)
+
+    def test_20_phase__error(self):
+        tms = TT.Timings("a")
+        try:
+            with tms.phase("errata query"):
+                raise RuntimeError("failed")
+        except RuntimeError:
+            pass
+
+        self.assertEquals(tms.phases["errata query"]["calls"], 1)
+
+    def test_30_dump_rollup(self):
+        for hid, wall in (("a", 1.0), ("b", 3.0)):
+            hworkdir = os.path.join(self.workdir, hid)
+            os.makedirs(hworkdir)
+
+            tms = TT.Timings(hid)
+            tms.add("updates query", wall, wall / 2, 100)
+            tms.dump(hworkdir)
+
+        TT.dump_rollup(self.workdir)
+        res = U.json_load(os.path.join(self.workdir, TT.TIMINGS_FILE))
+
+        self.assertEquals(res["hosts"], 2)
+        self.assertEquals(res["phases"][0]["count"], 200)
+        self.assertEquals(res["phases"][0]["slowest"], "b")
+        self.assertEquals([h["id"] for h in res["slowest"]], ["b", "a"])
+
+        res = TT.dump_rollup(self.workdir, ["a"])  # b was skipped.
+        self.assertEquals(res["hosts"], 1)
+        self.assertEquals(res["phases"][0]["count"], 100)
+
+# vim:sw=4:ts=4:et:
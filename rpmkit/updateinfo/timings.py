@@ -0,0 +1,211 @@
+#
+# Copyright (C) 2014 Satoru SATOH <ssato redhat.com>
+# License: GPLv3+
+#
+"""Record wall and CPU time, peak RSS and number of items of each phase of
+analysis.
+
+Timings of each host are saved in timings.json in its working dir, and these
+of all hosts are rolled up into timings.json in the top working dir in
+multihosts mode, to find out which phases hosts spent their time in.
+"""
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import glob
+import logging
+import os.path
+import os
+import time
+
+import rpmkit.utils as U
+
+
+LOG = logging.getLogger(__name__)
+
+TIMINGS_FILE = "timings.json"
+
+
+def _cpu_time():
+    """
+    :return: User and system CPU time of this process in seconds
+    """
+    (utime, stime) = os.times()[:2]
+    return utime + stime
+
+
+def _maxrss():
+    """
+    :return: Peak RSS of this process in KB or 0 if it's not available
+    """
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except (ImportError, AttributeError):
+        return 0
+
+
+class Timings(object):
+    """
+    Timings of phases of the analysis of a host.
+
+    >>> tms = Timings("abc.example.com")
+    >>> with tms.phase("rpmdb load") as rec:
+    ...     rec["count"] = 3
+    >>> tms.add("rpmdb load", 0.5, 0.25, 2)
+    >>> rec = tms.phases["rpmdb load"]
+    >>> (rec["calls"], rec["count"], rec["wall"] >= 0.5)
+    (2, 5, True)
+    """
+
+    def __init__(self, hid=None):
+        """
+        :param hid: Host identity
+        """
+        self.id = hid
+        self.phases = collections.OrderedDict()  # {name: record}
+
+    def add(self, name, wall, cpu=0.0, count=None, maxrss=0):
+        """
+        Add time and number of items processed to the phase.
+
+        :param name: Phase name, e.g. "rpmdb load"
+        :param wall: Wall clock time in seconds
+        :param cpu: CPU time in seconds
+        :param count: Number of items processed in the phase or None
+        :param maxrss: Peak RSS in KB at the end of the phase
+        """
+        rec = self.phases.setdefault(name, dict(calls=0, wall=0.0, cpu=0.0,
+                                                count=0, maxrss=0))
+        rec["calls"] += 1
+        rec["wall"] += wall
+        rec["cpu"] += cpu
+        rec["maxrss"] = max(rec["maxrss"], maxrss)
+        if count is not None:
+            rec["count"] += count
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager to measure time of the phase. The number of items
+        processed can be set to rec["count"] of the dict `rec` it yields.
+
+        :param name: Phase name
+        """
+        rec = dict(count=None)
+        (wall, cpu) = (time.time(), _cpu_time())
+        try:
+            yield rec
+        finally:
+            self.add(name, time.time() - wall, _cpu_time() - cpu,
+                     rec["count"], _maxrss())
+
+    def toDict(self):
+        return dict(id=self.id,
+                    phases=[dict(name=n, **r) for n, r in self.phases.items()])
+
+    def dump(self, workdir):
+        """
+        :param workdir: Host's working dir to save timings.json
+        """
+        U.json_dump(self.toDict(), os.path.join(workdir, TIMINGS_FILE))
+
+
+def load_hosts_timings(workdir, hids=None):
+    """
+    :param workdir: Top working dir in which working dirs of hosts exist
+    :param hids: A list of identities of hosts to load timings of, or None to
+        load timings of all hosts
+    :return: A list of timings of hosts, see :meth:`Timings.toDict`
+    """
+    res = []
+    for path in sorted(glob.glob(os.path.join(workdir, '*', TIMINGS_FILE))):
+        hid = os.path.basename(os.path.dirname(path))
+        if hids is not None and hid not in hids:
+            continue
+        try:
+            res.append(U.json_load(path))
+        except (IOError, OSError, ValueError):
+            LOG.warn("Could not load the timings: %s", path)
+
+    return res
+
+
+def rollup(hosts_timings, nslowest=10):
+    """
+    Roll up timings of hosts.
+
+    :param hosts_timings: A list of timings of hosts
+    :param nslowest: Number of the slowest hosts to list
+    :return: A dict contains the number of hosts, totals of each phase and
+        the slowest hosts
+
+    >>> ht0 = dict(id="a", phases=[dict(name="p", calls=1, wall=1.0,
+    ...                                 cpu=0.5, count=10, maxrss=200)])
+    >>> ht1 = dict(id="b", phases=[dict(name="p", calls=1, wall=3.0,
+    ...                                 cpu=1.5, count=30, maxrss=100)])
+    >>> res = rollup([ht0, ht1])
+    >>> phase = res["phases"][0]
+    >>> (phase["hosts"], phase["wall"], phase["wall_mean"], phase["slowest"])
+    (2, 4.0, 2.0, 'b')
+    >>> phase["maxrss"]
+    200
+    >>> [h["id"] for h in res["slowest"]]
+    ['b', 'a']
+    """
+    phases = collections.OrderedDict()
+    totals = []
+    for htms in hosts_timings:
+        total = 0.0
+        for rec in htms["phases"]:
+            prec = phases.setdefault(rec["name"],
+                                     dict(name=rec["name"], hosts=0, calls=0,
+                                          wall=0.0, cpu=0.0, count=0,
+                                          maxrss=0, wall_max=-1.0,
+                                          slowest=None))
+            prec["hosts"] += 1
+            for key in ("calls", "wall", "cpu", "count"):
+                prec[key] += rec[key]
+
+            prec["maxrss"] = max(prec["maxrss"], rec.get("maxrss", 0))
+
+            if rec["wall"] > prec["wall_max"]:
+                (prec["wall_max"], prec["slowest"]) = (rec["wall"],
+                                                       htms["id"])
+            total += rec["wall"]
+
+        totals.append(dict(id=htms["id"], wall=total))
+
+    for prec in phases.values():
+        prec["wall_mean"] = prec["wall"] / prec["hosts"]
+
+    totals.sort(key=lambda t: t["wall"], reverse=True)
+    return dict(hosts=len(hosts_timings), phases=list(phases.values()),
+                slowest=totals[:nslowest])
+
+
+def dump_rollup(workdir, hids=None):
+    """
+    Roll up timings of hosts in the top working dir and save it.
+
+    :param workdir: Top working dir in which working dirs of hosts exist
+    :param hids: A list of identities of hosts processed in this run, or None
+        to roll up timings of all hosts. Timings of other hosts, e.g. skipped
+        in the incremental mode, are of previous runs.
+    :return: The rolled-up timings, see :function:`rollup`
+    """
+    if hids is not None:
+        hids = set(hids)
+    res = rollup(load_hosts_timings(workdir, hids))
+    U.json_dump(res, os.path.join(workdir, TIMINGS_FILE))
+
+    for prec in res["phases"]:
+        LOG.info("Timings: %(name)s: wall=%(wall).2fs, cpu=%(cpu).2fs, "
+                 "count=%(count)d, maxrss=%(maxrss)dKB, hosts=%(hosts)d, "
+                 "max=%(wall_max).2fs "
+                 "(%(slowest)s)", prec)
+
+    return res
+
+# vim:sw=4:ts=4:et:
@@ -20,16 +20,21 @@
 # from rpmkit.memoize import memoize
 from itertools import izip, takewhile
 
+import bisect
 import codecs
 import datetime
+import importlib
 import itertools
 import logging
 import multiprocessing
+import multiprocessing.pool
 import operator
 import os.path
 import re
 import subprocess
 
+import rpmkit.jsoncodec
+
 try:
     from functools import reduce as foldl
 except ImportError:
@@ -46,10 +51,49 @@ except AttributeError:
 
     chain_from_iterable = _from_iterable
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
+
+class _LazyModule(object):
+    """
+    Proxy of the module imported when its attributes are accessed first.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self.__dict__["_module"] is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+
+        return self.__dict__["_module"]
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return "<lazy module '%s'>" % self._name
+
+
+def lazy_import(name):
+    """
+    Import the module lazily to avoid the cost of importing heavy modules
+    which may not be used. ImportError will be raised when its attributes
+    are accessed first if the module is not available.
+
+    :param name: Module name
+    :return: A proxy of the module
+
+    >>> mod = lazy_import("rpmkit.tests.lazy_module_not_exist")
+    >>> mod
+    <lazy module 'rpmkit.tests.lazy_module_not_exist'>
+    >>> json = lazy_import("json")
+    >>> json.dumps([1])
+    '[1]'
+    """
+    return _LazyModule(name)
 
 
 def typecheck(obj, expected_type_or_class):
@@ -238,6 +282,8 @@ def is_subseq(sseq, tseq):
     True
     >>> is_subseq([1, 2], [1, 3, 5])
     False
+    >>> is_subseq([1, 2], [0, 1])
+    False
     >>> is_subseq("bcd", "abcde")
     True
     >>> is_subseq((c for c in "bcd"), (c for c in "abcde"))
@@ -273,6 +319,9 @@ def is_subseq(sseq, tseq):
         except ValueError:  # ``head`` isn't found in the rest of ``tseq``.
             return False
 
+        if len(tseq) < len(sseq) - 1:  # Not enough items left.
+            return False
+
         if all(x == y for x, y in izip(sseq[1:], tseq)):
             return True
 
@@ -300,11 +349,85 @@ def longest_common_prefix(*xss):
     return [x[0] for x in takewhile(all_eq, izip(*xss))]
 
 
+def _suffix_automaton(xs):
+    """
+    Build the suffix automaton of the sequence.
+
+    :param xs: A sequence of hashable items
+    :return: A tuple of lists of (transitions :: {item: state}, suffix link,
+        length of the longest string, end position of the first occurrence)
+        of each state, and the initial state is 0.
+    """
+    (nexts, links, lens, fpos) = ([{}], [-1], [0], [-1])
+    last = 0
+
+    for i, x in enumerate(xs):
+        cur = len(lens)
+        nexts.append({})
+        links.append(0)
+        lens.append(lens[last] + 1)
+        fpos.append(i)
+
+        p = last
+        while p != -1 and x not in nexts[p]:
+            nexts[p][x] = cur
+            p = links[p]
+
+        if p != -1:
+            q = nexts[p][x]
+            if lens[p] + 1 == lens[q]:
+                links[cur] = q
+            else:
+                clone = len(lens)
+                nexts.append(dict(nexts[q]))
+                links.append(links[q])
+                lens.append(lens[p] + 1)
+                fpos.append(fpos[q])
+
+                while p != -1 and nexts[p].get(x) == q:
+                    nexts[p][x] = clone
+                    p = links[p]
+
+                links[q] = links[cur] = clone
+        last = cur
+
+    return (nexts, links, lens, fpos)
+
+
+def _longest_common_substring_naive(xss):
+    """
+    Naive implementation of :function:`longest_common_substring` tries all
+    sub strings of the first one. It's slow but works with items not hashable.
+
+    :param xss: A list of lists or strs
+    """
+    def is_substring(ss, xss):
+        return ss and all(is_subseq(ss, xs) for xs in xss)
+
+    ss = []
+
+    if not xss[0] or not xss[1]:
+        return ss
+
+    for i in range(len(xss[0])):
+        for j in range(len(xss[0]) - i + 1):
+            candidate = xss[0][i:i + j]
+
+            if j > len(ss) and is_substring(candidate, xss):
+                ss = candidate
+
+    return ss
+
+
 def longest_common_substring(*xss):
     """
     Longest common sub "strings" (continuous sequencial items) generalized for
     any iterables.
 
+    It builds the suffix automaton of the first one and find the longest
+    common one in O(sum of lengths of all). The first one found in the first
+    sequence will be returned if there are some of same length.
+
     >>> longest_common_substring("abcde", "acdebf", "cdeag")
     'cde'
     >>> longest_common_substring([c for c in "abcde"], [c for c in "acdebf"])
@@ -313,6 +436,10 @@ def longest_common_substring(*xss):
     ['c', 'd', 'e']
     >>> longest_common_substring("", "acdebf", "cdeag")
     []
+    >>> longest_common_substring("abxcd", "cdyab")
+    'ab'
+    >>> longest_common_substring([[0], [1]], [[1], [2]])
+    [[1]]
     """
     # Ensure any item in xss is a list or a str; convert each items to a list
     # if needed.
@@ -320,22 +447,148 @@ def longest_common_substring(*xss):
 
     assert len(xss) > 1, "only an arg found. mulitple strings must be passed."
 
-    def is_substring(ss, xss):
-        return ss and all(is_subseq(ss, xs) for xs in xss)
+    if not xss[0] or not xss[1]:
+        return []
+
+    try:
+        (nexts, links, lens, fpos) = _suffix_automaton(xss[0])
+    except TypeError:  # Some items are not hashable.
+        return _longest_common_substring_naive(xss)
+
+    nstates = len(lens)
+    states = sorted(range(1, nstates), key=lens.__getitem__, reverse=True)
+    common = lens[:]  # Length of the longest common one of each state.
+
+    for ys in xss[1:]:
+        matched = [0] * nstates
+        (v, length) = (0, 0)
+        for y in ys:
+            while v and y not in nexts[v]:
+                v = links[v]
+                length = lens[v]
+
+            if y in nexts[v]:
+                v = nexts[v][y]
+                length += 1
+            else:
+                (v, length) = (0, 0)
 
-    ss = []
+            if length > matched[v]:
+                matched[v] = length
 
-    if not xss[0] or not xss[1]:
-        return ss
+        # Suffixes of matched ones in a state are also matched.
+        for v in states:
+            if matched[v]:
+                p = links[v]
+                matched[p] = max(matched[p], min(matched[v], lens[p]))
 
-    for i in range(len(xss[0])):
-        for j in range(len(xss[0]) - i + 1):
-            candidate = xss[0][i:i + j]
+        common = [min(c, m) for c, m in izip(common, matched)]
 
-            if j > len(ss) and is_substring(candidate, xss):
-                ss = candidate
+    longest = max(common)
+    if not longest:
+        return []
 
-    return ss
+    start = min(fpos[v] for v in range(1, nstates)
+                if common[v] == longest) - longest + 1
+
+    return xss[0][start:start + longest]
+
+
+def _lcs_keys(s, t):
+    """
+    :return: A tuple of ``s`` and ``t`` as they are if their items are
+        hashable, or lists of indices of equal items in them
+
+    >>> _lcs_keys("ab", "bc")
+    ('ab', 'bc')
+    >>> _lcs_keys([[0], [1]], [[1], [2]])
+    ([0, 1], [1, 2])
+    """
+    try:
+        set(s)
+        set(t)
+        return (s, t)
+    except TypeError:
+        uniqs = []
+
+        def index(x):
+            for i, u in enumerate(uniqs):
+                if u == x:
+                    return i
+            uniqs.append(x)
+            return len(uniqs) - 1
+
+        return ([index(x) for x in s], [index(y) for y in t])
+
+
+def _lcs_next_row(s, x0, x1, vec, masks, full):
+    """
+    Compute the row x1 of the DP table of LCS lengths from the row x0.
+
+    Rows are encoded in bits of integers: the bit j is set if
+    dp[x][j + 1] == dp[x][j], and the next row is computed by a few bit
+    operations (Allison-Dix / Hyyro), see
+    :function:`longest_common_subsequence_length`.
+
+    :param vec: The row x0 encoded in bits
+    :param masks: A dict of {item: bits of positions of the item in t}
+    :param full: Bits of all positions in t
+    """
+    for x in range(x0, x1):
+        matches = vec & masks.get(s[x], 0)
+        vec = ((vec + matches) | (vec - matches)) & full
+
+    return vec
+
+
+def _lcs_traceback(s, x0, x1, y1, vec, masks, full, nrows=64):
+    """
+    Trace back the LCS in the DP table of s[x0:x1] and t[:y1] from (x1, y1)
+    until it reaches the row x0, in the same way as the full table; go up if
+    dp[x - 1][y] == dp[x][y], or go left if dp[x][y - 1] == dp[x][y], or go
+    diagonally as s[x - 1] == t[y - 1] otherwise.
+
+    Blocks having more than ``nrows`` rows are split at the middle row; the
+    lower half is traced back first from the middle row computed from the
+    row x0, and then the upper half is traced back from the column where the
+    lower half reached the middle row. So only O(log(len(s))) rows are kept.
+
+    :param vec: The row x0 of the DP table encoded in bits, see
+        :function:`_lcs_next_row`
+    :return: A tuple of (indices of matched items in ``s``, column where the
+        trace reached the row x0 or 0)
+    """
+    if x1 == x0 or y1 == 0:
+        return ([], y1)
+
+    if x1 - x0 > nrows:
+        xm = (x0 + x1) // 2
+        vmid = _lcs_next_row(s, x0, xm, vec, masks, full)
+        (lower, y) = _lcs_traceback(s, xm, x1, y1, vmid, masks, full, nrows)
+        (upper, y) = _lcs_traceback(s, x0, xm, y, vec, masks, full, nrows)
+        return (upper + lower, y)
+
+    rows = [vec]
+    for x in range(x0, x1):
+        rows.append(_lcs_next_row(s, x, x + 1, rows[-1], masks, full))
+
+    def value(x, y):
+        return y - bin(rows[x - x0] & ((1 << y) - 1)).count('1')
+
+    result = []
+    (x, y) = (x1, y1)
+    cur = value(x, y)
+    while x > x0 and y != 0:
+        if value(x - 1, y) == cur:
+            x -= 1
+        elif rows[x - x0] >> (y - 1) & 1:
+            y -= 1
+        else:
+            result.append(x - 1)
+            (x, y, cur) = (x - 1, y - 1, cur - 1)
+
+    result.reverse()
+    return (result, y)
 
 
 def longest_common_subsequence(s, t):
@@ -343,7 +596,10 @@ def longest_common_subsequence(s, t):
     Longest common sub sequence (maybe non-continous sequencial items) of ``s``
     and ``t``.
 
-    See also the above ``longest_common_substring`` function.
+    The result is same as the one traced back in the full DP table but only
+    O(log(len(s))) rows of the table encoded in bits are kept, see
+    :function:`_lcs_traceback`. See also the above
+    ``longest_common_substring`` function.
 
     >>> longest_common_subsequence("abcde", "acdebf")
     'acde'
@@ -351,33 +607,52 @@ def longest_common_subsequence(s, t):
     '1234'
     >>> longest_common_subsequence([c for c in "abcde"], [c for c in "acdebf"])
     ['a', 'c', 'd', 'e']
+    >>> longest_common_subsequence("", "abc")
+    ''
     """
-    n = len(s)
-    m = len(t)
-    dp = [[0 for j in range(m + 1)] for i in range(n + 1)]
+    (ks, kt) = _lcs_keys(s, t)
+    masks = dict()
+    for j, y in enumerate(kt):
+        masks[y] = masks.get(y, 0) | (1 << j)
 
-    for i, si in enumerate(s):
-        for j, tj in enumerate(t):
-            if si == tj:
-                dp[i + 1][j + 1] = dp[i][j] + 1
-            else:
-                dp[i + 1][j + 1] = max(dp[i][j + 1], dp[i + 1][j])
+    full = (1 << len(t)) - 1  # The row 0; all of dp[0][j] are 0.
+    (idxs, _y) = _lcs_traceback(ks, 0, len(s), len(t), full, masks, full)
+    result = [s[x] for x in idxs]
 
-    result = []
-    (x, y) = (n, m)
+    return ''.join(result) if isinstance(s, str) else result
 
-    while x != 0 and y != 0:
-        if dp[x][y] == dp[x - 1][y]:
-            x -= 1
-        elif dp[x][y] == dp[x][y - 1]:
-            y -= 1
-        else:
-            assert s[x - 1] == t[y - 1]
-            result = [s[x - 1]] + result
-            x -= 1
-            y -= 1
 
-    return ''.join(result) if isinstance(s, str) else result
+def longest_common_subsequence_length(s, t):
+    """
+    Length of the longest common sub sequence of ``s`` and ``t``.
+
+    Columns of the DP table are encoded in bits of integers and computed by
+    a few bit operations per item of ``t`` (Allison-Dix / Hyyro), so that it
+    takes O(len(s) * len(t) / word size) time and is much faster than
+    ``len(longest_common_subsequence(s, t))``.
+
+    >>> longest_common_subsequence_length("abcde", "acdebf")
+    4
+    >>> longest_common_subsequence_length("12340", "01224533324")
+    4
+    >>> longest_common_subsequence_length([[0], [1]], [[1], [2]])
+    1
+    >>> longest_common_subsequence_length("", "abc")
+    0
+    """
+    (s, t) = _lcs_keys(s, t)
+    n = len(s)
+    full = (1 << n) - 1
+    vec = full  # Bits of s[i] not matched yet.
+    masks = dict()
+    for i, x in enumerate(s):
+        masks[x] = masks.get(x, 0) | (1 << i)
+
+    for y in t:
+        matches = vec & masks.get(y, 0)
+        vec = ((vec + matches) | (vec - matches)) & full
+
+    return n - bin(vec).count('1')
 
 
 def copen(path, flag='r', encoding="utf-8", **kwargs):
@@ -388,58 +663,144 @@ def json_load(filepath, encoding="utf-8"):
     """
     Load ``filepath`` in JSON format and return data.
 
-    :param filepath: Output file path
+    :param filepath: Input file path. The compressed one, e.g.
+        ``filepath``.xz, is loaded if it is not found but that is.
+    :param encoding: Not used; JSON files are encoded in UTF-8 always
     """
-    return json.load(copen(filepath, encoding=encoding))
+    return rpmkit.jsoncodec.load(filepath)
 
 
-def json_dump(data, filepath):
+def json_dump(data, filepath, compression=None):
     """
     Dump given ``data`` into ``filepath`` in JSON format.
 
     :param data: Data to dump
-    :param filepath: Output file path
+    :param filepath: Output file path. It's compressed if its extension is
+        .gz, .xz or .zst.
+    :param compression: Compression to use, e.g. 'xz', or True to use the
+        default, see :function:`rpmkit.jsoncodec.dump`
+    :return: The path of the file dumped
     """
-    json.dump(data, copen(filepath, 'w'))
+    return rpmkit.jsoncodec.dump(data, filepath, compression)
 
 
-def select_from_list_g(xs, ref_xs=[]):
-    """
-    Filter out xs not in ref_xs and select only xs found in ref_xs one by one.
+_REGEX_CHARS_0 = ('^', '[', '$', '+', '?', '{')
+_REGEX_CHARS = _REGEX_CHARS_0 + ('*', )
+_REGEX_META_CHARS = ".^$*+?{}[]\\|()"
 
-    :param xs: The list of names, glob or regex patterns. It may contain
-        names or patterns actually not included in ``ref_xs`` list.
-    :param ref_xs: The list of all candidate xs.
+
+class PatternMatcher(object):
     """
-    # TODO: Find special characters in regular expressions
-    regex_cs_0 = ['^', '[', '$', '+', '?', '{']
-    regex_cs = regex_cs_0 + ['*']
+    Matcher of names, glob and regex patterns compiled once to select items
+    from lists.
 
-    is_globp = lambda s: '*' in s and not any(c in s for c in regex_cs_0)
-    is_regexp = lambda s: any(c in s for c in regex_cs)
+    - Names and prefix globs like 'abc*' are looked up in the index of the
+      list, a set and a sorted list of its items.
+    - Other patterns are tried by a regex combined from all of them at once
+      to find candidates, and only candidates are tried by each pattern.
 
-    for r in xs:
-        if r in ref_xs:
-            yield r
+    >>> pm = PatternMatcher(["abc", "ab*", "[b-c].+", "x(y"])
+    >>> list(pm.select_g(["abc", "abcd", "bcd", "cde", "def"]))
+    ['abc', 'abc', 'abcd', 'bcd', 'cde']
+    """
+
+    def __init__(self, xs):
+        """
+        :param xs: The list of names, glob or regex patterns.
+        """
+        self.patterns = []  # [(pattern, prefix or None, compiled regex)]
+        for r in xs:
+            if not any(c in r for c in _REGEX_CHARS):
+                self.patterns.append((r, None, None))
+                continue
 
-        elif is_regexp(r):
             logging.debug("Found a regex pattern: " + r)
-            try:
-                if is_globp(r):
-                    reg = re.compile(r.replace('*', ".*"))
-                else:
-                    reg = re.compile(r)
+            is_glob = '*' in r and not any(c in r for c in _REGEX_CHARS_0)
+            if is_glob and r.endswith('*') and \
+                    not any(c in r[:-1] for c in _REGEX_META_CHARS):
+                self.patterns.append((r, r[:-1], None))
+                continue
 
+            try:
+                reg = re.compile(r.replace('*', ".*") if is_glob else r)
             except Exception:  # NOTE: There's no special exc.
                 logging.warn("Not look a valid regex and maybe it's "
                              "just a string not found. Skipped: " + r)
-                continue
+                reg = False
+
+            self.patterns.append((r, None, reg))
+
+        self._combined = self._combine([p[2].pattern for p in self.patterns
+                                        if p[2]])
 
-            for x in ref_xs:
-                if reg.match(x):
-                    yield x
+    def _combine(self, regexes):
+        """
+        :return: A regex object matches items any of given regexes match, or
+            None if it's not available
+        """
+        # Back references and global flags cannot be combined.
+        if not regexes or \
+                any(re.search(r"\\\d|\(\?(P=|[aiLmsux])", r) for r in regexes):
+            return None
+
+        try:
+            return re.compile('|'.join("(?:%s)" % r for r in regexes))
+        except Exception:  # e.g. Too many groups in older pythons.
+            return None
+
+    def select_g(self, ref_xs):
+        """
+        Select items from ``ref_xs`` matched with patterns one by one.
+
+        :param ref_xs: The list of all candidate xs.
+        :return: A generator yields items of ``ref_xs`` matched, in the order
+            of patterns and then in the order of ``ref_xs``
+        """
+        ref_xs = list(ref_xs)
+        names = set(ref_xs)
+        index = None  # Sorted [(x, position in ref_xs)] for prefix globs.
+
+        if self._combined is None:
+            candidates = ref_xs
         else:
-            logging.warn("Not found: " + r)
+            candidates = [x for x in ref_xs if self._combined.match(x)]
+
+        for r, prefix, reg in self.patterns:
+            if r in names:
+                yield r
+
+            elif prefix is not None:
+                if index is None:
+                    index = sorted((x, i) for i, x in enumerate(ref_xs))
+
+                idx = bisect.bisect_left(index, (prefix, ))
+                poss = []
+                for x, i in itertools.islice(index, idx, None):
+                    if not x.startswith(prefix):
+                        break
+                    poss.append(i)
+
+                for i in sorted(poss):
+                    yield ref_xs[i]
+
+            elif reg:
+                for x in candidates:
+                    if reg.match(x):
+                        yield x
+
+            elif reg is None:
+                logging.warn("Not found: " + r)
+
+
+def select_from_list_g(xs, ref_xs=[]):
+    """
+    Filter out xs not in ref_xs and select only xs found in ref_xs one by one.
+
+    :param xs: The list of names, glob or regex patterns. It may contain
+        names or patterns actually not included in ``ref_xs`` list.
+    :param ref_xs: The list of all candidate xs.
+    """
+    return PatternMatcher(xs).select_g(ref_xs)
 
 
 def select_from_list(xs, ref_xs=[]):
@@ -508,29 +869,141 @@ def run_cmd_async(cmd, workdir=os.curdir):
     return call_async(run_cmd, args=(cmd, workdir))
 
 
-NPROCS = multiprocessing.cpu_count() * 2
+NPROCS = multiprocessing.cpu_count()
+
+
+def _chunksize(iterable, nworkers, factor=4):
+    """
+    Compute chunksize similar to multiprocessing.Pool.map does.
+
+    >>> _chunksize(range(100), 4)
+    7
+    >>> _chunksize(iter(range(100)), 4)
+    1
+    """
+    if not hasattr(iterable, "__len__"):
+        return 1  # Unknown length and it may be an infinite iterator.
+
+    (chunksize, extra) = divmod(len(iterable), nworkers * factor)
+    return chunksize + 1 if extra else max(chunksize, 1)
+
 
+class Executor(object):
+    """
+    Reusable pool of worker processes or threads to run functions in
+    parallel. Workers are created on demand and kept until it's closed, so
+    that callers can avoid to pay the cost of starting workers on every call.
+
+    >>> with Executor(2, threads=True) as executor:
+    ...     sorted(executor.imap_unordered(abs, [-1, -2, 3]))
+    [1, 2, 3]
+    """
+
+    def __init__(self, nworkers=None, threads=False, initializer=None,
+                 initargs=(), chunksize=None):
+        """
+        :param nworkers: Number of workers, number of CPUs by default
+        :param threads: Use threads instead of processes if True
+        :param initializer: Callable to run in each worker on its start to
+            do expensive setup for each worker only once
+        :param initargs: Arguments passed to `initializer`
+        :param chunksize: Default number of tasks sent to workers at once.
+            It's computed from number of tasks and workers if None.
+        """
+        self.nworkers = NPROCS if nworkers is None else nworkers
+        self.threads = threads
+        self.initializer = initializer
+        self.initargs = initargs
+        self.chunksize = chunksize
+        self._pool = None
+
+    def __enter__(self):
+        return self
 
-def pcall(func, datasets, n=NPROCS):
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            if self.threads:
+                pcls = multiprocessing.pool.ThreadPool
+            else:
+                pcls = multiprocessing.Pool
+
+            self._pool = pcls(self.nworkers, self.initializer, self.initargs)
+
+        return self._pool
+
+    def _chunksize(self, iterable, chunksize=None):
+        if chunksize is None:
+            chunksize = self.chunksize
+
+        if chunksize is None:
+            return _chunksize(iterable, self.nworkers)
+
+        return chunksize
+
+    def map(self, func, iterable, chunksize=None):
+        """
+        :return: A list of results in order
+        """
+        return self.pool.map(func, iterable,
+                             self._chunksize(iterable, chunksize))
+
+    def imap(self, func, iterable, chunksize=None):
+        """
+        :return: An iterator yields results in order as these are ready
+        """
+        return self.pool.imap(func, iterable,
+                              self._chunksize(iterable, chunksize))
+
+    def imap_unordered(self, func, iterable, chunksize=None):
+        """
+        :return: An iterator yields results as soon as these are ready
+        """
+        return self.pool.imap_unordered(func, iterable,
+                                        self._chunksize(iterable, chunksize))
+
+    def close(self):
+        """
+        Wait for workers to finish tasks and stop them.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        """
+        Stop workers immediately.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def pcall(func, datasets, n=NPROCS, chunksize=None, executor=None):
     """
     Run specified function in parallel.
 
     :param func: Any callable object
     :param datasets: [data_passed_to_func]
     :param n: Number of process run in parallel :: int
+    :param chunksize: Number of datasets sent to workers at once
+    :param executor: Executor object to reuse, or a new one is created and
+        closed in this function if None
     """
     assert callable(func)
 
+    if executor is not None:
+        return executor.map(func, datasets, chunksize)
+
     if n == 1:
         return [func(ds) for ds in datasets]
 
-    pool = multiprocessing.Pool(processes=n)
-    results = pool.map(func, datasets)
-
-    # Are these needed ?
-    pool.close()
-    pool.join()
-
-    return results
+    with Executor(n, chunksize=chunksize) as executor:
+        return executor.map(func, datasets)
 
 # vim:sw=4:ts=4:et: